@@ -1 +1,2 @@
 from .ball_acquisition_detector import BallAcquisitionDetector
+from .streaming_ball_acquisition_detector import StreamingBallAcquisitionDetector
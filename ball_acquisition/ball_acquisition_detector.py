@@ -1,4 +1,5 @@
-from utils import measure_distance, get_center_of_bbox
+from utils import measure_distance
+import numpy as np
 import sys
 sys.path.append("../")
 
@@ -65,86 +66,209 @@ class BallAcquisitionDetector():
 
         return intersection_area / ball_area
 
+    def calculate_ball_containment_ratios(self, player_bboxes, ball_bboxes):
+        """
+        Vectorized calculate_ball_containment_ratio.
+
+        Args:
+            player_bboxes (numpy.ndarray): (..., 4) player bboxes
+            ball_bboxes (numpy.ndarray): (..., 4) ball bboxes, broadcastable with player_bboxes
+
+        Returns:
+            numpy.ndarray: (...) containment ratio of the ball in each player bbox
+        """
+        px1, py1, px2, py2 = np.moveaxis(player_bboxes, -1, 0)
+        bx1, by1, bx2, by2 = np.moveaxis(ball_bboxes, -1, 0)
+
+        intersection_x1 = np.maximum(px1, bx1)
+        intersection_y1 = np.maximum(py1, by1)
+        intersection_x2 = np.minimum(px2, bx2)
+        intersection_y2 = np.minimum(py2, by2)
+
+        intersection_area = (intersection_x2 - intersection_x1) * (intersection_y2 - intersection_y1)
+        ball_area = (bx2 - bx1) * (by2 - by1)
+
+        no_intersection = (intersection_x2 < intersection_x1) | (intersection_y2 < intersection_y1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(no_intersection, 0.0, intersection_area / ball_area)
+
+    def find_minimum_distances_to_ball(self, ball_centers, player_bboxes):
+        """
+        Vectorized find_minimum_distance_to_ball, uses the same key points as
+        get_key_baksetball_player_assignment_points.
+
+        Args:
+            ball_centers (numpy.ndarray): (..., 2) ball centers, broadcastable with player_bboxes
+            player_bboxes (numpy.ndarray): (..., 4) player bboxes
+
+        Returns:
+            numpy.ndarray: (...) minimum distance between the ball and the key points of each player
+        """
+        ball_center_x = ball_centers[..., 0]
+        ball_center_y = ball_centers[..., 1]
+        x1, y1, x2, y2 = np.moveaxis(player_bboxes, -1, 0)
+        center_x = x1 + np.floor_divide(x2 - x1, 2)
+        center_y = y1 + np.floor_divide(y2 - y1, 2)
+        third_y = y1 + np.floor_divide(y2 - y1, 3)
+
+        # (x, y) of the 10 fixed key points
+        key_points_x = [center_x, x2, x1, x2, x1, center_x, x2, x1, center_x, center_x]
+        key_points_y = [y1, y1, y1, center_y, center_y, center_y, y2, y2, y2, third_y]
+        squared_distances = [(ball_center_x - x) ** 2 + (ball_center_y - y) ** 2
+                             for x, y in zip(key_points_x, key_points_y)]
+
+        # the points on the sides at the height of the ball, when the ball is between the top and the bottom
+        inside_y = (ball_center_y > y1) & (ball_center_y < y2)
+        squared_distances.append(np.where(inside_y, (ball_center_x - x1) ** 2, np.inf))
+        squared_distances.append(np.where(inside_y, (ball_center_x - x2) ** 2, np.inf))
+
+        # the points on the top and the bottom in front of the ball, when the ball is between the sides
+        inside_x = (ball_center_x > x1) & (ball_center_x < x2)
+        squared_distances.append(np.where(inside_x, (ball_center_y - y1) ** 2, np.inf))
+        squared_distances.append(np.where(inside_x, (ball_center_y - y2) ** 2, np.inf))
+
+        return np.sqrt(np.min(squared_distances, axis=0))
+
+    def find_best_candidates(self, ball_bboxes, player_ids, player_bboxes, player_mask):
+        """
+        Find the player that has the ball on several frames at once, on padded arrays.
+
+        Args:
+            ball_bboxes (numpy.ndarray): (frames, 4) ball bbox of each frame
+            player_ids (numpy.ndarray): (frames, players) track id of each player
+            player_bboxes (numpy.ndarray): (frames, players, 4) bbox of each player
+            player_mask (numpy.ndarray): (frames, players) False for the padding
+
+        Returns:
+            numpy.ndarray: (frames,) track id of the best candidate of each frame, -1 if none
+        """
+        num_frames = len(ball_bboxes)
+        if player_ids.shape[1] == 0:
+            return np.full(num_frames, -1)
+
+        # same integer center as get_center_of_bbox
+        ball_centers = np.trunc((ball_bboxes[:, :2] + ball_bboxes[:, 2:]) / 2)
+
+        containment = self.calculate_ball_containment_ratios(player_bboxes, ball_bboxes[:, None, :])
+        min_distance = self.find_minimum_distances_to_ball(ball_centers[:, None, :], player_bboxes)
+
+        # First priority: high containment player (the first one wins ties, like max())
+        high_containment = player_mask & (containment > self.containment_threshold)
+        has_high_containment = high_containment.any(axis=1)
+        best_containment_idx = np.argmax(np.where(high_containment, containment, -np.inf), axis=1)
+
+        # Second priority: regular distance player (the first one wins ties, like min())
+        min_distance = np.where(player_mask, min_distance, np.inf)
+        best_distance_idx = np.argmin(min_distance, axis=1)
+        frames = np.arange(num_frames)
+        is_close_enough = min_distance[frames, best_distance_idx] < self.possession_threshold
+
+        return np.where(has_high_containment,
+                        player_ids[frames, best_containment_idx],
+                        np.where(is_close_enough, player_ids[frames, best_distance_idx], -1))
+
     def find_best_candidate_for_possession(self, ball_center, player_tracks_frame, ball_bbox):
-        high_containment_players = []
-        regular_distance_players = []
+        player_ids, player_bboxes, player_mask = self.get_padded_player_arrays([player_tracks_frame])
+        best_player_id = self.find_best_candidates(
+            np.array([ball_bbox], dtype=np.float64), player_ids, player_bboxes, player_mask)[0]
+        return int(best_player_id)
 
-        for player_id, player_info in player_tracks_frame.items():
-            player_bbox = player_info.get("bbox", [])
-            if not player_bbox:
-                continue
+    def get_padded_player_arrays(self, player_tracks):
+        """
+        Pad the players of every frame to the same number of players.
 
-            containment = self.calculate_ball_containment_ratio(
-                player_bbox, ball_bbox)
-            min_distance = self.find_minimum_distance_to_ball(
-                ball_center, player_bbox)
+        Returns:
+            tuple: (player_ids (frames, players), player_bboxes (frames, players, 4),
+                player_mask (frames, players)); the players keep their order in each frame
+        """
+        num_frames = len(player_tracks)
 
-            if containment > self.containment_threshold:
-                high_containment_players.append((player_id, containment))
-            else:
-                regular_distance_players.append((player_id, min_distance))
+        if hasattr(player_tracks, "frame_offsets"):
+            # TrackStore: scatter the columns directly, no python loop over the detections
+            frame_offsets = player_tracks.frame_offsets
+            frame_indices = player_tracks.frame_indices
+            positions = np.arange(len(frame_indices)) - frame_offsets[frame_indices]
+            max_players = int(np.diff(frame_offsets).max()) if num_frames > 0 else 0
 
-        # First priority: high containment player
-        if high_containment_players:
-            best_candidate = max(high_containment_players, key=lambda x: x[1])
-            return best_candidate[0]  # Return only player_id
+            player_ids = np.full((num_frames, max_players), -1, dtype=np.int64)
+            player_bboxes = np.zeros((num_frames, max_players, 4), dtype=np.float64)
+            player_mask = np.zeros((num_frames, max_players), dtype=bool)
+            player_ids[frame_indices, positions] = player_tracks.track_ids
+            player_bboxes[frame_indices, positions] = player_tracks.bboxes
+            player_mask[frame_indices, positions] = True
+            return player_ids, player_bboxes, player_mask
 
-        # Second priority: regular distance player
-        if regular_distance_players:
-            best_candidate = min(regular_distance_players, key=lambda x: x[1])
-            if best_candidate[1] < self.possession_threshold:
-                return best_candidate[0]  # Return only player_id
+        max_players = max((len(player_track) for player_track in player_tracks), default=0)
+        player_ids = np.full((num_frames, max_players), -1, dtype=np.int64)
+        player_bboxes = np.zeros((num_frames, max_players, 4), dtype=np.float64)
+        player_mask = np.zeros((num_frames, max_players), dtype=bool)
+        for frame_num, player_track in enumerate(player_tracks):
+            position = 0
+            for player_id, player_info in player_track.items():
+                player_bbox = player_info.get("bbox", [])
+                if not player_bbox:
+                    continue
+                player_ids[frame_num, position] = player_id
+                player_bboxes[frame_num, position] = player_bbox
+                player_mask[frame_num, position] = True
+                position += 1
 
-        return -1
+        return player_ids, player_bboxes, player_mask
 
-    def detect_ball_possession(self, player_tracks, ball_tracks):
-        num_frames = len(ball_tracks)
-        possession_list = [-1] * num_frames
-        consecutive_possession_count = {}  # Dictionary: {player_id: consecutive_frames}
-
-        for frame_num in range(num_frames):
-            ball_info = ball_tracks[frame_num].get(
-                1, {})  # return an empty dict if no ball
-            if not ball_info:
-                consecutive_possession_count = {}  # Reset when no ball detected
-                continue
+    def get_ball_arrays(self, ball_tracks):
+        """
+        Returns:
+            tuple: (ball_bboxes (frames, 4), has_ball (frames,))
+        """
+        if hasattr(ball_tracks, "frame_offsets"):
+            ball_bboxes = np.zeros((len(ball_tracks), 4), dtype=np.float64)
+            has_ball = np.zeros(len(ball_tracks), dtype=bool)
+            is_ball = ball_tracks.track_ids == 1
+            ball_bboxes[ball_tracks.frame_indices[is_ball]] = ball_tracks.bboxes[is_ball]
+            has_ball[ball_tracks.frame_indices[is_ball]] = True
+            return ball_bboxes, has_ball
 
-            ball_bbox = ball_info.get("bbox", [])
+        ball_bboxes = np.zeros((len(ball_tracks), 4), dtype=np.float64)
+        has_ball = np.zeros(len(ball_tracks), dtype=bool)
+        for frame_num, ball_track in enumerate(ball_tracks):
+            ball_bbox = ball_track.get(1, {}).get("bbox", [])
             if not ball_bbox:
-                consecutive_possession_count = {}  # Reset when no ball bbox
                 continue
+            ball_bboxes[frame_num] = ball_bbox
+            has_ball[frame_num] = True
+
+        return ball_bboxes, has_ball
+
+    def detect_ball_possession(self, player_tracks, ball_tracks):
+        """
+        Find which player has the ball on each frame.
+
+        The best candidate of every frame is computed for all the frames at once on padded
+        arrays. A player gets the ball only once he is the best candidate for at least
+        min_frame frames in a row, and then for the whole run (the first frames of the run are
+        backfilled); frames without ball or candidate break the run.
+
+        Returns:
+            list: track id of the player that has the ball on each frame, -1 if nobody
+        """
+        num_frames = len(ball_tracks)
+        ball_bboxes, has_ball = self.get_ball_arrays(ball_tracks)
+        player_ids, player_bboxes, player_mask = self.get_padded_player_arrays(player_tracks)
+        player_ids = player_ids[:num_frames]
+        player_bboxes = player_bboxes[:num_frames]
+        player_mask = player_mask[:num_frames] & has_ball[:, None]
+
+        best_player_ids = self.find_best_candidates(ball_bboxes, player_ids, player_bboxes, player_mask)
+
+        # run-length encode the best candidates, keep the runs that are long enough
+        possession_list = np.full(num_frames, -1, dtype=np.int64)
+        if num_frames == 0:
+            return possession_list.tolist()
+        run_starts = np.flatnonzero(np.diff(best_player_ids, prepend=best_player_ids[0] - 1))
+        run_lengths = np.diff(np.append(run_starts, num_frames))
+        run_player_ids = best_player_ids[run_starts]
+        for run_start, run_length, player_id in zip(run_starts, run_lengths, run_player_ids):
+            if player_id != -1 and run_length >= self.min_frame:
+                possession_list[run_start:run_start + run_length] = player_id
 
-            ball_center = get_center_of_bbox(ball_bbox)
-
-            best_player_id = self.find_best_candidate_for_possession(
-                ball_center,
-                player_tracks[frame_num],
-                ball_bbox
-            )
-
-            if best_player_id != -1:
-                # Update consecutive count for this player
-                consecutive_possession_count[best_player_id] = consecutive_possession_count.get(
-                    best_player_id, 0) + 1
-
-                # Reset count for all other players
-                for player_id in list(consecutive_possession_count.keys()):
-                    if player_id != best_player_id:
-                        consecutive_possession_count[player_id] = 0
-
-                # Check if this player has held the ball long enough
-                if consecutive_possession_count[best_player_id] >= self.min_frame:
-                    possession_list[frame_num] = best_player_id
-
-                    # Backfill previous frames for this possession period
-                    start_frame = max(
-                        0, frame_num - consecutive_possession_count[best_player_id] + 1)
-                    for i in range(start_frame, frame_num):
-                        # Only fill if not already assigned
-                        if possession_list[i] == -1:
-                            possession_list[i] = best_player_id
-            else:
-                # No candidate found, reset all counts
-                consecutive_possession_count = {}
-
-        return possession_list
+        return possession_list.tolist()
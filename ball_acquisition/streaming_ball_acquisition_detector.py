@@ -0,0 +1,133 @@
+from .ball_acquisition_detector import BallAcquisitionDetector
+
+
+class StreamingBallAcquisitionDetector():
+    """
+    Online version of BallAcquisitionDetector.detect_ball_possession, one frame at a time.
+
+    A player gets the ball once he is the best candidate for min_frame frames in a row, and
+    then for the whole run. So the label of a frame is final at the latest min_frame - 1 frames
+    later: when the run reaches min_frame frames (the frames of the run are the player's), or
+    when it breaks before (they are -1). Only the current run is kept (start, length and
+    player), the memory does not depend on the length of the video.
+
+    The labels are emitted in order as soon as they are final, with the events:
+        {"event": "possession_start", "player_id": 7, "frame_num": 120}
+        {"event": "possession_end", "player_id": 7, "frame_num": 161, "start_frame": 120}
+    frame_num of a possession_end is the last frame of the possession.
+    """
+
+    def __init__(self, detector=None):
+        self.detector = detector if detector is not None else BallAcquisitionDetector()
+        self.min_frame = self.detector.min_frame
+        self.reset()
+
+    def reset(self):
+        self.frame_count = 0        # frames processed
+        self.emitted_count = 0      # frames with a final label
+        self.run_player_id = -1
+        self.run_start = 0
+        self.run_length = 0
+
+    def find_best_candidate(self, player_tracks_frame, ball_track_frame):
+        ball_bboxes, has_ball = self.detector.get_ball_arrays([ball_track_frame])
+        player_ids, player_bboxes, player_mask = self.detector.get_padded_player_arrays([player_tracks_frame])
+        player_mask = player_mask & has_ball[:, None]
+        return int(self.detector.find_best_candidates(ball_bboxes, player_ids, player_bboxes, player_mask)[0])
+
+    def is_possession(self):
+        return self.run_player_id != -1 and self.run_length >= self.min_frame
+
+    def end_run(self, labels, events):
+        """
+        Finalize the frames of the current run that are still pending.
+        """
+        if self.is_possession():
+            events.append({"event": "possession_end", "player_id": self.run_player_id,
+                           "frame_num": self.run_start + self.run_length - 1, "start_frame": self.run_start})
+        else:
+            # too short, nobody had the ball
+            pending = self.run_start + self.run_length - self.emitted_count
+            labels.extend([-1] * pending)
+            self.emitted_count += pending
+
+    def update(self, player_tracks_frame, ball_track_frame):
+        """
+        Process the next frame.
+
+        Args:
+            player_tracks_frame (dict): {track_id: {"bbox": bbox}} of the frame
+            ball_track_frame (dict): {1: {"bbox": bbox}} of the frame, {} without ball
+
+        Returns:
+            tuple: (labels, events) labels that became final with this frame (they follow the
+                labels emitted before), events that happened
+        """
+        labels = []
+        events = []
+        player_id = self.find_best_candidate(player_tracks_frame, ball_track_frame)
+
+        if player_id != self.run_player_id or self.run_length == 0:
+            self.end_run(labels, events)
+            self.run_player_id = player_id
+            self.run_start = self.frame_count
+            self.run_length = 0
+        self.run_length += 1
+        self.frame_count += 1
+
+        if self.run_player_id == -1:
+            # a frame without candidate is final right away
+            labels.append(-1)
+            self.emitted_count += 1
+        elif self.is_possession():
+            if self.run_length == self.min_frame:
+                events.append({"event": "possession_start", "player_id": self.run_player_id,
+                               "frame_num": self.run_start})
+            # the pending frames of the run (all of them when the run just got long enough)
+            pending = self.frame_count - self.emitted_count
+            labels.extend([self.run_player_id] * pending)
+            self.emitted_count += pending
+
+        return labels, events
+
+    def process_frames(self, player_tracks, ball_tracks):
+        """
+        Process a chunk of frames.
+
+        Returns:
+            tuple: (labels, events) of the whole chunk, see update
+        """
+        labels = []
+        events = []
+        for player_tracks_frame, ball_track_frame in zip(player_tracks, ball_tracks):
+            frame_labels, frame_events = self.update(player_tracks_frame, ball_track_frame)
+            labels.extend(frame_labels)
+            events.extend(frame_events)
+        return labels, events
+
+    def finish(self):
+        """
+        End of the video: finalize the pending frames and end the current possession.
+
+        Returns:
+            tuple: (labels, events)
+        """
+        labels = []
+        events = []
+        self.end_run(labels, events)
+        self.run_player_id = -1
+        self.run_start = self.frame_count
+        self.run_length = 0
+        return labels, events
+
+    def detect_ball_possession(self, player_tracks, ball_tracks):
+        """
+        Same output as BallAcquisitionDetector.detect_ball_possession, computed online.
+
+        Returns:
+            tuple: (possession_list, events)
+        """
+        self.reset()
+        labels, events = self.process_frames(player_tracks, ball_tracks)
+        final_labels, final_events = self.finish()
+        return labels + final_labels, events + final_events
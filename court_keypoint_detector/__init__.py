@@ -1 +1,2 @@
 from .court_keypoint_detector import CourtKeypointDetector
+from .camera_motion_estimator import CameraMotionEstimator
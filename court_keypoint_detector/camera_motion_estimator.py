@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+
+
+class CameraMotionEstimator():
+    """
+    Cheap global camera motion (translation) between two frames, with phase correlation on
+    downscaled grayscale frames.
+    """
+
+    def __init__(self, downscale_width=320):
+        self.downscale_width = downscale_width
+        self.window = None
+
+    def prepare_frame(self, frame):
+        """
+        Returns:
+            tuple: (downscaled grayscale float32 frame, scale back to the original size)
+        """
+        height, width = frame.shape[:2]
+        scale = width / self.downscale_width
+        small_size = (self.downscale_width, max(int(round(height / scale)), 1))
+        gray = cv2.cvtColor(cv2.resize(frame, small_size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        return gray.astype(np.float32), scale
+
+    def estimate(self, previous_frame, current_frame):
+        """
+        Estimate how much the content moved from previous_frame to current_frame.
+
+        Args:
+            previous_frame (tuple): output of prepare_frame
+            current_frame (tuple): output of prepare_frame
+
+        Returns:
+            tuple: (dx, dy, response) shift in pixels of the original frames and the peak
+                response of the correlation (close to 0 when the motion is not a translation)
+        """
+        previous_gray, scale = previous_frame
+        current_gray, _ = current_frame
+        if self.window is None or self.window.shape != current_gray.shape:
+            # hanning window against the edge effects of the FFT
+            self.window = cv2.createHanningWindow(current_gray.shape[::-1], cv2.CV_32F)
+        (dx, dy), response = cv2.phaseCorrelate(previous_gray, current_gray, self.window)
+        return dx * scale, dy * scale, response
@@ -1,32 +1,215 @@
-from ultralytics import YOLO
-from utils import read_stub, save_stub
+from utils import read_stub, save_stub, iterate_batches
+from .camera_motion_estimator import CameraMotionEstimator
+import numpy as np
 import sys
 sys.path.append("../")
 
 
 class CourtKeypointDetector():
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
-    
-    def key_court_keypoints(self, frame, read_from_stub=False, stub_path=None):
-        
-        court_keypoints_detection = read_stub(read_from_stub, stub_path)
-        if court_keypoints_detection is not None:
-            if len(court_keypoints_detection) == len(frame):
-                return court_keypoints_detection
+    def __init__(self, model_path, batch_size=20, use_motion_gate=True):
+        self.model_path = model_path
+        self._model = None
+        self.batch_size = batch_size
+        self.conf = 0.5
+        # keypoints of the court model, a frame without detection gets (0, 0) for all of them
+        self.num_keypoints = 18
+
+        # the keypoints are detected again only when the camera moved, in between the keypoints
+        # of the last detection are shifted by the estimated camera motion
+        self.use_motion_gate = use_motion_gate
+        self.motion_threshold = 20.0    # pixels of camera motion since the last detection
+        self.max_skip_frames = 15       # bounds the drift from zoom / rotation that the shift misses
+        self.min_motion_response = 0.1  # under it the motion is not a translation, detect again
+        self.motion_estimator = CameraMotionEstimator()
+        self.reset_motion_gate()
+
+    @property
+    def model(self):
+        # ultralytics and the weights are only loaded when a frame has to be processed,
+        # so a run that only hits the cache does not pay for them
+        if self._model is None:
+            from ultralytics import YOLO
+            self._model = YOLO(self.model_path)
+        return self._model
+
+    def reset_motion_gate(self):
+        # state of the gate, kept between calls so a video can be processed batch by batch
+        self.previous_frame = None
+        self.keyframe_keypoints = None
+        self.has_keyframe = False
+        self.motion_since_keyframe = np.zeros(2)
+        self.frames_since_keyframe = 0
+
+        self.detected_frames = 0
+        self.skipped_frames = 0
+
+    @property
+    def skip_fraction(self):
+        total = self.detected_frames + self.skipped_frames
+        if total == 0:
+            return 0.0
+        return self.skipped_frames / total
+
+    def get_keypoints_xy(self, keypoints):
+        """
+        Returns:
+            numpy.ndarray: (num_keypoints, 2) float32 keypoints of the first detection of an
+                ultralytics Keypoints, (0, 0) for the missing ones
+        """
+        xy = keypoints.xy
+        if hasattr(xy, "cpu"):
+            xy = xy.cpu().numpy()
+        keypoints_xy = np.zeros((self.num_keypoints, 2), dtype=np.float32)
+        if len(xy) > 0:
+            keypoints_xy[:] = xy[0]
+        return keypoints_xy
 
-        batch_size = 20
+    def stack_keypoints(self, keypoints_list):
+        """
+        Returns:
+            numpy.ndarray: (frames, num_keypoints, 2) float32 array of the keypoints of every frame
+        """
+        keypoints_xy = np.zeros((len(keypoints_list), self.num_keypoints, 2), dtype=np.float32)
+        for frame_idx, keypoints in enumerate(keypoints_list):
+            if not isinstance(keypoints, np.ndarray):
+                keypoints = self.get_keypoints_xy(keypoints)
+            keypoints_xy[frame_idx] = keypoints
+        return keypoints_xy
+
+    def detect_all_frames(self, frame):
+        # only the keypoint coordinates are kept: plain arrays, so the cached results can be
+        # loaded without torch and ultralytics
         court_keypoints_detection = []
-        for i in range(0, len(frame), batch_size):
-            batch_frame = frame[i:i+batch_size]
-            detection_batch = self.model.predict(batch_frame, conf=0.5)
+        for batch_frame in iterate_batches(frame, self.batch_size):
+            detection_batch = self.model.predict(batch_frame, conf=self.conf)
             for detection in detection_batch:
-                court_keypoints_detection.append(detection.keypoints)
-        
-        save_stub(stub_path, court_keypoints_detection)
+                court_keypoints_detection.append(self.get_keypoints_xy(detection.keypoints))
+
+        return court_keypoints_detection
+
+    def needs_detection(self, frame):
+        """
+        Update the camera motion with a new frame and decide whether its keypoints have to be
+        detected. Must be called once per frame, in order.
+        """
+        current_frame = self.motion_estimator.prepare_frame(frame)
+        previous_frame = self.previous_frame
+        self.previous_frame = current_frame
+        if not self.has_keyframe or previous_frame is None:
+            return True
+
+        dx, dy, response = self.motion_estimator.estimate(previous_frame, current_frame)
+        if response < self.min_motion_response:
+            return True
+
+        self.motion_since_keyframe += (dx, dy)
+        self.frames_since_keyframe += 1
+        return (np.hypot(*self.motion_since_keyframe) > self.motion_threshold or
+                self.frames_since_keyframe > self.max_skip_frames)
+
+    def shift_keypoints(self, keypoints, dx, dy):
+        """
+        Copy of the (num_keypoints, 2) keypoints moved by (dx, dy), the missing keypoints
+        ((0, 0)) stay missing.
+        """
+        if dx == 0 and dy == 0:
+            return keypoints
+        keypoints = keypoints.copy()
+        detected = (keypoints[:, 0] > 0) & (keypoints[:, 1] > 0)
+        keypoints[detected] += np.array([dx, dy], dtype=np.float32)
+        return keypoints
+
+    def detect_frames(self, frame):
+        if not self.use_motion_gate:
+            return self.detect_all_frames(frame)
+
+        # decide first which frames need the model, then run it on them in batches
+        key_frames = []
+        # for every frame: (index of its keyframe in key_frames, -1 for a keyframe of a
+        # previous call; shift since that keyframe)
+        frame_plan = []
+        keyframe_index = -1
+        for current_frame in frame:
+            if self.needs_detection(current_frame):
+                key_frames.append(current_frame)
+                keyframe_index = len(key_frames) - 1
+                self.has_keyframe = True
+                self.motion_since_keyframe = np.zeros(2)
+                self.frames_since_keyframe = 0
+                self.detected_frames += 1
+            else:
+                self.skipped_frames += 1
+            frame_plan.append((keyframe_index, tuple(self.motion_since_keyframe)))
+
+        keyframe_detection = self.detect_all_frames(key_frames)
+
+        court_keypoints_detection = []
+        for keyframe_index, (dx, dy) in frame_plan:
+            keypoints = keyframe_detection[keyframe_index] if keyframe_index >= 0 else self.keyframe_keypoints
+            court_keypoints_detection.append(self.shift_keypoints(keypoints, dx, dy))
+
+        if keyframe_detection:
+            self.keyframe_keypoints = keyframe_detection[-1]
         return court_keypoints_detection
 
-            
-            
+    def evaluate_motion_gate(self, frame):
+        """
+        Compare the gated detection with the detection on every frame.
+
+        Returns:
+            dict: skip_fraction, and mean_drift / max_drift in pixels between the gated
+                keypoints and the detected ones (keypoints present in both)
+        """
+        frame = list(frame)
+        use_motion_gate = self.use_motion_gate
+
+        self.use_motion_gate = False
+        full_detection = self.detect_frames(frame)
+        self.use_motion_gate = True
+        self.reset_motion_gate()
+        gated_detection = self.detect_frames(frame)
+        self.use_motion_gate = use_motion_gate
+
+        drifts = []
+        for full_xy, gated_xy in zip(full_detection, gated_detection):
+            in_both = (full_xy > 0).all(axis=1) & (gated_xy > 0).all(axis=1)
+            drifts.extend(np.linalg.norm(full_xy[in_both] - gated_xy[in_both], axis=1))
+
+        return {
+            "skip_fraction": self.skip_fraction,
+            "mean_drift": float(np.mean(drifts)) if drifts else 0.0,
+            "max_drift": float(np.max(drifts)) if drifts else 0.0
+        }
+
+    def get_cache_key(self, cache, video_path):
+        params = {"conf": self.conf, "batch_size": self.batch_size}
+        if self.use_motion_gate:
+            params.update({"motion_threshold": self.motion_threshold,
+                           "max_skip_frames": self.max_skip_frames,
+                           "min_motion_response": self.min_motion_response,
+                           "downscale_width": self.motion_estimator.downscale_width})
+        # the keypoints are cached as a (frames, num_keypoints, 2) array
+        return cache.make_key("court_keypoints_xy", video_path, self.model_path, params)
 
+    def key_court_keypoints(self, frame, read_from_stub=False, stub_path=None, cache=None, video_path=None):
 
+        court_keypoints_detection = read_stub(read_from_stub, stub_path)
+        if court_keypoints_detection is not None:
+            if len(court_keypoints_detection) == len(frame):
+                # older stubs hold ultralytics Keypoints
+                return self.stack_keypoints(court_keypoints_detection)
+
+        # the cache is keyed by the content of the video, so it is safe to reuse
+        if cache is not None and video_path is not None:
+            cache_key = self.get_cache_key(cache, video_path)
+            court_keypoints_detection = cache.get(cache_key)
+            if court_keypoints_detection is not None:
+                return court_keypoints_detection
+
+        self.reset_motion_gate()
+        court_keypoints_detection = self.stack_keypoints(self.detect_frames(frame))
+
+        save_stub(stub_path, court_keypoints_detection)
+        if cache is not None and video_path is not None:
+            cache.put(cache_key, court_keypoints_detection)
+        return court_keypoints_detection
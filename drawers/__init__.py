@@ -4,3 +4,4 @@ from .team_ball_control_drawer import TeamBallControlDrawer
 from .pass_and_interception_drawer import PassInterceptionTableDrawer
 from .court_keypoints_drawer import CourtKeypointsDrawer
 from .tactical_view_drawer import TacticalViewDrawer
+from .frame_compositor import DrawerLayer, FrameCompositor
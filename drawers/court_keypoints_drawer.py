@@ -1,11 +1,19 @@
-import supervision as sv
+import numpy as np
+
 
 class CourtKeypointsDrawer():
     def __init__(self):
         self.keypoint_color = "00FF88"  # Bright green color
         self.outline_color = "FFFFFF"   # White outline
-    
-    def draw(self, video_frame, court_keypoints_detection):        
+        self.annotators = None
+
+    def get_annotators(self):
+        # the annotators are created once and reused for every frame
+        if self.annotators is not None:
+            return self.annotators
+
+        import supervision as sv
+
         # use to draw keypoint outlines (larger radius)
         vertex_outline_annotator = sv.VertexAnnotator(
             color = sv.Color.from_hex(self.outline_color),
@@ -27,19 +35,39 @@ class CourtKeypointsDrawer():
             text_padding=8,
             border_radius=20
         )
+
+        self.annotators = (vertex_outline_annotator, vertex_annotator, vertex_label_annotator)
+        return self.annotators
+
+    def draw_frame(self, frame, frame_num, court_keypoints_detection):
+        """
+        Args:
+            court_keypoints_detection (numpy.ndarray): (frames, 18, 2) keypoints, (0, 0) for the
+                missing ones
+        """
+        import supervision as sv
+
+        vertex_outline_annotator, vertex_annotator, vertex_label_annotator = self.get_annotators()
+
+        keypoints = np.asarray(court_keypoints_detection[frame_num], dtype=np.float32)
+        # nothing detected on the frame
+        if not (keypoints > 0).any():
+            return frame
+        keypoints_np = sv.KeyPoints(xy=keypoints[None])
         
+        # Draw outline first (larger, white)
+        frame = vertex_outline_annotator.annotate(scene=frame, key_points=keypoints_np)
+        # Draw main keypoints on top (smaller, colored)
+        frame = vertex_annotator.annotate(scene=frame, key_points=keypoints_np)
+        # Add labels with enhanced styling
+        frame = vertex_label_annotator.annotate(scene=frame, key_points=keypoints_np)
+        return frame
+    
+    def draw(self, video_frame, court_keypoints_detection):        
         output_video_frames = []
         for frame_num, frame in enumerate(video_frame):
             annotate_frame = frame.copy()
-            keypoints = court_keypoints_detection[frame_num]
-            keypoints_np = keypoints.cpu().numpy()
-            
-            # Draw outline first (larger, white)
-            annotate_frame = vertex_outline_annotator.annotate(scene=annotate_frame, key_points=keypoints_np)
-            # Draw main keypoints on top (smaller, colored)
-            annotate_frame = vertex_annotator.annotate(scene=annotate_frame, key_points=keypoints_np)
-            # Add labels with enhanced styling
-            annotate_frame = vertex_label_annotator.annotate(scene=annotate_frame, key_points=keypoints_np)        
+            annotate_frame = self.draw_frame(annotate_frame, frame_num, court_keypoints_detection)
             output_video_frames.append(annotate_frame)
     
         return output_video_frames
@@ -0,0 +1,53 @@
+class DrawerLayer():
+    """
+    One layer of the FrameCompositor: a drawer and the data its draw_frame needs after
+    (frame, frame_num), e.g. DrawerLayer(BallTrackDrawer(), ball_tracks).
+    """
+
+    def __init__(self, drawer, *args, **kwargs):
+        self.drawer = drawer
+        self.args = args
+        self.kwargs = kwargs
+
+    def draw(self, frame, frame_num):
+        return self.drawer.draw_frame(frame, frame_num, *self.args, **self.kwargs)
+
+
+class FrameCompositor():
+    """
+    Render all the layers on each frame in a single pass.
+
+    The drawers used to be chained with their draw() methods, each one copying every frame and
+    building a new list of frames. Here every frame goes through all the layers in order on
+    the same buffer, the layers draw in place (draw_frame), so a frame is copied at most once
+    and only one frame is in flight when the frames come from a stream.
+    """
+
+    def __init__(self, layers=None, copy_frames=True):
+        self.layers = list(layers) if layers is not None else []
+        # False when the input frames are not needed anymore (e.g. frames decoded from a
+        # stream), the layers then draw directly on them and nothing is copied
+        self.copy_frames = copy_frames
+
+    def add_layer(self, layer):
+        self.layers.append(layer)
+        return self
+
+    def compose_frame(self, frame, frame_num):
+        output_frame = frame.copy() if self.copy_frames else frame
+        for layer in self.layers:
+            output_frame = layer.draw(output_frame, frame_num)
+        return output_frame
+
+    def compose(self, video_frames):
+        """
+        Lazily render an iterable of frames.
+
+        Args:
+            video_frames (iterable): Frames (as NumPy arrays), a list or a stream
+
+        Yields:
+            numpy.ndarray: The frames with all the layers drawn on them
+        """
+        for frame_num, frame in enumerate(video_frames):
+            yield self.compose_frame(frame, frame_num)
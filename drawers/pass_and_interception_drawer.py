@@ -1,5 +1,9 @@
+from utils import CumulativeStats
+from .util import TableSpriteCache
 import cv2
 import numpy as np
+import sys
+sys.path.append("../")
 
 class PassInterceptionTableDrawer:
     """
@@ -27,6 +31,9 @@ class PassInterceptionTableDrawer:
             'team2_color': (200, 100, 0),       # Orange for team 2
             'total_color': (50, 150, 50)        # Green for totals
         }
+        self.table_width = 400
+        self.table_height = 140
+        self.table_sprites = None
 
     def get_stats(self, passes, interceptions):
         """
@@ -43,23 +50,14 @@ class PassInterceptionTableDrawer:
                 team1_interception_total, team2_interception_total) indicating the total
                 number of passes and interceptions for both teams.
         """
-        team1_passes = []
-        team2_passes = []
-        team1_interceptions = []
-        team2_interceptions = []
+        pass_stats, interception_stats = self.get_cumulative_stats(passes, interceptions)
+        last_frame = min(len(passes), len(interceptions)) - 1
+        if last_frame < 0:
+            return 0, 0, 0, 0
 
-        for frame_num, (pass_frame, interception_frame) in enumerate(zip(passes, interceptions)):
-            if pass_frame == 1:
-                team1_passes.append(frame_num)
-            elif pass_frame == 2:
-                team2_passes.append(frame_num)
-                
-            if interception_frame == 1:
-                team1_interceptions.append(frame_num)
-            elif interception_frame == 2:
-                team2_interceptions.append(frame_num)
-                
-        return len(team1_passes), len(team2_passes), len(team1_interceptions), len(team2_interceptions)
+        team1_passes, team2_passes = pass_stats.counts(last_frame)
+        team1_interceptions, team2_interceptions = interception_stats.counts(last_frame)
+        return team1_passes, team2_passes, team1_interceptions, team2_interceptions
 
     def calculate_table_position(self, frame_width, frame_height, table_width, table_height):
         """
@@ -101,58 +99,49 @@ class PassInterceptionTableDrawer:
             
         return int(x), int(y)
 
-    def draw_table(self, frame, x, y, team1_passes, team2_passes, team1_interceptions, team2_interceptions):
+    def draw_table_background(self, image, x, y, colors):
         """
-        Draw a professional-looking table with pass and interception statistics.
-        
-        Args:
-            frame (numpy.ndarray): The video frame
-            x (int): X coordinate of table top-left corner
-            y (int): Y coordinate of table top-left corner
-            team1_passes (int): Number of passes by Team 1
-            team2_passes (int): Number of passes by Team 2
-            team1_interceptions (int): Number of interceptions by Team 1
-            team2_interceptions (int): Number of interceptions by Team 2
+        Draw the static part of the table (background, border, header, grid lines),
+        it is blended with the frame.
         """
         # Table dimensions
-        table_width = 400
-        table_height = 140
+        table_width = self.table_width
+        table_height = self.table_height
         row_height = 35
         
-        # Create overlay for transparency
-        overlay = frame.copy()
-        
         # Draw main table background
-        cv2.rectangle(overlay, (x, y), (x + table_width, y + table_height), 
-                     self.colors['background'], -1)
+        cv2.rectangle(image, (x, y), (x + table_width, y + table_height), 
+                     colors['background'], -1)
         
         # Draw table border
-        cv2.rectangle(overlay, (x, y), (x + table_width, y + table_height), 
-                     self.colors['border'], 2)
+        cv2.rectangle(image, (x, y), (x + table_width, y + table_height), 
+                     colors['border'], 2)
         
         # Draw header background
-        cv2.rectangle(overlay, (x, y), (x + table_width, y + row_height), 
-                     self.colors['header_bg'], -1)
+        cv2.rectangle(image, (x, y), (x + table_width, y + row_height), 
+                     colors['header_bg'], -1)
         
         # Draw horizontal lines
         for i in range(1, 5):  # 4 horizontal lines (header + 3 data rows)
-            cv2.line(overlay, (x, y + i * row_height), 
+            cv2.line(image, (x, y + i * row_height), 
                     (x + table_width, y + i * row_height), 
-                    self.colors['border'], 1)
+                    colors['border'], 1)
         
         # Draw vertical lines
         col_widths = [100, 100, 100, 100]  # Team, Passes, Interceptions, Total
         col_x = x
         for width in col_widths:
-            cv2.line(overlay, (col_x, y), (col_x, y + table_height), 
-                    self.colors['border'], 1)
+            cv2.line(image, (col_x, y), (col_x, y + table_height), 
+                    colors['border'], 1)
             col_x += width
-        cv2.line(overlay, (col_x, y), (col_x, y + table_height), 
-                self.colors['border'], 1)  # Right border
-        
-        # Apply transparency
-        cv2.addWeighted(overlay, self.transparency, frame, 1 - self.transparency, 0, frame)
-        
+        cv2.line(image, (col_x, y), (col_x, y + table_height), 
+                colors['border'], 1)  # Right border
+
+    def draw_table_labels(self, image, x, y, colors):
+        """
+        Draw the static text of the table (header and row names), it is drawn over the
+        blended background.
+        """
         # Font settings
         font = cv2.FONT_HERSHEY_SIMPLEX
         font_scale = 0.6
@@ -162,14 +151,33 @@ class PassInterceptionTableDrawer:
         
         # Draw header text
         header_y = y + 25
-        cv2.putText(frame, "Team", (x + 25, header_y), font, header_font_scale, 
-                   self.colors['header_text'], header_thickness)
-        cv2.putText(frame, "Passes", (x + 120, header_y), font, header_font_scale, 
-                   self.colors['header_text'], header_thickness)
-        cv2.putText(frame, "Intercepts", (x + 210, header_y), font, header_font_scale, 
-                   self.colors['header_text'], header_thickness)
-        cv2.putText(frame, "Total", (x + 330, header_y), font, header_font_scale, 
-                   self.colors['header_text'], header_thickness)
+        cv2.putText(image, "Team", (x + 25, header_y), font, header_font_scale, 
+                   colors['header_text'], header_thickness)
+        cv2.putText(image, "Passes", (x + 120, header_y), font, header_font_scale, 
+                   colors['header_text'], header_thickness)
+        cv2.putText(image, "Intercepts", (x + 210, header_y), font, header_font_scale, 
+                   colors['header_text'], header_thickness)
+        cv2.putText(image, "Total", (x + 330, header_y), font, header_font_scale, 
+                   colors['header_text'], header_thickness)
+        
+        cv2.putText(image, "Team 1", (x + 15, y + 60), font, font_scale, 
+                   colors['team1_color'], thickness + 1)
+        cv2.putText(image, "Team 2", (x + 15, y + 95), font, font_scale, 
+                   colors['team2_color'], thickness + 1)
+        cv2.putText(image, "Total", (x + 15, y + 130), font, font_scale, 
+                   colors['total_color'], thickness + 1)
+
+    def draw_table_values(self, image, x, y, values, colors):
+        """
+        Draw the counts (team1_passes, team2_passes, team1_interceptions, team2_interceptions)
+        and their totals, they are drawn over the blended background.
+        """
+        team1_passes, team2_passes, team1_interceptions, team2_interceptions = values
+        
+        # Font settings
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        font_scale = 0.6
+        thickness = 1
         
         # Calculate totals
         team1_total = team1_passes + team1_interceptions
@@ -180,65 +188,103 @@ class PassInterceptionTableDrawer:
         
         # Draw Team 1 data
         team1_y = y + 60
-        cv2.putText(frame, "Team 1", (x + 15, team1_y), font, font_scale, 
-                   self.colors['team1_color'], thickness + 1)
-        cv2.putText(frame, str(team1_passes), (x + 140, team1_y), font, font_scale, 
-                   self.colors['text'], thickness)
-        cv2.putText(frame, str(team1_interceptions), (x + 245, team1_y), font, font_scale, 
-                   self.colors['text'], thickness)
-        cv2.putText(frame, str(team1_total), (x + 345, team1_y), font, font_scale, 
-                   self.colors['total_color'], thickness + 1)
+        cv2.putText(image, str(team1_passes), (x + 140, team1_y), font, font_scale, 
+                   colors['text'], thickness)
+        cv2.putText(image, str(team1_interceptions), (x + 245, team1_y), font, font_scale, 
+                   colors['text'], thickness)
+        cv2.putText(image, str(team1_total), (x + 345, team1_y), font, font_scale, 
+                   colors['total_color'], thickness + 1)
         
         # Draw Team 2 data
         team2_y = y + 95
-        cv2.putText(frame, "Team 2", (x + 15, team2_y), font, font_scale, 
-                   self.colors['team2_color'], thickness + 1)
-        cv2.putText(frame, str(team2_passes), (x + 140, team2_y), font, font_scale, 
-                   self.colors['text'], thickness)
-        cv2.putText(frame, str(team2_interceptions), (x + 245, team2_y), font, font_scale, 
-                   self.colors['text'], thickness)
-        cv2.putText(frame, str(team2_total), (x + 345, team2_y), font, font_scale, 
-                   self.colors['total_color'], thickness + 1)
+        cv2.putText(image, str(team2_passes), (x + 140, team2_y), font, font_scale, 
+                   colors['text'], thickness)
+        cv2.putText(image, str(team2_interceptions), (x + 245, team2_y), font, font_scale, 
+                   colors['text'], thickness)
+        cv2.putText(image, str(team2_total), (x + 345, team2_y), font, font_scale, 
+                   colors['total_color'], thickness + 1)
         
         # Draw totals row
         total_y = y + 130
-        cv2.putText(frame, "Total", (x + 15, total_y), font, font_scale, 
-                   self.colors['total_color'], thickness + 1)
-        cv2.putText(frame, str(total_passes), (x + 140, total_y), font, font_scale, 
-                   self.colors['total_color'], thickness + 1)
-        cv2.putText(frame, str(total_interceptions), (x + 245, total_y), font, font_scale, 
-                   self.colors['total_color'], thickness + 1)
-        cv2.putText(frame, str(grand_total), (x + 345, total_y), font, font_scale, 
-                   self.colors['total_color'], thickness + 1)
+        cv2.putText(image, str(total_passes), (x + 140, total_y), font, font_scale, 
+                   colors['total_color'], thickness + 1)
+        cv2.putText(image, str(total_interceptions), (x + 245, total_y), font, font_scale, 
+                   colors['total_color'], thickness + 1)
+        cv2.putText(image, str(grand_total), (x + 345, total_y), font, font_scale, 
+                   colors['total_color'], thickness + 1)
+
+    def get_table_sprites(self):
+        # created on first use so a transparency changed after __init__ is taken into account
+        if self.table_sprites is None:
+            self.table_sprites = TableSpriteCache(self.table_width, self.table_height, self.colors,
+                                                  self.transparency, self.draw_table_background,
+                                                  self.draw_table_labels, self.draw_table_values)
+        return self.table_sprites
+
+    def draw_table(self, frame, x, y, team1_passes, team2_passes, team1_interceptions, team2_interceptions):
+        """
+        Draw a professional-looking table with pass and interception statistics.
+        
+        Only the table region is blended, with a sprite pre-rendered for the displayed values.
+        
+        Args:
+            frame (numpy.ndarray): The video frame
+            x (int): X coordinate of table top-left corner
+            y (int): Y coordinate of table top-left corner
+            team1_passes (int): Number of passes by Team 1
+            team2_passes (int): Number of passes by Team 2
+            team1_interceptions (int): Number of interceptions by Team 1
+            team2_interceptions (int): Number of interceptions by Team 2
+        """
+        values = (int(team1_passes), int(team2_passes), int(team1_interceptions), int(team2_interceptions))
+        self.get_table_sprites().draw(frame, x, y, values)
 
-    def draw_frame(self, frame, frame_num, passes, interceptions):
+    def get_cumulative_stats(self, passes, interceptions):
+        """
+        Precompute the pass and interception counts of both teams for the whole video.
+
+        Args:
+            passes (list): A list of integers representing pass events at each frame
+            interceptions (list): A list of integers representing interception events at each frame
+
+        Returns:
+            tuple: (pass_stats, interception_stats), CumulativeStats of Team 1 and Team 2 events
+        """
+        return CumulativeStats(passes, labels=(1, 2)), CumulativeStats(interceptions, labels=(1, 2))
+
+    def draw_frame(self, frame, frame_num, pass_stats, interception_stats):
         """
         Draw a table showing pass and interception statistics on a single frame.
 
         Args:
             frame (numpy.ndarray): The current video frame
             frame_num (int): The index of the current frame
-            passes (list): A list of pass events up to this frame
-            interceptions (list): A list of interception events up to this frame
+            pass_stats (CumulativeStats): Pass stats from get_cumulative_stats, a raw list of
+                pass events is also accepted but is accumulated on every call
+            interception_stats (CumulativeStats): Interception stats from get_cumulative_stats,
+                or a raw list of interception events
 
         Returns:
             numpy.ndarray: The frame with the statistics table
         """
+        # the first frame is left untouched
+        if frame_num == 0:
+            return frame
+
+        if not isinstance(pass_stats, CumulativeStats):
+            pass_stats = CumulativeStats(pass_stats, labels=(1, 2))
+        if not isinstance(interception_stats, CumulativeStats):
+            interception_stats = CumulativeStats(interception_stats, labels=(1, 2))
+
         frame_height, frame_width = frame.shape[:2]
         
         # Get stats until current frame
-        passes_till_frame = passes[:frame_num + 1]
-        interceptions_till_frame = interceptions[:frame_num + 1]
-        
-        team1_passes, team2_passes, team1_interceptions, team2_interceptions = self.get_stats(
-            passes_till_frame, 
-            interceptions_till_frame
-        )
+        team1_passes, team2_passes = pass_stats.counts(frame_num)
+        team1_interceptions, team2_interceptions = interception_stats.counts(frame_num)
         
         # Calculate table position
-        table_width, table_height = 400, 140
         table_x, table_y = self.calculate_table_position(frame_width, frame_height, 
-                                                        table_width, table_height)
+                                                        self.table_width, self.table_height)
         
         # Draw the table
         self.draw_table(frame, table_x, table_y, team1_passes, team2_passes, 
@@ -258,13 +304,11 @@ class PassInterceptionTableDrawer:
         Returns:
             list: A list of frames with pass and interception table drawn on them
         """
+        pass_stats, interception_stats = self.get_cumulative_stats(passes, interceptions)
+
         output_video_frames = []
         for frame_num, frame in enumerate(video_frames):
-            if frame_num == 0:
-                output_video_frames.append(frame)
-                continue
-            
-            frame_drawn = self.draw_frame(frame.copy(), frame_num, passes, interceptions)
+            frame_drawn = self.draw_frame(frame.copy(), frame_num, pass_stats, interception_stats)
             output_video_frames.append(frame_drawn)
         return output_video_frames
 
@@ -1,4 +1,6 @@
+from .util import render_sprite_layer, make_layer_sprite, paste_layer_sprite
 import cv2
+import numpy as np
 
 
 class TacticalViewDrawer():
@@ -6,6 +8,137 @@ class TacticalViewDrawer():
         # position of the top left corner of the court image
         self.start_x = 450
         self.start_y = 20
+        self.transparency = 0.6
+        self.colors = {
+            'keypoint': (0, 0, 255),
+            'keypoint_text': (0, 255, 0),
+            'team_1': (255, 245, 235),
+            'team_2': (179, 0, 0),
+            'player_outline': (0, 0, 0)
+        }
+        # the keypoints on the edges of the court have their circle and label drawn outside of it
+        self.sprite_padding = 30
+
+        self.court_images = {}
+        self.court_sprite = None
+        self.court_sprite_source = None
+        # per-frame layers drawn over the court, see add_layer
+        self.layers = []
+
+    def load_court_image(self, court_image_path, width, height):
+        # read and resized once per image and size
+        key = (court_image_path, width, height)
+        if key not in self.court_images:
+            court_image = cv2.imread(court_image_path)
+            self.court_images[key] = cv2.resize(court_image, (width, height))
+        return self.court_images[key]
+
+    def draw_keypoints(self, image, x, y, court_keypoints_list, colors):
+        for keypoint_idx, keypoint in enumerate(court_keypoints_list):
+            keypoint_x, keypoint_y = keypoint
+            center = (int(keypoint_x + x), int(keypoint_y + y))
+            cv2.circle(image,
+                       center,
+                       radius=5,
+                       color=colors['keypoint'],
+                       thickness=-1)
+
+            cv2.putText(image,
+                        str(keypoint_idx),
+                        center,
+                        cv2.FONT_HERSHEY_SIMPLEX,
+                        0.5,
+                        colors['keypoint_text'],
+                        2)
+
+    def get_court_sprite(self, court_image, court_keypoints_list):
+        """
+        Render the keypoints of the court once, every frame is then the blend of the court
+        image and a paste of the keypoints sprite instead of 18 circles and 18 labels.
+
+        Returns:
+            tuple: (sprite, offset_x, offset_y), offset of the sprite from the court corner (the
+                labels of the keypoints on the edges are drawn outside of the court)
+        """
+        court_keypoints_list = tuple(tuple(keypoint) for keypoint in court_keypoints_list)
+        if (self.court_sprite is not None and self.court_sprite_source[0] is court_image
+                and self.court_sprite_source[1] == court_keypoints_list):
+            return self.court_sprite
+
+        height, width = court_image.shape[:2]
+        padding = self.sprite_padding
+        keypoints, keypoints_mask = render_sprite_layer(
+            width + 2 * padding, height + 2 * padding,
+            lambda image, colors: self.draw_keypoints(image, padding, padding, court_keypoints_list, colors),
+            self.colors)
+
+        keypoints_sprite, offset_x, offset_y = make_layer_sprite(keypoints, keypoints_mask)
+        self.court_sprite = (keypoints_sprite, offset_x - padding, offset_y - padding)
+        self.court_sprite_source = (court_image, court_keypoints_list)
+        return self.court_sprite
+
+    def add_layer(self, draw_function):
+        """
+        Add a per-frame layer (e.g. the players) over the pre-rendered court.
+
+        Args:
+            draw_function (callable): draw_function(frame, frame_num, start_x, start_y) draws in
+                place and returns the frame, (start_x, start_y) is the top left corner of the court
+        """
+        self.layers.append(draw_function)
+        return self
+
+    def draw_players(self, frame, frame_num, start_x, start_y, frame_offsets, track_ids, tactical_positions,
+                     player_assignment=None):
+        """
+        Draw a dot for every player of the frame at its position on the tactical view.
+
+        Args:
+            frame_offsets (numpy.ndarray): the players of frame i are the rows
+                frame_offsets[i]:frame_offsets[i + 1] of track_ids and tactical_positions
+            track_ids (numpy.ndarray): (detections,) track id of every player
+            tactical_positions (numpy.ndarray): (detections, 2) positions on the tactical view,
+                see TacticalViewConverter.get_tactical_player_positions
+            player_assignment (list): team of every player on every frame, optional
+        """
+        start, end = frame_offsets[frame_num], frame_offsets[frame_num + 1]
+        frame_track_ids = track_ids[start:end].tolist()
+        positions = tactical_positions[start:end]
+        frame_assignment = player_assignment[frame_num] if player_assignment is not None else {}
+
+        for track_id, (x, y) in zip(frame_track_ids, positions):
+            if np.isnan(x) or np.isnan(y):
+                continue
+            team = frame_assignment.get(track_id, 1)
+            center = (int(x) + start_x, int(y) + start_y)
+            cv2.circle(frame, center, radius=6, color=self.colors[f'team_{team}'], thickness=-1)
+            cv2.circle(frame, center, radius=6, color=self.colors['player_outline'], thickness=1)
+
+        return frame
+
+    def add_players_layer(self, frame_offsets, track_ids, tactical_positions, player_assignment=None):
+        """
+        Draw the players on the tactical view on every frame, see draw_players.
+        """
+        return self.add_layer(
+            lambda frame, frame_num, start_x, start_y: self.draw_players(
+                frame, frame_num, start_x, start_y, frame_offsets, track_ids, tactical_positions,
+                player_assignment))
+
+    def draw_frame(self, frame, frame_num, court_image, court_keypoints_list):
+        keypoints_sprite, offset_x, offset_y = self.get_court_sprite(court_image, court_keypoints_list)
+
+        height, width = court_image.shape[:2]
+        x1, y1 = self.start_x, self.start_y
+        roi = frame[y1:y1 + height, x1:x1 + width]
+        cv2.addWeighted(court_image, self.transparency, roi, 1 - self.transparency, 0, roi)
+        # the court is blended like before, the keypoints are drawn opaque over it
+        frame = paste_layer_sprite(frame, self.start_x + offset_x, self.start_y + offset_y, keypoints_sprite)
+
+        for draw_function in self.layers:
+            frame = draw_function(frame, frame_num, self.start_x, self.start_y)
+
+        return frame
 
     def draw(self,
              video_frames,
@@ -13,50 +146,13 @@ class TacticalViewDrawer():
              width,
              height,
              court_keypoints_list
-             ): 
-        court_image = cv2.imread(court_image_path)
-        court_image = cv2.resize(court_image, (width, height))
+             ):
+        court_image = self.load_court_image(court_image_path, width, height)
 
         output_video_frames = []
         for frame_idx, frame in enumerate(video_frames):
             output_frames = frame.copy()
-            
-            x1 = self.start_x
-            y1 = self.start_y
-            x2 = x1 + width
-            y2 = y1 + height
-
-            alpha = 0.6 # transparency
-            overlay = output_frames[y1:y2,x1:x2].copy()
-            cv2.addWeighted(court_image,
-                            alpha,
-                            overlay,
-                            1-alpha,
-                            0,
-                            output_frames[y1:y2,x1:x2])
-            
-            for keypoint_idx, keypoint in enumerate(court_keypoints_list):
-                x, y = keypoint
-                x += self.start_x
-                y += self.start_y
-                center = (int(x), int(y))
-                cv2.circle(output_frames,
-                           center,
-                           radius=5,
-                           color=(0,0,255),
-                           thickness=-1)
-
-                cv2.putText(output_frames,
-                            str(keypoint_idx),
-                            center,
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.5,
-                            (0,255,0),
-                            2)
-
-
+            output_frames = self.draw_frame(output_frames, frame_idx, court_image, court_keypoints_list)
             output_video_frames.append(output_frames)
 
         return output_video_frames
-
-        
@@ -1,5 +1,9 @@
+from utils import CumulativeStats
+from .util import TableSpriteCache
 import cv2 
 import numpy as np
+import sys
+sys.path.append("../")
 
 class TeamBallControlDrawer:
     """
@@ -26,6 +30,9 @@ class TeamBallControlDrawer:
             'team1_color': (0, 100, 200),   # Blue for team 1
             'team2_color': (200, 100, 0)    # Orange for team 2
         }
+        self.table_width = 280
+        self.table_height = 120
+        self.table_sprites = None
 
     def get_team_ball_control(self, player_assignment, ball_acquisition):
         """
@@ -89,57 +96,49 @@ class TeamBallControlDrawer:
             
         return int(x), int(y)
 
-    def draw_table(self, frame, x, y, team1_pct, team2_pct, total_frames):
+    def draw_table_background(self, image, x, y, colors):
         """
-        Draw a professional-looking table with ball control statistics.
-        
-        Args:
-            frame (numpy.ndarray): The video frame
-            x (int): X coordinate of table top-left corner
-            y (int): Y coordinate of table top-left corner
-            team1_pct (float): Team 1 ball control percentage
-            team2_pct (float): Team 2 ball control percentage
-            total_frames (int): Total number of frames processed
+        Draw the static part of the table (background, border, header, grid lines),
+        it is blended with the frame.
         """
         # Table dimensions
-        table_width = 280
-        table_height = 120
+        table_width = self.table_width
+        table_height = self.table_height
         row_height = 30
         
-        # Create overlay for transparency
-        overlay = frame.copy()
-        
         # Draw main table background
-        cv2.rectangle(overlay, (x, y), (x + table_width, y + table_height), 
-                     self.colors['background'], -1)
+        cv2.rectangle(image, (x, y), (x + table_width, y + table_height), 
+                     colors['background'], -1)
         
         # Draw table border
-        cv2.rectangle(overlay, (x, y), (x + table_width, y + table_height), 
-                     self.colors['border'], 2)
+        cv2.rectangle(image, (x, y), (x + table_width, y + table_height), 
+                     colors['border'], 2)
         
         # Draw header background
-        cv2.rectangle(overlay, (x, y), (x + table_width, y + row_height), 
-                     self.colors['header_bg'], -1)
+        cv2.rectangle(image, (x, y), (x + table_width, y + row_height), 
+                     colors['header_bg'], -1)
         
         # Draw horizontal lines
         for i in range(1, 4):  # 3 horizontal lines (header + 2 data rows)
-            cv2.line(overlay, (x, y + i * row_height), 
+            cv2.line(image, (x, y + i * row_height), 
                     (x + table_width, y + i * row_height), 
-                    self.colors['border'], 1)
+                    colors['border'], 1)
         
         # Draw vertical lines
         col_widths = [100, 90, 90]  # Team, Control %, Time
         col_x = x
         for width in col_widths:
-            cv2.line(overlay, (col_x, y), (col_x, y + table_height), 
-                    self.colors['border'], 1)
+            cv2.line(image, (col_x, y), (col_x, y + table_height), 
+                    colors['border'], 1)
             col_x += width
-        cv2.line(overlay, (col_x, y), (col_x, y + table_height), 
-                self.colors['border'], 1)  # Right border
-        
-        # Apply transparency
-        cv2.addWeighted(overlay, self.transparency, frame, 1 - self.transparency, 0, frame)
-        
+        cv2.line(image, (col_x, y), (col_x, y + table_height), 
+                colors['border'], 1)  # Right border
+
+    def draw_table_labels(self, image, x, y, colors):
+        """
+        Draw the static text of the table (header and team names), it is drawn over the
+        blended background.
+        """
         # Font settings
         font = cv2.FONT_HERSHEY_SIMPLEX
         font_scale = 0.5
@@ -147,74 +146,137 @@ class TeamBallControlDrawer:
         
         # Draw header text
         header_y = y + 20
-        cv2.putText(frame, "Team", (x + 25, header_y), font, font_scale, 
-                   self.colors['header_text'], thickness)
-        cv2.putText(frame, "Control %", (x + 125, header_y), font, font_scale, 
-                   self.colors['header_text'], thickness)
-        cv2.putText(frame, "Time", (x + 215, header_y), font, font_scale, 
-                   self.colors['header_text'], thickness)
+        cv2.putText(image, "Team", (x + 25, header_y), font, font_scale, 
+                   colors['header_text'], thickness)
+        cv2.putText(image, "Control %", (x + 125, header_y), font, font_scale, 
+                   colors['header_text'], thickness)
+        cv2.putText(image, "Time", (x + 215, header_y), font, font_scale, 
+                   colors['header_text'], thickness)
         
+        cv2.putText(image, "Team 1", (x + 15, y + 50), font, font_scale, 
+                   colors['team1_color'], thickness + 1)
+        cv2.putText(image, "Team 2", (x + 15, y + 80), font, font_scale, 
+                   colors['team2_color'], thickness + 1)
+
+    def get_table_values(self, team1_pct, team2_pct, total_frames):
+        """
+        Format the statistics exactly as they are displayed, the tuple is the key of the
+        cached table sprites.
+        """
         # Calculate time in possession (assuming 30 fps)
         fps = 30
         team1_time = int((team1_pct / 100.0) * total_frames / fps)
         team2_time = int((team2_pct / 100.0) * total_frames / fps)
+        no_control_pct = 100.0 - team1_pct - team2_pct
+        
+        return (f"{team1_pct:.1f}%", f"{team1_time}s",
+                f"{team2_pct:.1f}%", f"{team2_time}s",
+                f"No Control: {no_control_pct:.1f}%")
+
+    def draw_table_values(self, image, x, y, values, colors):
+        """
+        Draw the statistics from get_table_values, they are drawn over the blended background.
+        """
+        team1_pct_text, team1_time_text, team2_pct_text, team2_time_text, no_control_text = values
+        
+        # Font settings
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        font_scale = 0.5
+        thickness = 1
         
         # Draw Team 1 data
         team1_y = y + 50
-        cv2.putText(frame, "Team 1", (x + 15, team1_y), font, font_scale, 
-                   self.colors['team1_color'], thickness + 1)
-        cv2.putText(frame, f"{team1_pct:.1f}%", (x + 135, team1_y), font, font_scale, 
-                   self.colors['text'], thickness)
-        cv2.putText(frame, f"{team1_time}s", (x + 225, team1_y), font, font_scale, 
-                   self.colors['text'], thickness)
+        cv2.putText(image, team1_pct_text, (x + 135, team1_y), font, font_scale, 
+                   colors['text'], thickness)
+        cv2.putText(image, team1_time_text, (x + 225, team1_y), font, font_scale, 
+                   colors['text'], thickness)
         
         # Draw Team 2 data
         team2_y = y + 80
-        cv2.putText(frame, "Team 2", (x + 15, team2_y), font, font_scale, 
-                   self.colors['team2_color'], thickness + 1)
-        cv2.putText(frame, f"{team2_pct:.1f}%", (x + 135, team2_y), font, font_scale, 
-                   self.colors['text'], thickness)
-        cv2.putText(frame, f"{team2_time}s", (x + 225, team2_y), font, font_scale, 
-                   self.colors['text'], thickness)
+        cv2.putText(image, team2_pct_text, (x + 135, team2_y), font, font_scale, 
+                   colors['text'], thickness)
+        cv2.putText(image, team2_time_text, (x + 225, team2_y), font, font_scale, 
+                   colors['text'], thickness)
         
         # Draw summary info
         summary_y = y + 110
-        no_control_pct = 100.0 - team1_pct - team2_pct
-        cv2.putText(frame, f"No Control: {no_control_pct:.1f}%", (x + 15, summary_y), 
-                   font, 0.4, self.colors['text'], 1)
+        cv2.putText(image, no_control_text, (x + 15, summary_y), 
+                   font, 0.4, colors['text'], 1)
+
+    def get_table_sprites(self):
+        # created on first use so a transparency changed after __init__ is taken into account
+        if self.table_sprites is None:
+            self.table_sprites = TableSpriteCache(self.table_width, self.table_height, self.colors,
+                                                  self.transparency, self.draw_table_background,
+                                                  self.draw_table_labels, self.draw_table_values)
+        return self.table_sprites
 
-    def draw_frame(self, frame, frame_num, team_ball_control):
+    def draw_table(self, frame, x, y, team1_pct, team2_pct, total_frames):
+        """
+        Draw a professional-looking table with ball control statistics.
+        
+        Only the table region is blended, with a sprite pre-rendered for the displayed values.
+        
+        Args:
+            frame (numpy.ndarray): The video frame
+            x (int): X coordinate of table top-left corner
+            y (int): Y coordinate of table top-left corner
+            team1_pct (float): Team 1 ball control percentage
+            team2_pct (float): Team 2 ball control percentage
+            total_frames (int): Total number of frames processed
+        """
+        values = self.get_table_values(team1_pct, team2_pct, total_frames)
+        self.get_table_sprites().draw(frame, x, y, values)
+
+    def get_ball_control_stats(self, team_ball_control):
+        """
+        Precompute the ball control counts of every team for the whole video.
+
+        Args:
+            team_ball_control (numpy.ndarray): Array indicating team control for each frame
+
+        Returns:
+            CumulativeStats: Prefix counts of the frames controlled by Team 1 and Team 2
+        """
+        return CumulativeStats(team_ball_control, labels=(1, 2))
+
+    def draw_frame(self, frame, frame_num, ball_control_stats):
         """
         Draw a table showing team ball control percentages on a single frame.
 
         Args:
             frame (numpy.ndarray): The current video frame
             frame_num (int): The index of the current frame
-            team_ball_control (numpy.ndarray): Array indicating team control for each frame
+            ball_control_stats (CumulativeStats): Stats from get_ball_control_stats, a raw
+                team_ball_control array is also accepted but is accumulated on every call
 
         Returns:
             numpy.ndarray: The frame with the ball control table
         """
+        # the first frame is left untouched
+        if frame_num == 0:
+            return frame
+
+        if not isinstance(ball_control_stats, CumulativeStats):
+            ball_control_stats = self.get_ball_control_stats(ball_control_stats)
+
         frame_height, frame_width = frame.shape[:2]
         
         # Calculate statistics up to current frame
-        team_ball_control_till_frame = team_ball_control[:frame_num + 1]
-        total_frames = len(team_ball_control_till_frame)
+        total_frames = ball_control_stats.total(frame_num)
         
         if total_frames == 0:
             return frame
         
         # Calculate ball control statistics
-        team_1_frames = np.sum(team_ball_control_till_frame == 1)
-        team_2_frames = np.sum(team_ball_control_till_frame == 2)
+        team_1_frames, team_2_frames = ball_control_stats.counts(frame_num)
         
         team1_pct = (team_1_frames / total_frames) * 100
         team2_pct = (team_2_frames / total_frames) * 100
         
         # Calculate table position
-        table_width, table_height = 280, 120
         table_x, table_y = self.calculate_table_position(frame_width, frame_height, 
-                                                        table_width, table_height)
+                                                        self.table_width, self.table_height)
         
         # Draw the table
         self.draw_table(frame, table_x, table_y, team1_pct, team2_pct, total_frames)
@@ -234,14 +296,11 @@ class TeamBallControlDrawer:
             list: A list of frames with team ball control table drawn on them
         """
         team_ball_control = self.get_team_ball_control(player_assignment, ball_acquisition)
+        ball_control_stats = self.get_ball_control_stats(team_ball_control)
         
         output_video_frames = []
         for frame_num, frame in enumerate(video_frames):
-            if frame_num == 0:
-                output_video_frames.append(frame)
-                continue
-                
-            frame_drawn = self.draw_frame(frame.copy(), frame_num, team_ball_control)
+            frame_drawn = self.draw_frame(frame.copy(), frame_num, ball_control_stats)
             output_video_frames.append(frame_drawn)
             
         return output_video_frames
@@ -1,4 +1,5 @@
 from utils import get_center_of_bbox, get_bbox_width
+from collections import OrderedDict
 import cv2
 import numpy as np
 import sys
@@ -64,3 +65,199 @@ def draw_triangle(frame, bbox, color):
     cv2.drawContours(frame, [triangle_points], 0, (0,0,0), 2)
 
     return frame
+
+
+def render_sprite_layer(width, height, draw_function, colors):
+    """
+    Render draw_function(image, colors) on a blank canvas.
+
+    Returns:
+        tuple: (canvas (height, width, 3) uint8, mask (height, width) uint8), the mask is the
+            coverage of every pixel (255 where draw_function painted, less on anti-aliased edges)
+            and the canvas is the color already multiplied by that coverage
+    """
+    canvas = np.zeros((height, width, 3), dtype=np.uint8)
+    mask = np.zeros((height, width), dtype=np.uint8)
+    draw_function(canvas, colors)
+    draw_function(mask, {key: (255, 255, 255) for key in colors})
+    return canvas, mask
+
+
+def make_overlay_sprite(background, background_mask, transparency):
+    """
+    Build a sprite for blend_sprite that blends the background with the frame like
+    cv2.addWeighted(overlay, transparency, frame, 1 - transparency). The background comes
+    from render_sprite_layer.
+
+    Returns:
+        tuple: (color premultiplied by its alpha (h, w, 3) float32, inverse alpha (h, w, 3) float32)
+    """
+    background_coverage = background_mask[..., None] / 255.0
+    premultiplied = background.astype(np.float32) * np.float32(transparency)
+    inverse_alpha = (1 - transparency * background_coverage).astype(np.float32)
+    # one value per channel, so the blend is a plain element-wise operation
+    return premultiplied, np.repeat(inverse_alpha, 3, axis=2)
+
+
+def add_sprite_foreground(sprite, foreground, foreground_mask):
+    """
+    Return a new sprite with a foreground layer (e.g. text from render_sprite_layer) drawn
+    over the sprite.
+    """
+    premultiplied, inverse_alpha = sprite
+    foreground_coverage = (foreground_mask[..., None] / 255.0).astype(np.float32)
+    return (premultiplied * (1 - foreground_coverage) + foreground,
+            inverse_alpha * (1 - foreground_coverage))
+
+
+def make_layer_sprite(layer, mask):
+    """
+    Build a sprite for paste_layer_sprite from a mostly opaque layer of render_sprite_layer
+    (e.g. filled circles and text), cropped to the pixels the layer paints.
+
+    The opaque pixels (mask 255) are copied as they are, only the few anti-aliased edge pixels
+    are blended, so the whole region does not have to go through a float blend.
+
+    Returns:
+        tuple: (sprite, x offset, y offset) of the cropped sprite in the original layer
+    """
+    ys, xs = np.nonzero(mask)
+    if len(ys) == 0:
+        return (layer[:0, :0], mask[:0, :0], ys, xs, np.empty(0, np.float32), np.empty(0, np.float32), {}), 0, 0
+    y1, y2, x1, x2 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+    layer, mask = layer[y1:y2, x1:x2], mask[y1:y2, x1:x2]
+
+    opaque_mask = np.where(mask == 255, 255, 0).astype(np.uint8)
+    edge_ys, edge_xs = np.nonzero((mask > 0) & (mask < 255))
+    # one value per channel (flattened), the layer is already multiplied by its coverage
+    edge_color = layer[edge_ys, edge_xs].astype(np.float32).ravel()
+    edge_inverse_alpha = np.repeat(1 - mask[edge_ys, edge_xs] / 255.0, 3).astype(np.float32)
+    # {frame width: flat indices of the edge pixels from the top left corner of the sprite}
+    edge_indices = {}
+    sprite = (layer.copy(), opaque_mask, edge_ys, edge_xs, edge_color, edge_inverse_alpha, edge_indices)
+    return sprite, int(x1), int(y1)
+
+
+def paste_layer_sprite(frame, x, y, sprite):
+    """
+    Draw a sprite from make_layer_sprite in place, (x, y) is the top left corner of the sprite,
+    the parts outside the frame are clipped.
+    """
+    layer, opaque_mask, edge_ys, edge_xs, edge_color, edge_inverse_alpha, edge_indices = sprite
+    height, width = opaque_mask.shape[:2]
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + width, frame.shape[1]), min(y + height, frame.shape[0])
+    if x1 >= x2 or y1 >= y2:
+        return frame
+
+    layer_x, layer_y = x1 - x, y1 - y
+    layer_region = (slice(layer_y, layer_y + y2 - y1), slice(layer_x, layer_x + x2 - x1))
+    cv2.copyTo(layer[layer_region], opaque_mask[layer_region], frame[y1:y2, x1:x2])
+
+    if not frame.flags.c_contiguous or (x2 - x1, y2 - y1) != (width, height):
+        # clipped sprite or frame view, slower path
+        inside = ((edge_ys >= layer_y) & (edge_ys < layer_y + y2 - y1) &
+                  (edge_xs >= layer_x) & (edge_xs < layer_x + x2 - x1))
+        frame_ys, frame_xs = edge_ys[inside] + y, edge_xs[inside] + x
+        inside = np.repeat(inside, 3)
+        blended = frame[frame_ys, frame_xs].reshape(-1) * edge_inverse_alpha[inside] + edge_color[inside]
+        frame[frame_ys, frame_xs] = (blended + 0.5).astype(np.uint8).reshape(-1, 3)
+        return frame
+
+    # take / put on the flat frame are much faster than a 2d fancy index on a few hundred pixels
+    frame_width = frame.shape[1]
+    if frame_width not in edge_indices:
+        edge_indices[frame_width] = ((edge_ys * frame_width + edge_xs)[:, None] * 3 + np.arange(3)).ravel()
+    indices = edge_indices[frame_width] + (y * frame_width + x) * 3
+    flat_frame = frame.reshape(-1)
+    blended = flat_frame.take(indices) * edge_inverse_alpha
+    blended += edge_color
+    blended += 0.5
+    flat_frame.put(indices, blended.astype(np.uint8))
+    return frame
+
+
+def blend_sprite(frame, x, y, sprite):
+    """
+    Blend a sprite from make_overlay_sprite in place, only on the region it covers.
+    (x, y) is the top left corner of the sprite, the parts outside the frame are clipped.
+    """
+    premultiplied, inverse_alpha = sprite
+    height, width = inverse_alpha.shape[:2]
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + width, frame.shape[1]), min(y + height, frame.shape[0])
+    if x1 >= x2 or y1 >= y2:
+        return frame
+
+    sprite_x, sprite_y = x1 - x, y1 - y
+    sprite_region = (slice(sprite_y, sprite_y + y2 - y1), slice(sprite_x, sprite_x + x2 - x1))
+    roi = frame[y1:y2, x1:x2]
+    blended = cv2.multiply(roi, inverse_alpha[sprite_region], dtype=cv2.CV_32F)
+    cv2.add(blended, premultiplied[sprite_region], blended)
+    # rounded and saturated back to uint8
+    roi[...] = cv2.convertScaleAbs(blended)
+    return frame
+
+
+class TableSpriteCache():
+    """
+    Pre-rendered semi-transparent table.
+
+    The background (fill, border, grid) and the labels never change, they are rendered once.
+    The values are drawn over this static sprite and the resulting sprites are kept in a
+    small LRU cache keyed by the displayed values, so a frame whose numbers did not change is
+    a single blend of the table region.
+    """
+
+    def __init__(self, width, height, colors, transparency, draw_background, draw_labels, draw_values,
+                 padding=10, max_size=32):
+        # the border and the text can go a few pixels past the table, keep some room around it
+        self.padding = padding
+        self.width = width + 2 * padding + 1
+        self.height = height + 2 * padding + 1
+        self.colors = colors
+        self.transparency = transparency
+        self.draw_background = draw_background
+        self.draw_labels = draw_labels
+        self.draw_values = draw_values
+        self.max_size = max_size
+
+        self.static_sprite = None
+        self.sprites = OrderedDict()
+
+    def render_sprite_layer(self, draw_function, *args):
+        padding = self.padding
+        return render_sprite_layer(self.width, self.height,
+                                   lambda image, colors: draw_function(image, padding, padding, *args, colors),
+                                   self.colors)
+
+    def get_static_sprite(self):
+        if self.static_sprite is None:
+            background, background_mask = self.render_sprite_layer(self.draw_background)
+            labels, labels_mask = self.render_sprite_layer(self.draw_labels)
+            self.static_sprite = add_sprite_foreground(
+                make_overlay_sprite(background, background_mask, self.transparency), labels, labels_mask)
+        return self.static_sprite
+
+    def get_sprite(self, values):
+        sprite = self.sprites.get(values)
+        if sprite is not None:
+            self.sprites.move_to_end(values)
+            return sprite
+
+        # only the values are rendered, on top of the static sprite
+        foreground, foreground_mask = self.render_sprite_layer(self.draw_values, values)
+        sprite = add_sprite_foreground(self.get_static_sprite(), foreground, foreground_mask)
+        self.sprites[values] = sprite
+        if len(self.sprites) > self.max_size:
+            self.sprites.popitem(last=False)
+        return sprite
+
+    def draw(self, frame, x, y, values):
+        """
+        Draw the table with its top left corner at (x, y).
+
+        Args:
+            values (tuple): The displayed values (hashable), passed to draw_values
+        """
+        return blend_sprite(frame, x - self.padding, y - self.padding, self.get_sprite(values))
@@ -0,0 +1 @@
+from .game_index import GameIndex
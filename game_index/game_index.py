@@ -0,0 +1,218 @@
+import numpy as np
+
+
+class GameIndex():
+    """
+    Queryable summary of a processed game, to answer range queries ("ball control of team 1
+    between 12:00 and 14:30", "interceptions of the 3rd quarter") without the tracks or the video.
+
+    The possession is stored as segments (runs of frames with the same holder and team) and the
+    passes / interceptions as sorted event frames, both with prefix sums per team. A query finds
+    the first and last segment or event of the range with a binary search, so it costs
+    O(log n) whatever the length of the range. Frame ranges include both ends, like the frames
+    of the possession segments.
+
+        index = GameIndex.build(ball_acquisition, players_assignment, passes, interceptions, fps=30)
+        index.save("cache/game_index.npz")
+        index = GameIndex.load("cache/game_index.npz")
+        start, end = index.get_frame_num("12:00"), index.get_frame_num("14:30")
+        index.get_ball_control(start, end)                  # (team1 %, team2 %)
+        index.count_events("interception", start, end)     # (team 1, team 2)
+    """
+
+    event_names = ("pass", "interception")
+
+    def __init__(self, num_frames, segment_starts, segment_ends, segment_holders, segment_teams,
+                 event_frames, event_teams, event_types, fps=None):
+        self.num_frames = int(num_frames)
+        self.fps = fps
+
+        self.segment_starts = np.asarray(segment_starts, dtype=np.int64)
+        self.segment_ends = np.asarray(segment_ends, dtype=np.int64)        # included
+        self.segment_holders = np.asarray(segment_holders, dtype=np.int64)
+        self.segment_teams = np.asarray(segment_teams, dtype=np.int64)
+        # prefix_frames[k, i] = frames controlled by team k + 1 in the segments < i
+        segment_lengths = self.segment_ends - self.segment_starts + 1
+        self.prefix_frames = np.zeros((2, len(self.segment_starts) + 1), dtype=np.int64)
+        for k, team in enumerate((1, 2)):
+            np.cumsum(np.where(self.segment_teams == team, segment_lengths, 0), out=self.prefix_frames[k, 1:])
+
+        # events of each type sorted by frame, with the prefix counts of each team
+        self.event_frames = np.asarray(event_frames, dtype=np.int64)
+        self.event_teams = np.asarray(event_teams, dtype=np.int64)
+        self.event_types = np.asarray(event_types, dtype=np.int64)      # index in event_names
+        self.events = {}
+        for type_index, event_type in enumerate(self.event_names):
+            is_type = self.event_types == type_index
+            frames = self.event_frames[is_type]
+            order = np.argsort(frames, kind="stable")
+            frames, teams = frames[order], self.event_teams[is_type][order]
+            prefix_counts = np.zeros((2, len(frames) + 1), dtype=np.int64)
+            for k, team in enumerate((1, 2)):
+                np.cumsum(teams == team, out=prefix_counts[k, 1:])
+            self.events[event_type] = (frames, teams, prefix_counts)
+
+    @classmethod
+    def build(cls, ball_acquisition, players_assignment, passes, interceptions, fps=None):
+        """
+        Build the index from the per-frame outputs of the pipeline.
+
+        Args:
+            ball_acquisition (list): holder of the ball on each frame, -1 if nobody
+            players_assignment (list): team of every player on each frame
+            passes (list): team that passed on each frame, -1 if no pass
+            interceptions (list): team that intercepted on each frame, -1 if no interception
+            fps (float): frame rate of the video, needed to query with times
+        """
+        num_frames = len(ball_acquisition)
+
+        # same rule as TeamBallControlDrawer.get_team_ball_control
+        holders = np.asarray(ball_acquisition, dtype=np.int64).reshape(-1)
+        teams = np.full(num_frames, -1, dtype=np.int64)
+        for frame_num, (holder, player_assignment_frame) in enumerate(zip(holders.tolist(), players_assignment)):
+            if holder != -1 and holder in player_assignment_frame:
+                teams[frame_num] = 1 if player_assignment_frame[holder] == 1 else 2
+
+        # run-length encode (holder, team), the frames without control are not stored
+        segment_starts = np.empty(0, dtype=np.int64)
+        segment_ends = np.empty(0, dtype=np.int64)
+        if num_frames > 0:
+            changes = (np.diff(holders) != 0) | (np.diff(teams) != 0)
+            segment_starts = np.concatenate([[0], np.flatnonzero(changes) + 1])
+            segment_ends = np.append(segment_starts[1:], num_frames) - 1
+        has_control = teams[segment_starts] != -1
+        segment_starts, segment_ends = segment_starts[has_control], segment_ends[has_control]
+
+        event_frames, event_teams, event_types = [], [], []
+        for type_index, event_array in enumerate((passes, interceptions)):
+            event_array = np.asarray(event_array, dtype=np.int64).reshape(-1)
+            frames = np.flatnonzero(event_array != -1)
+            event_frames.append(frames)
+            event_teams.append(event_array[frames])
+            event_types.append(np.full(len(frames), type_index))
+
+        return cls(num_frames, segment_starts, segment_ends, holders[segment_starts], teams[segment_starts],
+                   np.concatenate(event_frames), np.concatenate(event_teams), np.concatenate(event_types), fps)
+
+    def get_frame_num(self, time):
+        """
+        Args:
+            time (float or str): seconds from the start of the video, or "mm:ss" / "hh:mm:ss"
+
+        Returns:
+            int: the frame shown at that time
+        """
+        if self.fps is None:
+            raise ValueError("the index was built without fps, query it with frame numbers")
+        if isinstance(time, str):
+            seconds = 0.0
+            for part in time.split(":"):
+                seconds = seconds * 60 + float(part)
+            time = seconds
+        return int(time * self.fps)
+
+    def clip_range(self, start_frame, end_frame):
+        if start_frame is None:
+            start_frame = 0
+        if end_frame is None:
+            end_frame = self.num_frames - 1
+        return max(start_frame, 0), min(end_frame, self.num_frames - 1)
+
+    def get_segment_range(self, start_frame, end_frame):
+        """
+        Returns:
+            tuple: (first, last) the segments first:last overlap the frames start_frame..end_frame
+        """
+        first = int(np.searchsorted(self.segment_ends, start_frame, side="left"))
+        last = int(np.searchsorted(self.segment_starts, end_frame, side="right"))
+        return first, max(first, last)
+
+    def count_ball_control_frames(self, start_frame=None, end_frame=None):
+        """
+        Returns:
+            tuple: (team 1 frames, team 2 frames) with the ball between the two frames (included)
+        """
+        start_frame, end_frame = self.clip_range(start_frame, end_frame)
+        if end_frame < start_frame:
+            return 0, 0
+        first, last = self.get_segment_range(start_frame, end_frame)
+        counts = self.prefix_frames[:, last] - self.prefix_frames[:, first]
+        if last > first:
+            # the segments on the bounds can be partly out of the range
+            for segment, outside in ((first, start_frame - self.segment_starts[first]),
+                                     (last - 1, self.segment_ends[last - 1] - end_frame)):
+                if outside > 0:
+                    counts[self.segment_teams[segment] - 1] -= outside
+        return int(counts[0]), int(counts[1])
+
+    def get_ball_control(self, start_frame=None, end_frame=None):
+        """
+        Returns:
+            tuple: (team 1 %, team 2 %) of the frames of the range, like the ball control table
+        """
+        start_frame, end_frame = self.clip_range(start_frame, end_frame)
+        total_frames = end_frame - start_frame + 1
+        if total_frames <= 0:
+            return 0.0, 0.0
+        team_1_frames, team_2_frames = self.count_ball_control_frames(start_frame, end_frame)
+        return team_1_frames / total_frames * 100, team_2_frames / total_frames * 100
+
+    def get_segments(self, start_frame=None, end_frame=None):
+        """
+        Returns:
+            list: possession segments that overlap the range, e.g.
+                {"holder": 28, "team": 1, "start_frame": 10, "end_frame": 35}
+        """
+        start_frame, end_frame = self.clip_range(start_frame, end_frame)
+        first, last = self.get_segment_range(start_frame, end_frame)
+        return [{"holder": holder, "team": team, "start_frame": start, "end_frame": end}
+                for holder, team, start, end in zip(self.segment_holders[first:last].tolist(),
+                                                    self.segment_teams[first:last].tolist(),
+                                                    self.segment_starts[first:last].tolist(),
+                                                    self.segment_ends[first:last].tolist())]
+
+    def get_event_range(self, event_type, start_frame, end_frame):
+        frames = self.events[event_type][0]
+        first = int(np.searchsorted(frames, start_frame, side="left"))
+        last = int(np.searchsorted(frames, end_frame, side="right"))
+        return first, max(first, last)
+
+    def count_events(self, event_type, start_frame=None, end_frame=None):
+        """
+        Returns:
+            tuple: (team 1, team 2) number of events ("pass" or "interception") in the range
+        """
+        start_frame, end_frame = self.clip_range(start_frame, end_frame)
+        first, last = self.get_event_range(event_type, start_frame, end_frame)
+        prefix_counts = self.events[event_type][2]
+        counts = prefix_counts[:, last] - prefix_counts[:, first]
+        return int(counts[0]), int(counts[1])
+
+    def get_events(self, event_type, start_frame=None, end_frame=None):
+        """
+        Returns:
+            list: events in the range, e.g. {"event": "interception", "frame_num": 80, "team": 2}
+        """
+        start_frame, end_frame = self.clip_range(start_frame, end_frame)
+        first, last = self.get_event_range(event_type, start_frame, end_frame)
+        frames, teams, _ = self.events[event_type]
+        return [{"event": event_type, "frame_num": frame_num, "team": team}
+                for frame_num, team in zip(frames[first:last].tolist(), teams[first:last].tolist())]
+
+    def __len__(self):
+        return self.num_frames
+
+    def save(self, path):
+        np.savez(path, num_frames=self.num_frames, fps=np.nan if self.fps is None else self.fps,
+                 segment_starts=self.segment_starts, segment_ends=self.segment_ends,
+                 segment_holders=self.segment_holders, segment_teams=self.segment_teams,
+                 event_frames=self.event_frames, event_teams=self.event_teams, event_types=self.event_types)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            fps = float(data["fps"])
+            return cls(data["num_frames"], data["segment_starts"], data["segment_ends"],
+                       data["segment_holders"], data["segment_teams"],
+                       data["event_frames"], data["event_teams"], data["event_types"],
+                       None if np.isnan(fps) else fps)
@@ -0,0 +1 @@
+from .inference_scheduler import InferenceScheduler
@@ -0,0 +1,115 @@
+import time
+
+
+class InferenceStage():
+    def __init__(self, name, process_batch, batch_size, with_frame_num=False, finish=None):
+        self.name = name
+        self.process_batch = process_batch
+        self.batch_size = batch_size
+        self.with_frame_num = with_frame_num
+        self.finish = finish
+
+        self.buffer = []
+        self.results = []
+        self.processed_frames = 0
+        self.busy_time = 0.0
+
+    def run_batch(self, batch_frames):
+        start = time.perf_counter()
+        if self.with_frame_num:
+            batch_results = self.process_batch(batch_frames, self.processed_frames)
+        else:
+            batch_results = self.process_batch(batch_frames)
+        self.busy_time += time.perf_counter() - start
+
+        self.results.extend(batch_results)
+        self.processed_frames += len(batch_frames)
+
+    def run_finish(self):
+        if self.finish is None:
+            return
+        start = time.perf_counter()
+        self.results.extend(self.finish())
+        self.busy_time += time.perf_counter() - start
+
+    def __repr__(self):
+        fps = self.processed_frames / self.busy_time if self.busy_time > 0 else 0.0
+        return f"{self.name}: {self.processed_frames} frames, {fps:.1f} fps, busy {self.busy_time:.2f}s"
+
+
+class InferenceScheduler():
+    """
+    Fan every decoded frame out to all the registered models.
+
+    Each stage keeps its own buffer and runs as soon as it holds batch_size frames, so every
+    model gets the batch size that suits it while the video is decoded only once. Stages run in
+    the order they were registered, so a stage can use the results of a stage registered before
+    it with the same batch size (e.g. the team assignment uses the player tracks).
+
+    Example:
+        scheduler = InferenceScheduler()
+        scheduler.register("player_tracks", player_tracker.track_frames, batch_size=16)
+        scheduler.register("court_keypoints", court_keypoint_detector.detect_frames, batch_size=20)
+        results = scheduler.run(read_video_stream(video_path))
+        player_tracks = results["player_tracks"]
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def register(self, name, process_batch, batch_size, with_frame_num=False, finish=None):
+        """
+        Args:
+            name (str): name of the stage, used as key of the results
+            process_batch (callable): takes a list of frames and returns one result per frame.
+                If with_frame_num is True it also gets the index of the first frame of the batch.
+                A stage with finish can return fewer results and keep frames for a later batch.
+            batch_size (int): number of frames given to process_batch at once
+            finish (callable): called without arguments at the end of the stream, returns the
+                results of the frames the stage still holds
+        """
+        self.stages[name] = InferenceStage(name, process_batch, batch_size, with_frame_num, finish)
+
+    def get_results(self, name):
+        return self.stages[name].results
+
+    def submit(self, frames):
+        for stage in self.stages.values():
+            stage.buffer.extend(frames)
+            while len(stage.buffer) >= stage.batch_size:
+                batch_frames = stage.buffer[:stage.batch_size]
+                stage.buffer = stage.buffer[stage.batch_size:]
+                stage.run_batch(batch_frames)
+
+    def flush(self):
+        for stage in self.stages.values():
+            if stage.buffer:
+                batch_frames = stage.buffer
+                stage.buffer = []
+                stage.run_batch(batch_frames)
+            stage.run_finish()
+
+    def run(self, frames, chunk_size=None):
+        """
+        Feed a stream of frames to every stage and return {stage name: results}.
+
+        Frames are submitted in chunks of chunk_size (default: the largest batch size), so at
+        most about two chunks of frames are held in memory at any time.
+        """
+        if chunk_size is None:
+            chunk_size = max(stage.batch_size for stage in self.stages.values())
+
+        chunk = []
+        for frame in frames:
+            chunk.append(frame)
+            if len(chunk) == chunk_size:
+                self.submit(chunk)
+                chunk = []
+        if chunk:
+            self.submit(chunk)
+        self.flush()
+
+        return {name: stage.results for name, stage in self.stages.items()}
+
+    def __repr__(self):
+        return "\n".join(repr(stage) for stage in self.stages.values())
@@ -1,9 +1,18 @@
-from tracker import PlayerTracker, BallTracker
-from utils import read_video, save_video
+import time
+# measured before the other imports so the import cost of the stages is part of the startup time
+STARTUP_START_TIME = time.perf_counter()
+
+import argparse
+from tracker import PlayerTracker, BallTracker, BallKalmanFilter, TrackStore
+from utils import (read_video, save_video, read_video_fps,
+                   ThreadedVideoReader, ThreadedVideoWriter, StageCache)
 from team_assigner import TeamAssigner
 from ball_acquisition import BallAcquisitionDetector
 from pass_and_interception import PassAndInterceptionDetector 
 from court_keypoint_detector import CourtKeypointDetector
+from inference_scheduler import InferenceScheduler
+from game_index import GameIndex
+from segment_parallel import SegmentParallelProcessor
 from tactical_view_converter import TacticalViewConverter
 from drawers import (
         PlayersTrackDrawer,
@@ -11,36 +20,47 @@ from drawers import (
         TeamBallControlDrawer,
         PassInterceptionTableDrawer,
         CourtKeypointsDrawer,
-        TacticalViewDrawer
+        TacticalViewDrawer,
+        DrawerLayer,
+        FrameCompositor
         )
 
 
-def main():
+INPUT_VIDEO_PATH = "./input_videos/video_1.mp4"
+OUTPUT_VIDEO_PATH = "output_videos/output_videos.avi"
+CACHE_DIR = "cache"
+GAME_INDEX_PATH = "cache/game_index.npz"
+
+
+def main(keyframe_interval=1, ball_search_window=None):
     # read video
-    video_frames = read_video("./input_videos/video_1.mp4")
+    video_frames = read_video(INPUT_VIDEO_PATH)
 
     # Initialize models
-    player_tracker = PlayerTracker("./models/player_detector.pt")
-    ball_tracker = BallTracker("./models/ball_detector_model.pt")
+    player_tracker = PlayerTracker("./models/player_detector.pt", keyframe_interval=keyframe_interval)
+    ball_tracker = BallTracker("./models/ball_detector_model.pt", search_window=ball_search_window)
     court_keypoint_detector = CourtKeypointDetector("./models/court_keypoint_detector.pt")
     
+    # results of the models are cached by video, model and parameters
+    cache = StageCache(CACHE_DIR)
 
     player_tracks = player_tracker.objects_track(
                                                 video_frames,
-                                                read_from_stub=True,
-                                                stub_path="stubs/stub_player_tracks.pkl"
+                                                cache=cache,
+                                                video_path=INPUT_VIDEO_PATH
                                                 )
 
     ball_tracks = ball_tracker.objects_track(
                                             video_frames,
-                                            read_from_stub=True,
-                                            stub_path="stubs/stub_ball_tracks.pkl"
+                                            cache=cache,
+                                            video_path=INPUT_VIDEO_PATH
                                             )
+    # only when the ball was detected, not read from the cache
+    if ball_tracker.search_window is not None and ball_tracker.frame_count > 0:
+        print(f"Ball: found in the search window on {ball_tracker.window_hit_fraction:.0%} of the frames")
     
-    # Remove wrong ball positions
-    ball_tracks = ball_tracker.remove_wrong_detections(ball_tracks)
-    # Interpolate ball tracks
-    ball_tracks = ball_tracker.interpolate_ball_positions(ball_tracks)
+    # Remove wrong ball positions and fill the gaps in one pass (Kalman filter)
+    ball_tracks = ball_tracker.filter_ball_positions(ball_tracks)
 
     
     # Initialize drawers
@@ -56,8 +76,8 @@ def main():
     players_assignment = team_assigner.get_player_team_across_frame(
         video_frames,
         player_tracks,
-        read_from_stub=True,
-        stub_path="stubs/stub_player_assignment.pkl"
+        cache=cache,
+        video_path=INPUT_VIDEO_PATH
     )
     
     
@@ -68,61 +88,287 @@ def main():
 
     # pass and interception detector
     pass_and_interception_detector = PassAndInterceptionDetector()
-    passes = pass_and_interception_detector.detect_passes(ball_acquisition, players_assignment)
-    interceptions = pass_and_interception_detector.detect_interception(ball_acquisition, players_assignment)
+    passes, interceptions = pass_and_interception_detector.detect_passes_and_interceptions(
+        ball_acquisition, players_assignment)
+
+    # possession and events of the game for range queries, see GameIndex
+    GameIndex.build(ball_acquisition, players_assignment, passes, interceptions,
+                    fps=read_video_fps(INPUT_VIDEO_PATH)).save(GAME_INDEX_PATH)
     
 
     # court keypoints detector 
     court_keypoint = court_keypoint_detector.key_court_keypoints(video_frames,
-                                                                 read_from_stub=True,
-                                                                 stub_path="stubs/stub_court_keypoints.pkl"
+                                                                 cache=cache,
+                                                                 video_path=INPUT_VIDEO_PATH
                                                                  )
+    # only when the keypoints were detected, not read from the cache
+    if court_keypoint_detector.detected_frames > 0:
+        print(f"Court keypoints: {court_keypoint_detector.skip_fraction:.0%} of the frames skipped by the motion gate")
+    print(cache)
 
     # Initialize ltactical view converter
     tactical_view_converter = TacticalViewConverter(court_image_path="./images/basketball_court.png")
     court_keypoint = tactical_view_converter.validate_keypoints(court_keypoint)
+
+    # players on the tactical view
+    homographies = tactical_view_converter.get_homographies(court_keypoint)
+    frame_offsets, track_ids, tactical_player_positions = tactical_view_converter.get_tactical_player_positions(
+        player_tracks, homographies)
+    tactical_view_drawer.add_players_layer(frame_offsets, track_ids, tactical_player_positions, players_assignment)
     
     # Draw Object
-    output_video_frames = ball_tracks_drawer.draw(
-        video_frames, 
-        ball_tracks
-        )
+    # every layer is drawn on the same copy of the frame, in a single pass over the video
+    team_ball_control = team_ball_control_drawer.get_team_ball_control(players_assignment, ball_acquisition)
+    ball_control_stats = team_ball_control_drawer.get_ball_control_stats(team_ball_control)
+    pass_stats, interception_stats = pass_and_interception_drawer.get_cumulative_stats(passes, interceptions)
+    court_image = tactical_view_drawer.load_court_image(tactical_view_converter.court_image_path,
+                                                       tactical_view_converter.width,
+                                                       tactical_view_converter.height)
+    frame_compositor = FrameCompositor([
+        DrawerLayer(ball_tracks_drawer, ball_tracks),
+        DrawerLayer(players_tracks_drawer, player_tracks, players_assignment, ball_acquisition),
+        DrawerLayer(team_ball_control_drawer, ball_control_stats),
+        DrawerLayer(pass_and_interception_drawer, pass_stats, interception_stats),
+        DrawerLayer(court_keypoints_drawer, court_keypoint),
+        DrawerLayer(tactical_view_drawer, court_image, tactical_view_converter.key_points)
+        ])
+    output_video_frames = frame_compositor.compose(video_frames)
 
-    output_video_frames = players_tracks_drawer.draw(
-        output_video_frames, 
-        player_tracks,
-        players_assignment,
-        ball_acquisition
-        )
 
-    output_video_frames = team_ball_control_drawer.draw(
-        output_video_frames, 
-        players_assignment, 
-        ball_acquisition
-        )
+    # save video
+    save_video(output_video_frames, OUTPUT_VIDEO_PATH)
 
-    output_video_frames = pass_and_interception_drawer.draw(
-        output_video_frames,
-        passes,
-        interceptions
-        )
 
-    output_video_frames = court_keypoints_drawer.draw(
-        output_video_frames,
-        court_keypoint
-        )
+def main_streaming(batch_size=16, keyframe_interval=1, ball_search_window=None):
+    """
+    Same pipeline as main() but the frames are never kept in memory all together.
 
-    output_video_frames = tactical_view_drawer.draw(
-        output_video_frames,
-        tactical_view_converter.court_image_path,
-        tactical_view_converter.width,
-        tactical_view_converter.height,
-        tactical_view_converter.key_points
-        )    
+    The video is decoded twice: the first pass runs the models chunk by chunk and only keeps
+    the (small) tracks, the second pass draws every frame and writes it right away.
+    Peak memory depends on batch_size (and the reader/writer queue sizes) instead of the
+    length of the video. Decoding and encoding run in background threads and their
+    throughput is printed at the end of each pass.
+    """
+    # Initialize models
+    player_tracker = PlayerTracker("./models/player_detector.pt", keyframe_interval=keyframe_interval)
+    ball_tracker = BallTracker("./models/ball_detector_model.pt", search_window=ball_search_window)
+    court_keypoint_detector = CourtKeypointDetector("./models/court_keypoint_detector.pt")
+    team_assigner = TeamAssigner()
 
+    # look up every stage in the cache first, the first pass only computes what is missing
+    cache = StageCache(CACHE_DIR)
+    player_tracks_key = player_tracker.get_cache_key(cache, INPUT_VIDEO_PATH)
+    ball_tracks_key = ball_tracker.get_cache_key(cache, INPUT_VIDEO_PATH)
+    court_keypoint_key = court_keypoint_detector.get_cache_key(cache, INPUT_VIDEO_PATH)
+    player_tracks = cache.get(player_tracks_key)
+    ball_tracks = cache.get(ball_tracks_key)
+    court_keypoint = cache.get(court_keypoint_key)
+
+    # the tracks can be replayed from the raw detections without running the models
+    player_detections_key = player_tracker.get_detections_cache_key(cache, INPUT_VIDEO_PATH)
+    ball_detections_key = ball_tracker.get_detections_cache_key(cache, INPUT_VIDEO_PATH)
+    if player_tracks is None:
+        player_detections = cache.get(player_detections_key)
+        if player_detections is not None:
+            player_tracks = TrackStore.from_tracks(player_tracker.track_detections(player_detections))
+            cache.put(player_tracks_key, player_tracks)
+    if ball_tracks is None and ball_tracker.search_window is None:
+        ball_detections = cache.get(ball_detections_key)
+        if ball_detections is not None:
+            ball_tracks = TrackStore.from_tracks(ball_tracker.get_tracks_from_detections(ball_detections))
+            cache.put(ball_tracks_key, ball_tracks)
+
+    players_assignment = None
+    if player_tracks is not None:
+        players_assignment = cache.get(team_assigner.get_cache_key(cache, INPUT_VIDEO_PATH, player_tracks))
+
+    compute_player_tracks = player_tracks is None
+    compute_ball_tracks = ball_tracks is None
+    compute_court_keypoint = court_keypoint is None
+    compute_players_assignment = players_assignment is None
+
+    # first pass: detection, tracking and team assignment.
+    # every frame is decoded once and handed to each model with its own batch size
+    if compute_player_tracks or compute_ball_tracks or compute_court_keypoint or compute_players_assignment:
+        scheduler = InferenceScheduler()
+        if compute_player_tracks:
+            scheduler.register("player_tracks", player_tracker.track_frames, player_tracker.batch_size)
+        if compute_ball_tracks:
+            scheduler.register("ball_tracks", ball_tracker.track_frames, ball_tracker.batch_size)
+        if compute_court_keypoint:
+            scheduler.register("court_keypoint", court_keypoint_detector.detect_frames,
+                               court_keypoint_detector.batch_size)
+        if compute_players_assignment:
+            # runs after the player tracker on the same batches, so the tracks of the batch are ready.
+            # the frames are grouped in the team assigner windows, so the result does not
+            # depend on batch_size and matches main()
+            get_player_tracks = (lambda: scheduler.get_results("player_tracks") if compute_player_tracks
+                                 else player_tracks)
+            scheduler.register(
+                "players_assignment",
+                lambda frames, start_frame: team_assigner.get_player_team_for_stream(
+                    frames, start_frame, get_player_tracks()),
+                player_tracker.batch_size,
+                with_frame_num=True,
+                finish=lambda: team_assigner.finish_stream(get_player_tracks())
+            )
+
+        video_reader = ThreadedVideoReader(INPUT_VIDEO_PATH)
+        results = scheduler.run(video_reader, chunk_size=batch_size)
+        print(video_reader.stats)
+        print(scheduler)
+
+        if compute_player_tracks:
+            player_tracks = TrackStore.from_tracks(results["player_tracks"])
+            cache.put(player_tracks_key, player_tracks)
+            player_detections = player_tracker.get_recorded_detections()
+            if player_detections is not None:
+                cache.put(player_detections_key, player_detections)
+        if compute_ball_tracks:
+            ball_tracks = TrackStore.from_tracks(results["ball_tracks"])
+            cache.put(ball_tracks_key, ball_tracks)
+            ball_detections = ball_tracker.get_recorded_detections()
+            if ball_detections is not None:
+                cache.put(ball_detections_key, ball_detections)
+            if ball_tracker.search_window is not None:
+                print(f"Ball: found in the search window on {ball_tracker.window_hit_fraction:.0%} of the frames")
+        if compute_court_keypoint:
+            court_keypoint = court_keypoint_detector.stack_keypoints(results["court_keypoint"])
+            cache.put(court_keypoint_key, court_keypoint)
+            print(f"Court keypoints: {court_keypoint_detector.skip_fraction:.0%} of the frames skipped by the motion gate")
+        if compute_players_assignment:
+            players_assignment = results["players_assignment"]
+            cache.put(team_assigner.get_cache_key(cache, INPUT_VIDEO_PATH, player_tracks), players_assignment)
+    print(cache)
+
+    render_streaming(ball_tracker.ball_filter, player_tracks, ball_tracks, court_keypoint, players_assignment)
+
+
+def render_streaming(ball_filter, player_tracks, ball_tracks, court_keypoint, players_assignment):
+    """
+    Analysis on the tracks and second pass of main_streaming: every frame is decoded again,
+    drawn and written right away.
+
+    Args:
+        ball_filter (BallKalmanFilter): cleans the ball track, see BallTracker.filter_ball_positions
+    """
+    # Remove wrong ball positions and fill the gaps in one pass (Kalman filter)
+    ball_tracks = ball_filter.filter_tracks(ball_tracks)
+
+    # Ball Acquisition
+    ball_acquisition_detector = BallAcquisitionDetector()
+    ball_acquisition = ball_acquisition_detector.detect_ball_possession(player_tracks, ball_tracks)
+
+    # pass and interception detector
+    pass_and_interception_detector = PassAndInterceptionDetector()
+    passes, interceptions = pass_and_interception_detector.detect_passes_and_interceptions(
+        ball_acquisition, players_assignment)
+
+    # possession and events of the game for range queries, see GameIndex
+    GameIndex.build(ball_acquisition, players_assignment, passes, interceptions,
+                    fps=read_video_fps(INPUT_VIDEO_PATH)).save(GAME_INDEX_PATH)
+
+    # Initialize ltactical view converter
+    tactical_view_converter = TacticalViewConverter(court_image_path="./images/basketball_court.png")
+    court_keypoint = tactical_view_converter.validate_keypoints(court_keypoint)
+
+    # Initialize drawers
+    players_tracks_drawer = PlayersTrackDrawer()
+    ball_tracks_drawer = BallTrackDrawer()
+    team_ball_control_drawer = TeamBallControlDrawer(transparency=0.6)
+    pass_and_interception_drawer = PassInterceptionTableDrawer(table_position="top_right", transparency=0.6)
+    court_keypoints_drawer = CourtKeypointsDrawer()
+    tactical_view_drawer = TacticalViewDrawer()
+
+    # players on the tactical view
+    homographies = tactical_view_converter.get_homographies(court_keypoint)
+    frame_offsets, track_ids, tactical_player_positions = tactical_view_converter.get_tactical_player_positions(
+        player_tracks, homographies)
+    tactical_view_drawer.add_players_layer(frame_offsets, track_ids, tactical_player_positions, players_assignment)
+
+    team_ball_control = team_ball_control_drawer.get_team_ball_control(players_assignment, ball_acquisition)
+    # prefix counts, so the tables are O(1) per frame
+    ball_control_stats = team_ball_control_drawer.get_ball_control_stats(team_ball_control)
+    pass_stats, interception_stats = pass_and_interception_drawer.get_cumulative_stats(passes, interceptions)
+    court_image = tactical_view_drawer.load_court_image(tactical_view_converter.court_image_path,
+                                                       tactical_view_converter.width,
+                                                       tactical_view_converter.height)
+
+    # second pass: draw every frame and hand it to the writer thread; the decoded frames are
+    # not used anymore, so the layers draw directly on them
+    frame_compositor = FrameCompositor([
+        DrawerLayer(ball_tracks_drawer, ball_tracks),
+        DrawerLayer(players_tracks_drawer, player_tracks, players_assignment, ball_acquisition),
+        DrawerLayer(team_ball_control_drawer, ball_control_stats),
+        DrawerLayer(pass_and_interception_drawer, pass_stats, interception_stats),
+        DrawerLayer(court_keypoints_drawer, court_keypoint),
+        DrawerLayer(tactical_view_drawer, court_image, tactical_view_converter.key_points)
+        ], copy_frames=False)
+    video_reader = ThreadedVideoReader(INPUT_VIDEO_PATH)
+    with ThreadedVideoWriter(OUTPUT_VIDEO_PATH) as video_writer:
+        for frame in frame_compositor.compose(video_reader):
+            video_writer.write(frame)
+    print(video_reader.stats)
+    print(video_writer.stats)
+
+
+def main_parallel(num_workers=None, batch_size=16, keyframe_interval=1, ball_search_window=None, devices=None):
+    """
+    Same output as main_streaming, but the first pass runs on time segments of the video in
+    a process pool (see SegmentParallelProcessor), the second pass is the one of main_streaming.
+
+    The merged first pass is cached under a key built from the stage keys of main_streaming
+    and the segments. The per-stage entries of main_streaming are not reused or written: the
+    segments are tracked separately, so their results are not the same.
+    """
+    segment_parallel_processor = SegmentParallelProcessor(INPUT_VIDEO_PATH,
+                                                          num_workers=num_workers,
+                                                          batch_size=batch_size,
+                                                          keyframe_interval=keyframe_interval,
+                                                          ball_search_window=ball_search_window,
+                                                          devices=devices)
+    cache = StageCache(CACHE_DIR)
+    player_tracks, ball_tracks, court_keypoint, players_assignment = segment_parallel_processor.run(cache=cache)
+    # only when the first pass ran, not read from the cache
+    if segment_parallel_processor.num_segments > 0:
+        print(f"Segment-parallel first pass: {segment_parallel_processor.num_segments} segments, "
+              f"{segment_parallel_processor.elapsed_time:.1f}s "
+              f"(speedup {segment_parallel_processor.speedup:.1f}x over the segment times)")
+    print(cache)
+
+    render_streaming(BallKalmanFilter(), player_tracks, ball_tracks, court_keypoint, players_assignment)
 
-    # save video
-    save_video(output_video_frames, "output_videos/output_videos.avi")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action="store_true",
+                        help="process the video as a stream with bounded memory")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="number of frames decoded at once in streaming mode")
+    parser.add_argument("--keyframe-interval", type=int, default=1,
+                        help="run the player detector every N frames and propagate the tracks in between")
+    parser.add_argument("--ball-search-window", type=int, default=None,
+                        help="detect the ball on a crop of N pixels around its predicted position "
+                             "(a multiple of 32)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="split the video in time segments processed by N worker processes")
+    parser.add_argument("--devices", type=str, default=None,
+                        help="comma separated devices of the workers, e.g. 0,1 or cpu; every worker "
+                             "loads its own copy of the models")
+    args = parser.parse_args()
+    if args.ball_search_window is not None and args.ball_search_window % 32 != 0:
+        parser.error("--ball-search-window must be a multiple of 32, the stride of the ball model")
+
+    # heavy libraries (ultralytics, torch, transformers...) and model weights are loaded lazily,
+    # so this should stay well under a second; use `python -X importtime main.py` to find a regression
+    print(f"Startup time: {time.perf_counter() - STARTUP_START_TIME:.2f}s")
+
+    if args.workers is not None:
+        main_parallel(num_workers=args.workers, batch_size=args.batch_size,
+                      keyframe_interval=args.keyframe_interval, ball_search_window=args.ball_search_window,
+                      devices=args.devices.split(",") if args.devices else None)
+    elif args.stream:
+        main_streaming(batch_size=args.batch_size, keyframe_interval=args.keyframe_interval,
+                       ball_search_window=args.ball_search_window)
+    else:
+        main(keyframe_interval=args.keyframe_interval, ball_search_window=args.ball_search_window)
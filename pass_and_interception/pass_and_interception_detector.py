@@ -1,7 +1,110 @@
+import numpy as np
+
+
 class PassAndInterceptionDetector():
     def __init__(self):
         pass
 
+    def get_possession_segments(self, ball_acquisition, player_assignment):
+        """
+        Run-length encode the possession: one segment per run of frames with the same holder.
+        Two runs of the same player separated by frames without holder are two segments.
+
+        Args:
+            ball_acquisition (list): holder of the ball on each frame, -1 if nobody
+            player_assignment (list): team of every player on each frame
+
+        Returns:
+            list: segments in order, e.g.
+                {"holder": 28, "team": 1, "start_frame": 10, "end_frame": 35}
+                team is the team of the holder on start_frame, end_frame is included
+        """
+        ball_acquisition = np.asarray(ball_acquisition, dtype=np.int64)
+        if len(ball_acquisition) == 0:
+            return []
+
+        run_starts = np.flatnonzero(np.diff(ball_acquisition, prepend=ball_acquisition[0] - 1))
+        run_ends = np.append(run_starts[1:], len(ball_acquisition)) - 1
+        segments = []
+        for start_frame, end_frame in zip(run_starts.tolist(), run_ends.tolist()):
+            holder = int(ball_acquisition[start_frame])
+            if holder == -1:
+                continue
+            segments.append({"holder": holder,
+                             "team": player_assignment[start_frame].get(holder, -1),
+                             "start_frame": start_frame,
+                             "end_frame": end_frame})
+        return segments
+
+    def get_segments_from_events(self, possession_events, player_assignment):
+        """
+        Build the segments from the possession_start / possession_end events of
+        StreamingBallAcquisitionDetector, without going back to the frames.
+        """
+        segments = []
+        for event in possession_events:
+            if event["event"] != "possession_end":
+                continue
+            segments.append({"holder": event["player_id"],
+                             "team": player_assignment[event["start_frame"]].get(event["player_id"], -1),
+                             "start_frame": event["start_frame"],
+                             "end_frame": event["frame_num"]})
+        return segments
+
+    def detect_events(self, segments, player_assignment):
+        """
+        Find the passes and the interceptions in one pass over the possession segments.
+
+        When the holder changes between two segments, it is a pass if both holders are in the
+        same team, an interception if they are in different teams. The team of the previous
+        holder is the one of the last frame he had the ball.
+
+        Returns:
+            list: sparse events in order, e.g.
+                {"event": "pass", "frame_num": 36, "team": 1}
+                {"event": "interception", "frame_num": 80, "team": 2}
+                team is the team that passed or that intercepted the ball
+        """
+        events = []
+        previous_segment = None
+        for segment in segments:
+            if previous_segment is not None and previous_segment["holder"] != segment["holder"]:
+                previous_team = player_assignment[previous_segment["end_frame"]].get(previous_segment["holder"], -1)
+                current_team = segment["team"]
+
+                if previous_team == current_team and previous_team != -1:
+                    events.append({"event": "pass", "frame_num": segment["start_frame"], "team": previous_team})
+                elif previous_team != current_team and previous_team != -1 and current_team != -1:
+                    events.append({"event": "interception", "frame_num": segment["start_frame"], "team": current_team})
+            previous_segment = segment
+
+        return events
+
+    def get_event_array(self, events, num_frames, event_type):
+        """
+        Dense per-frame array of one type of event, the format used by the drawers.
+
+        Returns:
+            list: team of the event on its frame, -1 on the other frames
+        """
+        event_array = [-1] * num_frames
+        for event in events:
+            if event["event"] == event_type:
+                event_array[event["frame_num"]] = event["team"]
+        return event_array
+
+    def detect_passes_and_interceptions(self, ball_acquisition, player_assignment):
+        """
+        Same output as detect_passes and detect_interception, from a single pass.
+
+        Returns:
+            tuple: (passes, interceptions)
+        """
+        segments = self.get_possession_segments(ball_acquisition, player_assignment)
+        events = self.detect_events(segments, player_assignment)
+        return (self.get_event_array(events, len(ball_acquisition), "pass"),
+                self.get_event_array(events, len(ball_acquisition), "interception"))
+
     def detect_passes(self, ball_acquisition, player_assignment):
         """
         this module count if there is any pass between two teammate
@@ -22,25 +125,9 @@ class PassAndInterceptionDetector():
                     passes = [-1, 1, 2]
                         -1: no pass, 1: team 1 pass, 2: team 2 pass
         """
-        passes = [-1] * len(ball_acquisition)
-        prev_holder = -1
-        prev_frame = -1
-        
-        for frame in range(1, len(ball_acquisition)):
-            if ball_acquisition[frame - 1] != -1:   # if there is a player has the ball
-                prev_holder = ball_acquisition[frame - 1]   
-                prev_frame = frame - 1
-            
-            current_holder = ball_acquisition[frame]
-
-            if prev_holder != -1 and current_holder != -1 and prev_holder != current_holder:
-                prev_team = player_assignment[prev_frame].get(prev_holder, -1)
-                current_team = player_assignment[frame].get(current_holder, -1)
-
-                if prev_team == current_team and prev_team != -1:
-                    passes[frame] = prev_team
-
-        return passes
+        segments = self.get_possession_segments(ball_acquisition, player_assignment)
+        events = self.detect_events(segments, player_assignment)
+        return self.get_event_array(events, len(ball_acquisition), "pass")
 
 
     def detect_interception(self, ball_acquisition, player_assignment):
@@ -63,22 +150,6 @@ class PassAndInterceptionDetector():
                     interceptions = [-1, 1, 2]
                         -1: no interception, 1: team 1 interception, 2: team 2 interception
         """
-        interceptions = [-1] * len(ball_acquisition)
-        prev_holder = -1
-        prev_frame = -1
-        
-        for frame in range(1, len(ball_acquisition)):
-            if ball_acquisition[frame - 1] != -1:   # if there is a player has the ball
-                prev_holder = ball_acquisition[frame - 1]   
-                prev_frame = frame - 1
-            
-            current_holder = ball_acquisition[frame]
-
-            if prev_holder != -1 and current_holder != -1 and prev_holder != current_holder:
-                prev_team = player_assignment[prev_frame].get(prev_holder, -1)
-                current_team = player_assignment[frame].get(current_holder, -1)
-
-                if prev_team != current_team and prev_team != -1 and current_team != -1:
-                    interceptions[frame] = current_team
-
-        return interceptions       
+        segments = self.get_possession_segments(ball_acquisition, player_assignment)
+        events = self.detect_events(segments, player_assignment)
+        return self.get_event_array(events, len(ball_acquisition), "interception")
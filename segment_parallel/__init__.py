@@ -0,0 +1 @@
+from .segment_parallel_processor import SegmentParallelProcessor
@@ -0,0 +1,237 @@
+from utils import ThreadedVideoReader, read_video_frame_count
+from tracker import TrackStitcher, TrackStore
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import os
+import time
+import sys
+sys.path.append("../")
+
+
+def init_worker(device_queue):
+    """
+    Pin the worker process to its device, before torch is imported in it.
+    """
+    device = device_queue.get()
+    # "cpu" hides the GPUs, a GPU index only shows that GPU (cuda:0 in the worker)
+    os.environ["CUDA_VISIBLE_DEVICES"] = "" if device == "cpu" else str(device)
+
+
+def build_stages(config):
+    """
+    Returns:
+        tuple: (player_tracker, ball_tracker, court_keypoint_detector, team_assigner) built from
+            config, the models are only loaded when a frame is processed
+    """
+    from tracker import PlayerTracker, BallTracker
+    from court_keypoint_detector import CourtKeypointDetector
+    from team_assigner import TeamAssigner
+
+    player_tracker = PlayerTracker(config["player_model_path"], keyframe_interval=config["keyframe_interval"])
+    ball_tracker = BallTracker(config["ball_model_path"], search_window=config["ball_search_window"])
+    court_keypoint_detector = CourtKeypointDetector(config["court_keypoint_model_path"])
+    team_assigner = TeamAssigner()
+    return player_tracker, ball_tracker, court_keypoint_detector, team_assigner
+
+
+def process_segment(video_path, segment, config):
+    """
+    First pass (detection, tracking, team assignment, court keypoints) on one segment of the
+    video, in a worker process. The models are loaded in the worker.
+
+    Args:
+        segment (dict): {"start_frame", "end_frame", "read_start"}, the frames read_start..end_frame
+            (excluded) are processed, read_start < start_frame for the overlap
+        config (dict): model paths and parameters, see SegmentParallelProcessor.get_config
+
+    Returns:
+        dict: per-frame results of the segment, from read_start
+    """
+    from inference_scheduler import InferenceScheduler
+
+    player_tracker, ball_tracker, court_keypoint_detector, team_assigner = build_stages(config)
+
+    scheduler = InferenceScheduler()
+    scheduler.register("player_tracks", player_tracker.track_frames, player_tracker.batch_size)
+    scheduler.register("ball_tracks", ball_tracker.track_frames, ball_tracker.batch_size)
+    scheduler.register("court_keypoint", court_keypoint_detector.detect_frames, court_keypoint_detector.batch_size)
+    scheduler.register(
+        "players_assignment",
+        lambda frames, start_frame: team_assigner.get_player_team_for_stream(
+            frames, start_frame, scheduler.get_results("player_tracks")),
+        player_tracker.batch_size,
+        with_frame_num=True,
+        finish=lambda: team_assigner.finish_stream(scheduler.get_results("player_tracks"))
+    )
+
+    start = time.perf_counter()
+    video_reader = ThreadedVideoReader(video_path, start_frame=segment["read_start"], end_frame=segment["end_frame"])
+    results = scheduler.run(video_reader, chunk_size=config["batch_size"])
+    results["court_keypoint"] = court_keypoint_detector.stack_keypoints(results["court_keypoint"])
+    results["elapsed_time"] = time.perf_counter() - start
+    return results
+
+
+class SegmentParallelProcessor():
+    """
+    Run the first pass of main_streaming on time segments of the video in a process pool.
+
+    The video is split in one segment per worker. Every segment also reads overlap frames
+    before its start (the reader seeks with CAP_PROP_POS_FRAMES), they warm up its trackers
+    and are used to stitch its player track ids to the previous segment (TrackStitcher). The
+    overlap frames are then dropped, so the merged results have one entry per frame of the
+    video like the serial pass. The ball, the possession and the passes are computed on the
+    merged tracks, so nothing has to be joined for them.
+
+    Every worker loads its own copy of the player, ball and court models (and CLIP, on the
+    CPU). devices gives the device of each worker, e.g. ["0", "1"] for one worker per GPU or
+    ["cpu"]; the workers take them in turn. Without devices the workers all use the default
+    device, so on a machine with one GPU every worker puts its models on that GPU: use as many
+    workers as copies fit in its memory, or run on the CPU.
+    """
+
+    def __init__(self, video_path, num_workers=None, overlap=30, batch_size=16, keyframe_interval=1,
+                 ball_search_window=None, devices=None):
+        self.video_path = video_path
+        self.num_workers = num_workers if num_workers is not None else os.cpu_count()
+        self.devices = devices
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.keyframe_interval = keyframe_interval
+        self.ball_search_window = ball_search_window
+        self.player_model_path = "./models/player_detector.pt"
+        self.ball_model_path = "./models/ball_detector_model.pt"
+        self.court_keypoint_model_path = "./models/court_keypoint_detector.pt"
+        self.track_stitcher = TrackStitcher()
+        # timing of the last run
+        self.num_segments = 0
+        self.elapsed_time = 0.0
+        self.busy_time = 0.0    # sum of the times of the segments
+        if self.overlap < self.track_stitcher.min_matched_frames:
+            raise ValueError(f"overlap must be at least {self.track_stitcher.min_matched_frames} frames "
+                             f"to stitch the tracks, got {self.overlap}")
+
+    @property
+    def speedup(self):
+        """
+        Speedup of the last run over processing its segments one after the other.
+        """
+        if self.elapsed_time == 0:
+            return 0.0
+        return self.busy_time / self.elapsed_time
+
+    def get_config(self):
+        return {
+            "player_model_path": self.player_model_path,
+            "ball_model_path": self.ball_model_path,
+            "court_keypoint_model_path": self.court_keypoint_model_path,
+            "batch_size": self.batch_size,
+            "keyframe_interval": self.keyframe_interval,
+            "ball_search_window": self.ball_search_window
+        }
+
+    def plan_segments(self, num_frames):
+        """
+        Every segment is at least overlap frames long, so the overlap of the next segment is
+        entirely in it and the tracks can be stitched: there are fewer segments than workers on
+        a short video.
+
+        Returns:
+            list: {"start_frame", "end_frame", "read_start"} of every segment, end_frame excluded
+        """
+        num_segments = max(1, min(self.num_workers, num_frames // self.overlap))
+        segment_length = max(1, -(-num_frames // num_segments))
+        segments = []
+        for start_frame in range(0, max(num_frames, 1), segment_length):
+            segments.append({"start_frame": start_frame,
+                             "end_frame": min(start_frame + segment_length, num_frames),
+                             "read_start": max(start_frame - self.overlap, 0)})
+        # the frame count of the container can be wrong, the last segment reads to the end
+        segments[-1]["end_frame"] = None
+        return segments
+
+    def merge(self, segments, segment_results):
+        """
+        Join the results of the segments, the overlap frames are dropped.
+
+        Returns:
+            tuple: (player_tracks TrackStore, ball_tracks TrackStore, court_keypoint (frames, 18, 2)
+                array, players_assignment)
+        """
+        overlaps = [segment["start_frame"] - segment["read_start"] for segment in segments]
+        player_tracks, id_mappings = self.track_stitcher.stitch(
+            [results["player_tracks"] for results in segment_results], overlaps)
+
+        ball_tracks = []
+        court_keypoint = []
+        players_assignment = []
+        for results, overlap, id_mapping in zip(segment_results, overlaps, id_mappings):
+            ball_tracks.extend(results["ball_tracks"][overlap:])
+            court_keypoint.append(results["court_keypoint"][overlap:])
+            players_assignment.extend(
+                self.track_stitcher.remap_track_ids(results["players_assignment"][overlap:], id_mapping))
+
+        return (TrackStore.from_tracks(player_tracks), TrackStore.from_tracks(ball_tracks),
+                np.concatenate(court_keypoint), players_assignment)
+
+    def get_cache_key(self, cache, segments):
+        """
+        The merged results depend on the parameters of every stage (the keys main_streaming
+        uses for them) and on the segments, which change the tracking and the team assignment.
+        """
+        player_tracker, ball_tracker, court_keypoint_detector, team_assigner = build_stages(self.get_config())
+        params = {
+            "player_tracks": player_tracker.get_cache_key(cache, self.video_path),
+            "ball_tracks": ball_tracker.get_cache_key(cache, self.video_path),
+            "court_keypoints": court_keypoint_detector.get_cache_key(cache, self.video_path),
+            "players_assignment": team_assigner.get_cache_params(),
+            "batch_size": self.batch_size,
+            "segments": segments,
+            "iou_threshold": self.track_stitcher.iou_threshold,
+            "min_matched_frames": self.track_stitcher.min_matched_frames
+        }
+        return cache.make_key("segment_parallel", self.video_path, team_assigner.model_name, params)
+
+    def run(self, cache=None):
+        """
+        Args:
+            cache (StageCache): the merged results are looked up and stored in it, optional
+
+        Returns:
+            tuple: see merge
+        """
+        self.num_segments = 0
+        num_frames = read_video_frame_count(self.video_path)
+        segments = self.plan_segments(num_frames)
+        config = self.get_config()
+
+        if cache is not None:
+            cache_key = self.get_cache_key(cache, segments)
+            merged_results = cache.get(cache_key)
+            if merged_results is not None:
+                return merged_results
+
+        start = time.perf_counter()
+        # spawn: CUDA can not be used in forked workers
+        context = multiprocessing.get_context("spawn")
+        initializer, initargs = None, ()
+        if self.devices:
+            device_queue = context.Queue()
+            for worker in range(len(segments)):
+                device_queue.put(self.devices[worker % len(self.devices)])
+            initializer, initargs = init_worker, (device_queue,)
+        with ProcessPoolExecutor(max_workers=len(segments), mp_context=context,
+                                 initializer=initializer, initargs=initargs) as executor:
+            segment_results = list(executor.map(process_segment,
+                                                [self.video_path] * len(segments),
+                                                segments,
+                                                [config] * len(segments)))
+        self.num_segments = len(segments)
+        self.elapsed_time = time.perf_counter() - start
+        self.busy_time = sum(results["elapsed_time"] for results in segment_results)
+
+        merged_results = self.merge(segments, segment_results)
+        if cache is not None:
+            cache.put(cache_key, merged_results)
+        return merged_results
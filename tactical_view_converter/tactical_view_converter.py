@@ -1,8 +1,8 @@
 import cv2
-from copy import deepcopy
+import numpy as np
 import sys
 sys.path.append("../")
-from utils import measure_distance
+from tracker import TrackStore
 
 
 class TacticalViewConverter():
@@ -42,59 +42,212 @@ class TacticalViewConverter():
             (int(((self.actual_width_in_meters-5.79)/self.actual_width_in_meters)*self.width),int((5.18/self.actual_height_in_meters)*self.height)),
             (int(((self.actual_width_in_meters-5.79)/self.actual_width_in_meters)*self.width),int((10/self.actual_height_in_meters)*self.height)),
         ]
+        self.tactical_distances = None
+        # maximum displacement (pixels) of the keypoints under which the previous homography is reused
+        self.homography_tolerance = 2.0
+        self.homography_reuse_count = 0
 
 
-    def validate_keypoints(self, keypoints_list):
+    def get_tactical_distances(self):
+        """
+        Returns:
+            numpy.ndarray: (18, 18) distances between the tactical keypoints, computed once
+        """
+        if self.tactical_distances is None:
+            key_points = np.array(self.key_points, dtype=np.float64)
+            difference = key_points[:, None, :] - key_points[None, :, :]
+            self.tactical_distances = np.sqrt((difference ** 2).sum(axis=2))
+        return self.tactical_distances
+
+    def get_keypoints_array(self, keypoints_list):
+        """
+        Stack the keypoints detected on every frame.
+
+        Args:
+            keypoints_list (numpy.ndarray or list): (frames, 18, 2) keypoints from
+                CourtKeypointDetector, or ultralytics Keypoints of every frame
 
-        keypoints_list = deepcopy(keypoints_list)
+        Returns:
+            numpy.ndarray: (frames, 18, 2) keypoints in pixels, (0, 0) for the missing ones
+        """
+        if isinstance(keypoints_list, np.ndarray):
+            return keypoints_list.astype(np.float32).reshape(-1, len(self.key_points), 2)
 
+        keypoints_xy = np.zeros((len(keypoints_list), len(self.key_points), 2), dtype=np.float32)
         for frame_idx, frame_keypoints in enumerate(keypoints_list):
-            frame_keypoints = frame_keypoints.xy.tolist()[0]
-            
-            # Get indices of detected keypoints (not (0, 0))
-            detected_indices = [i for i, kp in enumerate(frame_keypoints) if kp[0] >0 and kp[1]>0]
-            
-            # Need at least 3 detected keypoints to validate proportions
-            if len(detected_indices) < 3:
+            if isinstance(frame_keypoints, np.ndarray):
+                keypoints_xy[frame_idx] = frame_keypoints
                 continue
-            
-            invalid_keypoints = []
-            # Validate each detected keypoint
-            for i in detected_indices:
-                # Skip if this is (0, 0)
-                if frame_keypoints[i][0] == 0 and frame_keypoints[i][1] == 0:
-                    continue
-
-                # Choose two other random detected keypoints
-                other_indices = [idx for idx in detected_indices if idx != i and idx not in invalid_keypoints]
-                if len(other_indices) < 2:
-                    continue
-
-                # Take first two other indices for simplicity
-                j, k = other_indices[0], other_indices[1]
-
-                # Calculate distances between detected keypoints
-                d_ij = measure_distance(frame_keypoints[i], frame_keypoints[j])
-                d_ik = measure_distance(frame_keypoints[i], frame_keypoints[k])
-                
-                # Calculate distances between corresponding tactical keypoints
-                t_ij = measure_distance(self.key_points[i], self.key_points[j])
-                t_ik = measure_distance(self.key_points[i], self.key_points[k])
-
-                # Calculate and compare proportions with 50% error margin
-                if t_ij > 0 and t_ik > 0:
-                    prop_detected = d_ij / d_ik if d_ik > 0 else float('inf')
-                    prop_tactical = t_ij / t_ik if t_ik > 0 else float('inf')
-
-                    error = (prop_detected - prop_tactical) / prop_tactical
-                    error = abs(error)
-
-                    if error >0.8:  # 80% error margin                        
-                        keypoints_list[frame_idx].xy[0][i] *= 0
-                        keypoints_list[frame_idx].xyn[0][i] *= 0
-                        invalid_keypoints.append(i)
-            
-        return keypoints_list                
+            xy = frame_keypoints.xy
+            if hasattr(xy, "cpu"):
+                xy = xy.cpu().numpy()
+            if len(xy) == 0:
+                continue
+            keypoints_xy[frame_idx] = xy[0]
+        return keypoints_xy
+
+    def get_valid_keypoints_mask(self, keypoints_xy):
+        """
+        Check the proportions of the detected keypoints of all the frames at once.
+
+        Same rule as the original per-frame loop: on frames with at least 3 detected keypoints,
+        every detected keypoint i (in order) is compared with the first two other detected
+        keypoints j, k that are not already invalid. The keypoint is invalid when the ratio
+        d_ij / d_ik is more than 80% away from the same ratio on the tactical view.
+
+        Args:
+            keypoints_xy (numpy.ndarray): (frames, 18, 2) keypoints, (0, 0) when not detected
+
+        Returns:
+            numpy.ndarray: (frames, 18) True for the detected keypoints that passed the check
+        """
+        keypoints_xy = np.asarray(keypoints_xy, dtype=np.float64)
+        num_frames, num_keypoints = keypoints_xy.shape[:2]
+        frames = np.arange(num_frames)
+        tactical_distances = self.get_tactical_distances()
+
+        detected = (keypoints_xy[..., 0] > 0) & (keypoints_xy[..., 1] > 0)
+        # Need at least 3 detected keypoints to validate proportions
+        enough_detected = detected.sum(axis=1) >= 3
+        valid = detected.copy()
+
+        # each keypoint depends on the ones invalidated before it, so only the frames are vectorized
+        for i in range(num_keypoints):
+            others = valid.copy()
+            others[:, i] = False
+            others_count = np.cumsum(others, axis=1)
+            # Take first two other indices for simplicity
+            j = np.argmax(others_count >= 1, axis=1)
+            k = np.argmax(others_count >= 2, axis=1)
+            to_check = detected[:, i] & enough_detected & (others_count[:, -1] >= 2)
+
+            # Calculate distances between detected keypoints
+            d_ij = np.sqrt(((keypoints_xy[:, i] - keypoints_xy[frames, j]) ** 2).sum(axis=1))
+            d_ik = np.sqrt(((keypoints_xy[:, i] - keypoints_xy[frames, k]) ** 2).sum(axis=1))
+
+            # Calculate distances between corresponding tactical keypoints
+            t_ij = tactical_distances[i, j]
+            t_ik = tactical_distances[i, k]
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                prop_detected = np.where(d_ik > 0, d_ij / d_ik, np.inf)
+                prop_tactical = np.where(t_ik > 0, t_ij / t_ik, np.inf)
+                error = np.abs((prop_detected - prop_tactical) / prop_tactical)
+
+            # 80% error margin
+            is_invalid = to_check & (t_ij > 0) & (t_ik > 0) & (error > 0.8)
+            valid[is_invalid, i] = False
+
+        return valid
+
+    def get_homographies(self, keypoints_xy):
+        """
+        Compute the homography from the frame to the tactical view for every frame.
+
+        The keypoints should already be validated (invalid ones are (0, 0)). A frame needs at
+        least 4 keypoints. When at least 4 of its keypoints were also used for the last computed
+        homography and moved less than homography_tolerance pixels, that homography is reused.
+
+        Args:
+            keypoints_xy (numpy.ndarray): (frames, 18, 2) keypoints from get_keypoints_array
+
+        Returns:
+            numpy.ndarray: (frames, 3, 3) homographies, NaN for the frames without one
+        """
+        keypoints_xy = np.asarray(keypoints_xy, dtype=np.float32)
+        tactical_points = np.array(self.key_points, dtype=np.float32)
+        detected = (keypoints_xy[..., 0] > 0) & (keypoints_xy[..., 1] > 0)
+
+        homographies = np.full((len(keypoints_xy), 3, 3), np.nan)
+        previous_homography = None
+        previous_detected = None
+        previous_keypoints = None
+        for frame_idx in range(len(keypoints_xy)):
+            frame_detected = detected[frame_idx]
+            if frame_detected.sum() < 4:
+                continue
+
+            if previous_homography is not None:
+                common = frame_detected & previous_detected
+                if common.sum() >= 4:
+                    displacement = np.abs(keypoints_xy[frame_idx][common] - previous_keypoints[common]).max()
+                    if displacement < self.homography_tolerance:
+                        homographies[frame_idx] = previous_homography
+                        self.homography_reuse_count += 1
+                        continue
+
+            homography, _ = cv2.findHomography(keypoints_xy[frame_idx][frame_detected],
+                                               tactical_points[frame_detected])
+            if homography is None:
+                continue
+            homographies[frame_idx] = homography
+            previous_homography = homography
+            previous_detected = frame_detected
+            previous_keypoints = keypoints_xy[frame_idx]
+
+        return homographies
+
+    def transform_players_to_tactical(self, player_tracks, homographies):
+        """
+        Project the foot point (bottom center of the bbox) of every player of the video on the
+        tactical view, all the detections at once.
+
+        Args:
+            player_tracks (TrackStore or list): tracks of the players
+            homographies (numpy.ndarray): (frames, 3, 3) homographies from get_homographies
+
+        Returns:
+            numpy.ndarray: (detections, 2) float32 positions on the tactical view, aligned with the
+                rows of the TrackStore (TrackStore.from_tracks(player_tracks) for a list);
+                NaN when the frame has no homography or the player is outside the court
+        """
+        if not isinstance(player_tracks, TrackStore):
+            player_tracks = TrackStore.from_tracks(player_tracks)
+
+        bboxes = player_tracks.bboxes.astype(np.float64)
+        foot_points = np.stack([(bboxes[:, 0] + bboxes[:, 2]) / 2,
+                                bboxes[:, 3],
+                                np.ones(len(bboxes))], axis=1)
+
+        # batched perspectiveTransform: every detection uses the homography of its frame
+        frame_homographies = homographies[player_tracks.frame_indices]
+        projected = np.einsum("nij,nj->ni", frame_homographies, foot_points)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            positions = projected[:, :2] / projected[:, 2:3]
+
+        outside_court = ~((positions[:, 0] >= 0) & (positions[:, 0] <= self.width) &
+                          (positions[:, 1] >= 0) & (positions[:, 1] <= self.height))
+        positions[outside_court] = np.nan
+        return positions.astype(np.float32)
+
+    def get_tactical_player_positions(self, player_tracks, homographies):
+        """
+        Positions of the players on the tactical view as plain arrays, for
+        TacticalViewDrawer.add_players_layer.
+
+        Returns:
+            tuple: (frame_offsets, track_ids, positions), the players of frame i are the rows
+                frame_offsets[i]:frame_offsets[i + 1] of track_ids and positions, see
+                transform_players_to_tactical for the positions
+        """
+        if not isinstance(player_tracks, TrackStore):
+            player_tracks = TrackStore.from_tracks(player_tracks)
+        positions = self.transform_players_to_tactical(player_tracks, homographies)
+        return player_tracks.frame_offsets, player_tracks.track_ids, positions
+
+    def validate_keypoints(self, keypoints_list):
+        """
+        Set the keypoints that fail the proportion check to (0, 0).
+
+        Returns:
+            numpy.ndarray: (frames, 18, 2) validated keypoints, a copy of the input
+        """
+        keypoints_xy = self.get_keypoints_array(keypoints_list)
+        detected = (keypoints_xy[..., 0] > 0) & (keypoints_xy[..., 1] > 0)
+        invalid = detected & ~self.get_valid_keypoints_mask(keypoints_xy)
+
+        keypoints_xy[invalid] = 0
+        return keypoints_xy                
 
 
 
@@ -1 +1,3 @@
 from .team_assigner import TeamAssigner
+from .team_vote_accumulator import TeamVoteAccumulator
+from .color_team_classifier import ColorTeamClassifier
@@ -0,0 +1,127 @@
+import cv2
+import numpy as np
+
+
+class ColorTeamClassifier():
+    """
+    Fast team classifier based on the jersey color.
+
+    The mean Lab color of the torso of each player is clustered in two groups on the first
+    crops of the video, every cluster is then labelled with the team most of its crops got
+    from CLIP. Later crops are classified with a nearest-centroid lookup; crops that are almost
+    as close to both centroids are reported as ambiguous so the caller can fall back to CLIP.
+    """
+
+    def __init__(self, fit_samples=100, min_margin=0.2):
+        # number of crops (with their CLIP team) collected before fitting the clusters
+        self.fit_samples = fit_samples
+        # relative distance gap between the two centroids under which a crop is ambiguous
+        self.min_margin = min_margin
+
+        self.sample_features = []
+        self.sample_teams = []
+        self.centroids = None
+        self.centroid_teams = None
+
+        self.fast_path_count = 0
+        self.fallback_count = 0
+
+    @property
+    def is_fitted(self):
+        return self.centroids is not None
+
+    @property
+    def fallback_rate(self):
+        total = self.fast_path_count + self.fallback_count
+        if total == 0:
+            return 0.0
+        return self.fallback_count / total
+
+    def get_torso_crop(self, crop):
+        # keep the jersey: drop the head, the legs and the arms on the sides
+        height, width = crop.shape[:2]
+        torso = crop[int(0.15 * height):int(0.5 * height), int(0.2 * width):int(0.8 * width)]
+        if torso.size == 0:
+            return crop
+        return torso
+
+    def get_features(self, crops):
+        """
+        Returns:
+            numpy.ndarray: (len(crops), 3) mean Lab color of the torso of each crop
+        """
+        features = np.zeros((len(crops), 3), dtype=np.float32)
+        for i, crop in enumerate(crops):
+            torso = self.get_torso_crop(crop)
+            if torso.size == 0:
+                continue
+            lab_torso = cv2.cvtColor(torso, cv2.COLOR_BGR2LAB)
+            features[i] = lab_torso.reshape(-1, 3).mean(axis=0)
+        return features
+
+    def add_samples(self, features, team_ids):
+        """
+        Store features labelled by CLIP, the clusters are fitted once there are enough of them.
+        """
+        # already fitted (or the fit showed the colors do not separate the teams)
+        if self.centroid_teams is not None:
+            return
+        self.sample_features.extend(features)
+        self.sample_teams.extend(team_ids)
+        if len(self.sample_features) >= self.fit_samples:
+            self.fit(np.array(self.sample_features), np.array(self.sample_teams))
+
+    def fit(self, features, team_ids, num_iterations=20):
+        # 2-means, initialized with the two samples that are the furthest apart
+        distances = np.linalg.norm(features[:, None] - features[None, :], axis=2)
+        first, second = np.unravel_index(distances.argmax(), distances.shape)
+        centroids = features[[first, second]].astype(np.float32)
+
+        for _ in range(num_iterations):
+            labels = self.get_distances(features, centroids).argmin(axis=1)
+            if labels.min() == labels.max():
+                break
+            new_centroids = np.array([features[labels == k].mean(axis=0) for k in range(2)])
+            if np.allclose(new_centroids, centroids):
+                break
+            centroids = new_centroids
+
+        labels = self.get_distances(features, centroids).argmin(axis=1)
+        centroid_teams = []
+        for k in range(2):
+            cluster_teams = team_ids[labels == k]
+            if len(cluster_teams) == 0:
+                centroid_teams.append(-1)
+            else:
+                centroid_teams.append(1 if np.mean(cluster_teams == 1) >= 0.5 else 2)
+
+        self.sample_features = []
+        self.sample_teams = []
+        self.centroid_teams = np.array(centroid_teams)
+        # both clusters voted for the same team: the colors do not separate the teams,
+        # keep using CLIP only
+        if set(centroid_teams) != {1, 2}:
+            return
+        self.centroids = centroids
+
+    def get_distances(self, features, centroids=None):
+        if centroids is None:
+            centroids = self.centroids
+        return np.linalg.norm(features[:, None, :] - centroids[None, :, :], axis=2)
+
+    def predict(self, features):
+        """
+        Returns:
+            tuple: (team_ids, is_ambiguous) arrays, team_ids is -1 for ambiguous crops
+        """
+        distances = self.get_distances(features)
+        nearest = distances.argmin(axis=1)
+        margin = np.abs(distances[:, 0] - distances[:, 1]) / np.maximum(distances.sum(axis=1), 1e-6)
+        is_ambiguous = margin < self.min_margin
+
+        team_ids = self.centroid_teams[nearest]
+        team_ids[is_ambiguous] = -1
+
+        self.fallback_count += int(is_ambiguous.sum())
+        self.fast_path_count += int((~is_ambiguous).sum())
+        return team_ids, is_ambiguous
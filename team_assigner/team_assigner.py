@@ -1,7 +1,8 @@
-from utils import read_stub, save_stub
-from PIL import Image
+from utils import read_stub, save_stub, hash_object
 import cv2
-from transformers import CLIPProcessor, CLIPModel
+import numpy as np
+from .team_vote_accumulator import TeamVoteAccumulator, get_overlapping_players
+from .color_team_classifier import ColorTeamClassifier
 import sys
 sys.path.append("../")
 
@@ -9,35 +10,127 @@ sys.path.append("../")
 class TeamAssigner():
     def __init__(self,
                  team_1_class_name="white shirt",
-                 team_2_class_name="dark red shirt"
+                 team_2_class_name="dark red shirt",
+                 batch_size=32,
+                 use_color_classifier=True
                  ):
 
         self.team_1_class_name = team_1_class_name
         self.team_2_class_name = team_2_class_name
         self.player_team_dict = {}
+        self.model_name = "patrickjohncyh/fashion-clip"
+        self.model = None
+        # number of player crops encoded by CLIP at once
+        self.batch_size = batch_size
+        # crops to classify are collected over this many frames before running the model
+        self.window_size = 30
+        # fraction of a player bbox covered by another player to consider it occluded
+        self.overlap_threshold = 0.2
+        self.team_votes = TeamVoteAccumulator()
+        # number of crops that went through the model
+        self.model_calls = 0
+        # jersey color clustering, CLIP is only used for the crops it is not sure about
+        self.color_classifier = ColorTeamClassifier() if use_color_classifier else None
+        # {player_id: "color" or "clip"}, the classifier used for the latest vote of each player
+        self.player_team_path = {}
+        self.reset_stream()
 
     def load_model(self):
-        self.model = CLIPModel.from_pretrained("patrickjohncyh/fashion-clip")
-        self.processor = CLIPProcessor.from_pretrained(
-            "patrickjohncyh/fashion-clip")
+        # torch/transformers and the CLIP weights are only loaded the first time a crop
+        # has to be classified, a fully cached run never loads them
+        if self.model is not None:
+            return
 
-    def get_player_color(self, frame, bbox):
-        image = frame[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
+        import torch
+        from transformers import CLIPProcessor, CLIPModel
 
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(rgb_image)
+        self.model = CLIPModel.from_pretrained(self.model_name)
+        self.processor = CLIPProcessor.from_pretrained(self.model_name)
 
+        # the two prompts never change, so they are encoded once here instead of for every crop
         classes = [self.team_1_class_name, self.team_2_class_name]
+        text_inputs = self.processor(text=classes, return_tensors="pt", padding=True)
+        with torch.no_grad():
+            text_embeds = self.model.get_text_features(**text_inputs)
+        self.text_embeds = text_embeds / text_embeds.norm(dim=-1, keepdim=True)
+
+    def get_player_crop(self, frame, bbox):
+        return frame[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
+
+    def get_crops_probs(self, crops):
+        """
+        Classify player crops with CLIP in batches of self.batch_size.
+
+        Returns:
+            torch.Tensor: (len(crops), 2) probabilities of team 1 and team 2 for each crop
+        """
+        import torch
+        from PIL import Image
+
+        self.load_model()
 
-        inputs = self.processor(
-            text=classes, images=pil_image, return_tensors="pt", padding=True)
+        probs = []
+        for i in range(0, len(crops), self.batch_size):
+            pil_images = [Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+                          for crop in crops[i:i+self.batch_size]]
+            image_inputs = self.processor(images=pil_images, return_tensors="pt")
 
-        outputs = self.model(**inputs)
-        logits_per_image = outputs.logits_per_image
-        probs = logits_per_image.softmax(dim=1)
+            with torch.no_grad():
+                image_embeds = self.model.get_image_features(**image_inputs)
+            image_embeds = image_embeds / image_embeds.norm(dim=-1, keepdim=True)
 
-        class_name = classes[probs.argmax(dim=1)[0]]
-        return class_name
+            # same logits as CLIPModel.forward (logits_per_image)
+            logits_per_image = self.model.logit_scale.exp() * image_embeds @ self.text_embeds.t()
+            probs.append(logits_per_image.softmax(dim=1))
+            self.model_calls += len(pil_images)
+
+        if not probs:
+            return torch.empty((0, 2))
+        return torch.cat(probs)
+
+    def get_crops_color(self, crops):
+        if not crops:
+            return []
+        classes = [self.team_1_class_name, self.team_2_class_name]
+        probs = self.get_crops_probs(crops)
+        return [classes[class_idx] for class_idx in probs.argmax(dim=1).tolist()]
+
+    def get_player_color(self, frame, bbox):
+        image = self.get_player_crop(frame, bbox)
+        return self.get_crops_color([image])[0]
+
+    def get_crops_team(self, crops):
+        """
+        Classify player crops with the color classifier and fall back to CLIP for the ambiguous
+        ones (or for all of them while the color clusters are not fitted yet).
+
+        Returns:
+            tuple: (team_ids, paths) lists, paths tells which classifier was used ("color" or "clip")
+        """
+        team_ids = [None] * len(crops)
+        paths = ["clip"] * len(crops)
+        clip_indices = list(range(len(crops)))
+
+        features = None
+        if self.color_classifier is not None and crops:
+            features = self.color_classifier.get_features(crops)
+            if self.color_classifier.is_fitted:
+                color_team_ids, is_ambiguous = self.color_classifier.predict(features)
+                for i in np.flatnonzero(~is_ambiguous):
+                    team_ids[i] = int(color_team_ids[i])
+                    paths[i] = "color"
+                clip_indices = np.flatnonzero(is_ambiguous).tolist()
+
+        clip_colors = self.get_crops_color([crops[i] for i in clip_indices])
+        clip_team_ids = [1 if player_color == self.team_1_class_name else 2 for player_color in clip_colors]
+        for i, team_id in zip(clip_indices, clip_team_ids):
+            team_ids[i] = team_id
+
+        # the CLIP results label the samples used to fit the color clusters
+        if features is not None and not self.color_classifier.is_fitted:
+            self.color_classifier.add_samples(features[clip_indices], clip_team_ids)
+
+        return team_ids, paths
 
     def get_player_team(self, frame, player_bbox, player_id):
 
@@ -55,9 +148,131 @@ class TeamAssigner():
 
         return team_id
 
-    def get_player_team_across_frame(self, video_frames, player_tracks, read_from_stub=False, stub_path=None):
+    def get_player_team_for_frame(self, frame, frame_num, player_track):
+        """
+        Assign a team to every player of a single frame, so the assignment can also run
+        while the video is being streamed.
+        """
+        return self.get_player_team_for_window([frame], frame_num, [player_track])[0]
+
+    def get_player_team_for_window(self, frames, start_frame, window_player_tracks):
+        """
+        Assign teams on consecutive frames starting at start_frame.
 
-        self.load_model()
+        Players are only classified when they are new, when their team is still uncertain or
+        right after they overlapped another player (two overlapping players used to be
+        miss-classified, which is why every player was classified again every 30 frames).
+        The crops that need the model are collected over the window and classified together,
+        then the votes are scattered back to player_team_dict.
+        """
+        pending_player_ids = []
+        pending_crops = []
+        pending_frames = []
+        for i, (frame, player_track) in enumerate(zip(frames, window_player_tracks)):
+            player_ids = list(player_track.keys())
+            player_bboxes = [player_track[player_id]["bbox"] for player_id in player_ids]
+            overlapping = get_overlapping_players(player_bboxes, self.overlap_threshold)
+
+            for player_id, bbox, is_overlapping in zip(player_ids, player_bboxes, overlapping):
+                needs_classification = self.team_votes.needs_classification(
+                    player_id, start_frame + i, bool(is_overlapping))
+                if not needs_classification or player_id in pending_player_ids:
+                    continue
+                pending_player_ids.append(player_id)
+                pending_crops.append(self.get_player_crop(frame, bbox))
+                pending_frames.append(start_frame + i)
+
+        team_ids, paths = self.get_crops_team(pending_crops)
+        for player_id, team_id, path, frame_num in zip(pending_player_ids, team_ids, paths, pending_frames):
+            self.team_votes.add_vote(player_id, team_id, frame_num)
+            self.player_team_dict[player_id] = self.team_votes.get_team(player_id)
+            self.player_team_path[player_id] = path
+
+        return [{player_id: self.player_team_dict[player_id] for player_id in player_track}
+                for player_track in window_player_tracks]
+
+    def get_player_team_for_frames(self, frames, start_frame, player_tracks):
+        """
+        Assign teams on a chunk of frames starting at start_frame, player_tracks covers the whole video.
+        The chunk is split in windows of window_size frames, each window is classified in batches.
+        """
+        player_assignment = []
+        window_start = 0
+        while window_start < len(frames):
+            frame_num = start_frame + window_start
+            next_window = (frame_num // self.window_size + 1) * self.window_size
+            window_end = min(len(frames), window_start + next_window - frame_num)
+            window_player_tracks = [player_tracks[start_frame + i] for i in range(window_start, window_end)]
+            player_assignment.extend(self.get_player_team_for_window(
+                frames[window_start:window_end], frame_num, window_player_tracks))
+            window_start = window_end
+
+        return player_assignment
+
+    def reset_stream(self):
+        # frames of the current window, kept until the window is complete
+        self.stream_frames = []
+        self.stream_start_frame = 0
+
+    def get_player_team_for_stream(self, frames, start_frame, player_tracks):
+        """
+        Streaming version of get_player_team_for_frames (InferenceScheduler stage, with
+        finish_stream as its finish). The frames are kept until their window of window_size
+        frames is complete, so the windows, and the assignment, do not depend on the size of
+        the chunks of the stream.
+
+        Returns:
+            list: assignment of the frames of the windows completed by this chunk
+        """
+        if start_frame == 0:
+            self.reset_stream()
+        self.stream_frames.extend(frames)
+
+        window_end = (self.stream_start_frame + len(self.stream_frames)) // self.window_size * self.window_size
+        num_frames = max(window_end - self.stream_start_frame, 0)
+        if num_frames == 0:
+            return []
+
+        player_assignment = self.get_player_team_for_frames(
+            self.stream_frames[:num_frames], self.stream_start_frame, player_tracks)
+        self.stream_frames = self.stream_frames[num_frames:]
+        self.stream_start_frame += num_frames
+        return player_assignment
+
+    def finish_stream(self, player_tracks):
+        """
+        End of the stream: assignment of the frames of the last, incomplete window.
+        """
+        player_assignment = self.get_player_team_for_frames(
+            self.stream_frames, self.stream_start_frame, player_tracks)
+        self.reset_stream()
+        return player_assignment
+
+    def get_cache_params(self):
+        """
+        Parameters that change the assignment, the player tracks aside.
+        """
+        return {
+            "team_1_class_name": self.team_1_class_name,
+            "team_2_class_name": self.team_2_class_name,
+            "overlap_threshold": self.overlap_threshold,
+            "use_color_classifier": self.color_classifier is not None,
+            "fit_samples": self.color_classifier.fit_samples if self.color_classifier is not None else None,
+            "min_margin": self.color_classifier.min_margin if self.color_classifier is not None else None,
+            "window_size": self.window_size,
+            "min_confidence": self.team_votes.min_confidence,
+            "decay": self.team_votes.decay,
+            "min_reclassify_gap": self.team_votes.min_reclassify_gap
+        }
+
+    def get_cache_key(self, cache, video_path, player_tracks):
+        # the assignment depends on the player tracks, so they are part of the key
+        params = self.get_cache_params()
+        params["player_tracks"] = hash_object(player_tracks)
+        return cache.make_key("player_assignment", video_path, self.model_name, params)
+
+    def get_player_team_across_frame(self, video_frames, player_tracks, read_from_stub=False, stub_path=None,
+                                     cache=None, video_path=None):
 
         # read from stub
         player_assignment = read_stub(read_from_stub, stub_path)
@@ -65,20 +280,14 @@ class TeamAssigner():
             if len(player_assignment) == len(video_frames):
                 return player_assignment
 
-        player_assignment = []
-
-        for frame_num, player_track in enumerate(player_tracks):
-            player_assignment.append({})
-
-            if frame_num % 30 == 0:
-                self.player_team_dict = {}  # this line fix:
-                # handle when two or more players overlap, causing the model to miss-classification
-                # => make the model predicts again
+        # the cache is keyed by the content of the video, so it is safe to reuse
+        if cache is not None and video_path is not None:
+            cache_key = self.get_cache_key(cache, video_path, player_tracks)
+            player_assignment = cache.get(cache_key)
+            if player_assignment is not None:
+                return player_assignment
 
-            for player_id, track in player_track.items():
-                team = self.get_player_team(
-                    video_frames[frame_num], track["bbox"], player_id)
-                player_assignment[frame_num][player_id] = team
+        player_assignment = self.get_player_team_for_frames(video_frames, 0, player_tracks)
         """
         
             The result will be like this:
@@ -90,4 +299,6 @@ class TeamAssigner():
 
         """
         save_stub(stub_path, player_assignment)
+        if cache is not None and video_path is not None:
+            cache.put(cache_key, player_assignment)
         return player_assignment
@@ -0,0 +1,92 @@
+import numpy as np
+
+
+def get_overlapping_players(player_bboxes, overlap_threshold):
+    """
+    Find which players of a frame are covered by another player.
+
+    Args:
+        player_bboxes (numpy.ndarray): (n, 4) bboxes of the players of one frame
+        overlap_threshold (float): fraction of a bbox that has to be covered by another bbox
+
+    Returns:
+        numpy.ndarray: (n,) boolean mask, True when the player overlaps another player
+    """
+    player_bboxes = np.asarray(player_bboxes, dtype=np.float32).reshape(-1, 4)
+    if len(player_bboxes) < 2:
+        return np.zeros(len(player_bboxes), dtype=bool)
+
+    x1, y1, x2, y2 = player_bboxes.T
+    intersection_w = np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :])
+    intersection_h = np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :])
+    intersection_area = np.clip(intersection_w, 0, None) * np.clip(intersection_h, 0, None)
+    np.fill_diagonal(intersection_area, 0)
+
+    area = np.maximum((x2 - x1) * (y2 - y1), 1e-6)
+    return (intersection_area / area[:, None] > overlap_threshold).any(axis=1)
+
+
+class TeamVoteAccumulator():
+    """
+    Keep running team votes for every track id instead of classifying players again and again.
+
+    Every classification adds one vote for the predicted team, older votes are decayed so a
+    track id that switched to another player (e.g. after an occlusion) can still flip.
+    The confidence is the smoothed share of votes of the leading team: (votes + 1) / (total + 2).
+    """
+
+    def __init__(self, min_confidence=0.7, decay=0.9, min_reclassify_gap=30):
+        self.min_confidence = min_confidence
+        self.decay = decay
+        # minimum number of frames between two classifications of an uncertain player
+        self.min_reclassify_gap = min_reclassify_gap
+
+        self.votes = {}                 # {player_id: numpy.ndarray([team 1 votes, team 2 votes])}
+        self.last_team = {}             # {player_id: team of the latest vote}
+        self.last_classified_frame = {} # {player_id: frame of the latest vote}
+        self.overlapping = {}           # {player_id: True if the player overlapped someone in its last frame}
+
+    def add_vote(self, player_id, team_id, frame_num):
+        votes = self.votes.get(player_id, np.zeros(2)) * self.decay
+        votes[team_id - 1] += 1
+        self.votes[player_id] = votes
+        self.last_team[player_id] = team_id
+        self.last_classified_frame[player_id] = frame_num
+
+    def get_team(self, player_id):
+        votes = self.votes.get(player_id)
+        if votes is None:
+            return None
+        if votes[0] == votes[1]:
+            return self.last_team[player_id]
+        return 1 if votes[0] > votes[1] else 2
+
+    def get_confidence(self, player_id):
+        votes = self.votes.get(player_id)
+        if votes is None:
+            return 0.0
+        return (votes.max() + 1) / (votes.sum() + 2)
+
+    def needs_classification(self, player_id, frame_num, is_overlapping):
+        """
+        Decide whether the crop of a player has to go through the classifier on this frame.
+        Must be called once per player and per frame, it also tracks the overlap state.
+        """
+        was_overlapping = self.overlapping.get(player_id, False)
+        self.overlapping[player_id] = is_overlapping
+
+        # a new player always needs a team
+        if player_id not in self.votes:
+            return True
+
+        # the crop of an occluded player contains someone else, wait until it is clean again
+        if is_overlapping:
+            return False
+
+        # the occlusion is over: check the player again, the track id may now follow someone else
+        if was_overlapping:
+            return True
+
+        frames_since_last_vote = frame_num - self.last_classified_frame[player_id]
+        return (self.get_confidence(player_id) < self.min_confidence and
+                frames_since_last_vote >= self.min_reclassify_gap)
@@ -1,2 +1,7 @@
 from .ball_tracker import BallTracker
 from .player_tracker import PlayerTracker
+from .track_store import TrackStore, FrameTracks
+from .track_propagator import TrackPropagator
+from .detection_store import DetectionStore
+from .ball_kalman_filter import BallKalmanFilter
+from .track_stitcher import TrackStitcher
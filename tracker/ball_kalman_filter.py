@@ -0,0 +1,151 @@
+import numpy as np
+
+
+class BallKalmanFilter():
+    """
+    Constant velocity Kalman filter over the center of the ball, updated one frame at a time so
+    the ball track can be cleaned in a single pass, without looking ahead in the video.
+
+    A detection is rejected when its Mahalanobis distance to the predicted center is over
+    gate_threshold, a frame without an accepted detection gets the predicted center (the velocity
+    decays during a gap). The track
+    is lost after max_missed_frames frames in a row without an accepted detection, the next
+    detection then starts a new one. The size of the bbox is smoothed over the detections.
+    """
+
+    def __init__(self, process_noise=10.0, measurement_noise=2.0, velocity_std=8.0,
+                 gate_threshold=9.21, max_missed_frames=15, size_smoothing=0.7, velocity_decay=0.6):
+        # std of the acceleration of the ball, in pixels / frame^2
+        self.process_noise = process_noise
+        # std of the detected center, in pixels
+        self.measurement_noise = measurement_noise
+        # std of the velocity of a new track and maximum std of the velocity, in pixels / frame
+        self.velocity_std = velocity_std
+        # squared Mahalanobis distance, 9.21 = 99% of the chi-square distribution with 2 dof
+        self.gate_threshold = gate_threshold
+        self.max_missed_frames = max_missed_frames
+        # weight of the previous size when a detection is accepted
+        self.size_smoothing = size_smoothing
+        # the velocity is multiplied by velocity_decay on every frame without a detection, so
+        # a long gap does not throw the prediction across the court
+        self.velocity_decay = velocity_decay
+
+        # state [x, y, vx, vy], one frame per step
+        self.transition = np.array([[1, 0, 1, 0],
+                                    [0, 1, 0, 1],
+                                    [0, 0, 1, 0],
+                                    [0, 0, 0, 1]], dtype=np.float64)
+        self.observation = np.array([[1, 0, 0, 0],
+                                     [0, 1, 0, 0]], dtype=np.float64)
+        # white noise acceleration
+        noise_gain = np.array([[0.5, 0], [0, 0.5], [1, 0], [0, 1]])
+        self.process_covariance = noise_gain @ noise_gain.T * self.process_noise ** 2
+        self.measurement_covariance = np.eye(2) * self.measurement_noise ** 2
+
+        self.reset()
+
+    def reset(self):
+        self.state = None
+        self.covariance = None
+        self.size = None            # (width, height)
+        self.missed_frames = 0
+        self.rejected_count = 0
+
+    def initialize(self, center):
+        self.state = np.array([center[0], center[1], 0.0, 0.0])
+        self.covariance = np.diag([self.measurement_noise ** 2, self.measurement_noise ** 2,
+                                   self.velocity_std ** 2, self.velocity_std ** 2])
+        self.missed_frames = 0
+
+    def predict(self):
+        if self.missed_frames > 0:
+            self.state[2:] *= self.velocity_decay
+        self.state = self.transition @ self.state
+        self.covariance = self.transition @ self.covariance @ self.transition.T + self.process_covariance
+
+        # the ball has a maximum speed: the velocity uncertainty is capped at velocity_std,
+        # so the gate grows linearly (and not cubically) with the length of a gap
+        velocity_std = np.sqrt(np.diag(self.covariance)[2:])
+        scale = np.ones(4)
+        scale[2:] = np.minimum(1.0, self.velocity_std / velocity_std)
+        self.covariance = self.covariance * np.outer(scale, scale)
+
+    def correct(self, center):
+        """
+        Update the state with a detected center if it passes the gate.
+
+        Returns:
+            bool: True if the detection was accepted
+        """
+        innovation = np.asarray(center) - self.observation @ self.state
+        innovation_covariance = (self.observation @ self.covariance @ self.observation.T +
+                                 self.measurement_covariance)
+        inverse_covariance = np.linalg.inv(innovation_covariance)
+        if innovation @ inverse_covariance @ innovation > self.gate_threshold:
+            self.rejected_count += 1
+            return False
+
+        gain = self.covariance @ self.observation.T @ inverse_covariance
+        self.state = self.state + gain @ innovation
+        self.covariance = (np.eye(4) - gain @ self.observation) @ self.covariance
+        return True
+
+    def update(self, bbox):
+        """
+        Process the next frame.
+
+        Args:
+            bbox (list): detected bbox of the ball [x1, y1, x2, y2], None or [] when not detected
+
+        Returns:
+            list: filtered bbox of the ball, None when there is no track
+        """
+        accepted = False
+        if self.state is not None:
+            self.predict()
+
+        if bbox is not None and len(bbox) == 4:
+            center = ((bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2)
+            size = np.array([bbox[2] - bbox[0], bbox[3] - bbox[1]], dtype=np.float64)
+            if self.state is None:
+                self.initialize(center)
+                accepted = True
+            else:
+                accepted = self.correct(center)
+
+            if accepted:
+                self.missed_frames = 0
+                if self.size is None:
+                    self.size = size
+                else:
+                    self.size = self.size_smoothing * self.size + (1 - self.size_smoothing) * size
+
+        if self.state is None:
+            return None
+        if not accepted:
+            self.missed_frames += 1
+            if self.missed_frames > self.max_missed_frames:
+                # lost, the next detection starts a new track
+                self.state = None
+                self.covariance = None
+                return None
+
+        x, y = self.state[:2]
+        width, height = self.size
+        return [float(x - width / 2), float(y - height / 2), float(x + width / 2), float(y + height / 2)]
+
+    def filter_tracks(self, ball_tracks):
+        """
+        Filter the ball tracks of a chunk of frames, the state is kept for the next chunk.
+
+        Args:
+            ball_tracks (list or TrackStore): [{1: {"bbox": bbox}}] or {} for every frame
+
+        Returns:
+            list: [{1: {"bbox": bbox}}] for every frame, {} when there is no track
+        """
+        filtered_tracks = []
+        for frame_tracks in ball_tracks:
+            bbox = self.update(frame_tracks.get(1, {}).get("bbox"))
+            filtered_tracks.append({1: {"bbox": bbox}} if bbox is not None else {})
+        return filtered_tracks
@@ -1,61 +1,283 @@
-from utils import save_stub, read_stub
-from ultralytics import YOLO
-import supervision as sv
-import pandas as pd
+from utils import save_stub, read_stub, iterate_batches
+from .track_store import TrackStore
+from .detection_store import DetectionStore
+from .ball_kalman_filter import BallKalmanFilter
+from collections import deque
 import numpy as np
 import sys
 sys.path.append("../")
 
 
 class BallTracker():
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path, batch_size=16, search_window=None):
+        self.model_path = model_path
+        self._model = None
+        self.batch_size = batch_size
+        self.conf = 0.5
+        # every ball candidate down to this confidence is kept in the raw detections, so the
+        # selection can be replayed from them with another conf
+        self.detection_conf = 0.1
 
-    def detect_frames(self, frames):
-        batch_size = 16
+        # search-window mode: the ball is detected on a search_window x search_window crop around
+        # its predicted position, at native resolution (None = always detect on the full frame).
+        # ultralytics rounds imgsz up to a multiple of the stride and would resize the crop
+        self.model_stride = 32
+        if search_window is not None and search_window % self.model_stride != 0:
+            raise ValueError(f"search_window must be a multiple of {self.model_stride}, got {search_window}")
+        self.search_window = search_window
+        # frames without the ball after which the prediction is dropped and the full frame is used
+        self.max_missed_frames = 5
+        # cleans the ball track online, see filter_ball_positions
+        self.ball_filter = BallKalmanFilter()
+        self.reset_tracking()
+
+    @property
+    def model(self):
+        # ultralytics and the weights are only loaded when a frame has to be processed,
+        # so a run that only hits the cache does not pay for them
+        if self._model is None:
+            from ultralytics import YOLO
+            self._model = YOLO(self.model_path)
+        return self._model
+
+    def reset_tracking(self):
+        self.frame_count = 0        # frames tracked since the reset, over all the chunks
+        self.ball_history = deque(maxlen=2)  # (frame_num, center) of the last detections
+        self.window_frames = 0
+        self.full_frames = 0
+        # raw detections of the chunks detected on the full frame since the reset
+        self.detection_chunks = []
+        self.ball_filter.reset()
+
+    @property
+    def window_hit_fraction(self):
+        """
+        Fraction of the frames where the ball was found in the search window.
+        """
+        if self.frame_count == 0:
+            return 0.0
+        return self.window_frames / self.frame_count
+
+    def detect_frames(self, frames, imgsz=None, conf=None):
+        predict_args = {"conf": self.detection_conf if conf is None else conf}
+        if imgsz is not None:
+            predict_args["imgsz"] = imgsz
         detections = []
-        for i in range(0, len(frames), batch_size):
-            batch_frames = frames[i:i+batch_size]
-            batch_detections = self.model.predict(batch_frames, conf=0.5)
+        for batch_frames in iterate_batches(frames, self.batch_size):
+            batch_detections = self.model.predict(batch_frames, **predict_args)
             detections.extend(batch_detections)
 
         return detections
 
-    def objects_track(self, frames, read_from_stub=False, stub_path=None):
-        # read from lastest checkpoint
-        tracks = read_stub(read_from_stub, stub_path)
-        if tracks is not None:
-            if len(tracks) == len(frames):
-                return tracks
+    def track_frames(self, frames):
+        """
+        Detect the ball on a chunk of frames, used when the video is processed as a stream.
+        The search window keeps its state between calls.
+        """
+        if self.search_window is not None:
+            return self.track_frames_with_search_window(frames)
 
-        detections = self.detect_frames(frames)
-        tracks = []
-        for frame_num, detection in enumerate(detections):
-            cls_name = detection.names
-            cls_name_inv = {v: k for k, v in cls_name.items()}
+        detections = DetectionStore.from_results(self.detect_frames(frames))
+        self.detection_chunks.append(detections)
+        tracks = self.get_tracks_from_detections(detections)
+        self.frame_count += len(tracks)
+        self.full_frames += len(tracks)
+        return tracks
+
+    def get_recorded_detections(self):
+        """
+        Returns:
+            DetectionStore: raw detections of all the chunks tracked since the reset, None in
+                search-window mode (the frames are not all detected in full)
+        """
+        if self.search_window is not None:
+            return None
+        return DetectionStore.concatenate(self.detection_chunks)
+
+    def predict_ball_center(self, frame_num, from_frame=None):
+        """
+        Constant velocity prediction from the last two detections.
+
+        Args:
+            from_frame (int): frame the prediction is made at (default frame_num), the ball is
+                lost when it was not detected in the max_missed_frames frames before it
+
+        Returns:
+            numpy.ndarray: predicted (x, y) center, None when the ball is lost
+        """
+        if len(self.ball_history) == 0:
+            return None
+        last_frame, last_center = self.ball_history[-1]
+        if (frame_num if from_frame is None else from_frame) - last_frame > self.max_missed_frames:
+            return None
+        if len(self.ball_history) < 2:
+            return last_center
+
+        previous_frame, previous_center = self.ball_history[0]
+        velocity = (last_center - previous_center) / (last_frame - previous_frame)
+        return last_center + velocity * (frame_num - last_frame)
+
+    def get_search_window(self, frame_shape, center):
+        """
+        Returns:
+            tuple: (x1, y1, x2, y2) window of search_window pixels centered on center, moved
+                inside the frame
+        """
+        height, width = frame_shape[:2]
+        size = self.search_window
+        x1 = int(np.clip(round(center[0] - size / 2), 0, max(width - size, 0)))
+        y1 = int(np.clip(round(center[1] - size / 2), 0, max(height - size, 0)))
+        return x1, y1, min(x1 + size, width), min(y1 + size, height)
+
+    def track_frames_with_search_window(self, frames):
+        """
+        Same output as track_frames. While the ball is followed, the detector only runs on the
+        search window around its predicted position (a crop of the frame at native resolution,
+        so the ball is not shrunk by the resize to the input size of the model). The frame is
+        detected in full when there is no prediction or when the ball is not in the window.
+
+        The windows of a chunk are all predicted from the detections before the chunk, so the
+        crops are detected in one batch, and the frames where they missed the ball in a second one.
+        """
+        frames = list(frames)
+        windows = []
+        for i, frame in enumerate(frames):
+            center = self.predict_ball_center(self.frame_count + i, from_frame=self.frame_count)
+            windows.append(self.get_search_window(frame.shape, center) if center is not None else None)
+
+        balls = [None] * len(frames)
+        window_indices = []
+        crops = []
+        for i, window in enumerate(windows):
+            if window is not None:
+                x1, y1, x2, y2 = window
+                window_indices.append(i)
+                crops.append(frames[i][y1:y2, x1:x2])
+        window_detections = self.detect_frames(crops, imgsz=self.search_window, conf=self.conf)
+        for i, detection in zip(window_indices, window_detections):
+            ball = self.select_ball(DetectionStore.from_results([detection]), 0)
+            if ball is not None:
+                x1, y1 = windows[i][:2]
+                balls[i] = [ball[0] + x1, ball[1] + y1, ball[2] + x1, ball[3] + y1]
+                self.window_frames += 1
 
-            detection_supervision = sv.Detections.from_ultralytics(detection)
+        # lost ball or the ball left the window
+        full_indices = [i for i in range(len(frames)) if balls[i] is None]
+        full_detections = self.detect_frames([frames[i] for i in full_indices], conf=self.conf)
+        for i, detection in zip(full_indices, full_detections):
+            balls[i] = self.select_ball(DetectionStore.from_results([detection]), 0)
+        self.full_frames += len(full_indices)
+
+        tracks = []
+        for ball in balls:
             tracks.append({})
-            chosen_bbox = None
-            max_confidence = 0
+            if ball is not None:
+                tracks[-1][1] = {"bbox": ball}
+                center = np.array([(ball[0] + ball[2]) / 2, (ball[1] + ball[3]) / 2])
+                self.ball_history.append((self.frame_count, center))
+            self.frame_count += 1
+
+        return tracks
+
+    def select_ball(self, detections, frame_num):
+        """
+        Args:
+            detections (DetectionStore): raw detections
+            frame_num (int): frame of the store
+
+        Returns:
+            list: bbox of the ball with the highest confidence (at least conf) on the frame,
+                None if there is none
+        """
+        bboxes, confidences, class_ids = detections.get_frame(frame_num)
+        if len(bboxes) == 0:
+            return None
 
-            for frames_detection in detection_supervision:
-                bbox = frames_detection[0].tolist()
-                confidence = frames_detection[2]
-                cls_id = frames_detection[3]
+        is_ball = (class_ids == detections.get_class_id("Ball")) & (confidences >= self.conf)
+        if not is_ball.any():
+            return None
+        # the first one of the highest confidence, like the original loop
+        best = np.argmax(np.where(is_ball, confidences, -1))
+        return bboxes[best].tolist()
 
-                if cls_id == cls_name_inv["Ball"]: # Ball
-                    if confidence > max_confidence:
-                        chosen_bbox = bbox
-                        max_confidence = confidence
+    def get_tracks_from_detections(self, detections):
+        """
+        Args:
+            detections (DetectionStore or list): raw detections, or the ultralytics Results of
+                the frames
+        """
+        if not isinstance(detections, DetectionStore):
+            detections = DetectionStore.from_results(detections)
 
+        tracks = []
+        for frame_num in range(len(detections)):
+            tracks.append({})
+            chosen_bbox = self.select_ball(detections, frame_num)
             if chosen_bbox is not None:
                 tracks[frame_num][1] = {"bbox": chosen_bbox}
 
+        return tracks
+
+    def get_detections_cache_key(self, cache, video_path):
+        params = {"detection_conf": self.detection_conf, "batch_size": self.batch_size}
+        return cache.make_key("ball_detections", video_path, self.model_path, params)
+
+    def get_cache_key(self, cache, video_path):
+        params = {"conf": self.conf, "batch_size": self.batch_size}
+        if self.search_window is not None:
+            params.update({"search_window": self.search_window,
+                           "max_missed_frames": self.max_missed_frames})
+        return cache.make_key("ball_tracks", video_path, self.model_path, params)
+
+    def objects_track(self, frames, read_from_stub=False, stub_path=None, cache=None, video_path=None):
+        # read from lastest checkpoint
+        tracks = read_stub(read_from_stub, stub_path)
+        if tracks is not None:
+            if len(tracks) == len(frames):
+                return tracks
+
+        # the cache is keyed by the content of the video, so it is safe to reuse
+        if cache is not None and video_path is not None:
+            cache_key = self.get_cache_key(cache, video_path)
+            tracks = cache.get(cache_key)
+            if tracks is not None:
+                return tracks
+
+        # columnar storage, indexing it still gives {1: {"bbox": bbox}} for each frame
+        self.reset_tracking()
+        detections = None
+        if cache is not None and video_path is not None and self.search_window is None:
+            detections_key = self.get_detections_cache_key(cache, video_path)
+            detections = cache.get(detections_key)
+
+        if detections is not None:
+            # only the ball selection is run again
+            tracks = TrackStore.from_tracks(self.get_tracks_from_detections(detections))
+        else:
+            tracks = TrackStore.from_tracks(self.track_frames(frames))
+            detections = self.get_recorded_detections()
+            if detections is not None and cache is not None and video_path is not None:
+                cache.put(detections_key, detections)
+
         save_stub(stub_path, tracks)
+        if cache is not None and video_path is not None:
+            cache.put(cache_key, tracks)
         return tracks
 
+    def filter_ball_positions(self, ball_positions):
+        """
+        Remove the wrong ball positions and fill the gaps in a single pass with a Kalman filter
+        (see BallKalmanFilter), in place of remove_wrong_detections and interpolate_ball_positions.
+
+        Nothing is looked ahead, so the positions can be filtered chunk by chunk: the state of
+        the filter is kept between calls until reset_tracking. The frames before the first
+        detection (or after a long gap) stay empty instead of being back-filled.
+        """
+        return self.ball_filter.filter_tracks(ball_positions)
+
     def remove_wrong_detections(self, ball_positions):
+        # the frames are replaced below, so work on a list (tracks may be a TrackStore)
+        ball_positions = list(ball_positions)
         maximum_allowed_distance = 15
         last_good_frame_index = -1
 
@@ -83,6 +305,8 @@ class BallTracker():
         return ball_positions
 
     def interpolate_ball_positions(self, ball_positions):
+        import pandas as pd
+
         ball_positions = [x.get(1, {}).get('bbox', []) for x in ball_positions]
         df_ball_positions = pd.DataFrame(
             ball_positions, columns=['x1', 'y1', 'x2', 'y2'])
@@ -0,0 +1,127 @@
+import json
+import numpy as np
+
+
+class DetectionStore():
+    """
+    Columnar container for the raw detections of the models (every box, not only the tracked
+    ones), so the tracking and the ball selection can be run again without the models.
+
+    Same layout as TrackStore: the rows of frame i are frame_offsets[i]:frame_offsets[i + 1] of
+    bboxes (x1, y1, x2, y2), confidences and class_ids; names maps the class ids of the model to
+    their names.
+    """
+
+    def __init__(self, frame_offsets, bboxes, confidences, class_ids, names):
+        self.frame_offsets = np.asarray(frame_offsets, dtype=np.int64)
+        self.bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+        self.confidences = np.asarray(confidences, dtype=np.float32)
+        self.class_ids = np.asarray(class_ids, dtype=np.int16)
+        self.names = {int(class_id): name for class_id, name in names.items()}
+
+    @classmethod
+    def from_results(cls, results):
+        """
+        Build a store from the ultralytics Results of a list of frames.
+        """
+        frame_offsets = np.zeros(len(results) + 1, dtype=np.int64)
+        bboxes, confidences, class_ids = [], [], []
+        names = {}
+        for frame_num, result in enumerate(results):
+            boxes = result.boxes
+            frame_offsets[frame_num + 1] = frame_offsets[frame_num] + len(boxes)
+            bboxes.append(to_numpy(boxes.xyxy).reshape(-1, 4))
+            confidences.append(to_numpy(boxes.conf).reshape(-1))
+            class_ids.append(to_numpy(boxes.cls).reshape(-1))
+            names = result.names
+
+        if len(results) == 0:
+            return cls(frame_offsets, np.empty((0, 4)), [], [], names)
+        return cls(frame_offsets, np.concatenate(bboxes), np.concatenate(confidences),
+                   np.concatenate(class_ids), names)
+
+    @classmethod
+    def concatenate(cls, stores):
+        """
+        Join the stores of consecutive chunks of a video.
+        """
+        stores = list(stores)
+        if len(stores) == 0:
+            return cls(np.zeros(1), np.empty((0, 4)), [], [], {})
+
+        frame_offsets = [np.zeros(1, dtype=np.int64)]
+        rows = 0
+        for store in stores:
+            frame_offsets.append(store.frame_offsets[1:] + rows)
+            rows += store.frame_offsets[-1]
+        names = {}
+        for store in stores:
+            names.update(store.names)
+        return cls(np.concatenate(frame_offsets),
+                   np.concatenate([store.bboxes for store in stores]),
+                   np.concatenate([store.confidences for store in stores]),
+                   np.concatenate([store.class_ids for store in stores]),
+                   names)
+
+    def slice(self, start, end):
+        """
+        Returns:
+            DetectionStore: the detections of the frames start:end
+        """
+        rows = slice(self.frame_offsets[start], self.frame_offsets[end])
+        return DetectionStore(self.frame_offsets[start:end + 1] - self.frame_offsets[start],
+                              self.bboxes[rows], self.confidences[rows], self.class_ids[rows], self.names)
+
+    def get_class_id(self, name):
+        for class_id, class_name in self.names.items():
+            if class_name == name:
+                return class_id
+        raise KeyError(name)
+
+    def get_frame(self, frame_num):
+        """
+        Return the bboxes, confidences and class ids of one frame as zero-copy views.
+        """
+        start, end = self.frame_offsets[frame_num], self.frame_offsets[frame_num + 1]
+        return self.bboxes[start:end], self.confidences[start:end], self.class_ids[start:end]
+
+    def to_supervision(self, frame_num, min_confidence=None):
+        """
+        Returns:
+            supervision.Detections: the detections of the frame, the ones under min_confidence removed
+        """
+        import supervision as sv
+
+        bboxes, confidences, class_ids = self.get_frame(frame_num)
+        if min_confidence is not None:
+            keep = confidences >= min_confidence
+            bboxes, confidences, class_ids = bboxes[keep], confidences[keep], class_ids[keep]
+        return sv.Detections(xyxy=bboxes.copy(),
+                             confidence=confidences.copy(),
+                             class_id=class_ids.astype(int))
+
+    def __len__(self):
+        return len(self.frame_offsets) - 1
+
+    @property
+    def nbytes(self):
+        return (self.frame_offsets.nbytes + self.bboxes.nbytes +
+                self.confidences.nbytes + self.class_ids.nbytes)
+
+    def save(self, path):
+        np.savez(path, frame_offsets=self.frame_offsets, bboxes=self.bboxes,
+                 confidences=self.confidences, class_ids=self.class_ids,
+                 names=np.array(json.dumps(self.names)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["frame_offsets"], data["bboxes"], data["confidences"], data["class_ids"],
+                       json.loads(str(data["names"])))
+
+
+def to_numpy(values):
+    # ultralytics boxes are torch tensors, possibly on the GPU
+    if hasattr(values, "cpu"):
+        values = values.cpu().numpy()
+    return np.asarray(values)
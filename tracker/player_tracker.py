@@ -1,54 +1,290 @@
-from utils import save_stub, read_stub
-from ultralytics import YOLO
-import supervision as sv
+from utils import save_stub, read_stub, iterate_batches, measure_iou
+from .track_store import TrackStore
+from .detection_store import DetectionStore
+from .track_propagator import TrackPropagator
+import numpy as np
+import time
 import sys
 sys.path.append("../")
 
 
 class PlayerTracker():
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
-        self.tracker = sv.ByteTrack()
+    def __init__(self, model_path, batch_size=16, keyframe_interval=1, min_track_confidence=None):
+        self.model_path = model_path
+        self._model = None
+        self._tracker = None
+        self.batch_size = batch_size
+        self.conf = 0.5
+        # the raw detections are kept down to this confidence, so the tracking can be replayed
+        # from them with another conf (the tracker only sees the detections over conf)
+        self.detection_conf = 0.1
+
+        # the detector only runs every keyframe_interval frames, the bboxes in between are
+        # propagated with the motion of each track (1 = detect every frame)
+        self.keyframe_interval = keyframe_interval
+        # adaptive mode: when the mean confidence of the tracked players of a keyframe is under
+        # this value, the next frame is a keyframe too. The regular keyframes stay on the
+        # multiples of keyframe_interval, so they can still be detected in batches
+        self.min_track_confidence = min_track_confidence
+        self.reset_tracking()
+
+    @property
+    def model(self):
+        # ultralytics and the weights are only loaded when a frame has to be processed,
+        # so a run that only hits the cache does not pay for them
+        if self._model is None:
+            from ultralytics import YOLO
+            self._model = YOLO(self.model_path)
+        return self._model
+
+    @property
+    def tracker(self):
+        if self._tracker is None:
+            import supervision as sv
+            self._tracker = sv.ByteTrack()
+        return self._tracker
+
+    @property
+    def uses_keyframes(self):
+        return self.keyframe_interval > 1 or self.min_track_confidence is not None
+
+    def reset_tracking(self):
+        self._tracker = None
+        self.propagator = TrackPropagator()
+        self.frame_count = 0        # frames tracked since the reset, over all the chunks
+        self.next_keyframe = 0
+        self.last_track_confidence = None
+        self.detected_frames = 0
+        # raw detections of the chunks tracked since the reset (every frame detected only)
+        self.detection_chunks = []
 
     def detect_frames(self, frames):
-        batch_size = 16
         detections = []
-        for i in range(0, len(frames), batch_size):
-            batch_frames = frames[i:i+batch_size]
-            batch_detections = self.model.predict(batch_frames, conf=0.5)
+        for batch_frames in iterate_batches(frames, self.batch_size):
+            batch_detections = self.model.predict(batch_frames, conf=self.detection_conf)
             detections.extend(batch_detections)
 
         return detections
 
-    def objects_track(self, frames, read_from_stub=False, stub_path=None):
-        # doc tu checkpoint gan nhat => tiet kiem thoi gian thuc thi code
-        tracks = read_stub(read_from_stub, stub_path)
-        if tracks is not None:
-            if len(tracks) == len(frames):
-                return tracks
+    def track_frames(self, frames):
+        """
+        Detect and track players on a chunk of frames. ByteTrack keeps its state between
+        calls, so a video can be processed chunk by chunk without holding all of its frames.
+        """
+        if self.uses_keyframes:
+            return self.track_frames_with_keyframes(frames)
+
+        detections = DetectionStore.from_results(self.detect_frames(frames))
+        self.detection_chunks.append(detections)
+        return self.track_detections(detections)
+
+    def track_detections(self, detections):
+        """
+        Run the tracking on detections that are already computed, e.g. replay it from the
+        DetectionStore in the cache with other parameters, without the model.
+        """
+        if self.uses_keyframes:
+            # the keyframes take their detections from the store
+            return self.track_keyframes(len(detections), lambda i: detections.slice(i, i + 1))
 
-        detections = self.detect_frames(frames)
+        tracks = self.get_tracks_from_detections(detections)
+        self.frame_count += len(tracks)
+        self.detected_frames += len(tracks)
+        return tracks
+
+    def get_recorded_detections(self):
+        """
+        Returns:
+            DetectionStore: raw detections of all the chunks tracked since the reset, None when
+                some frames were not detected (keyframe mode)
+        """
+        if self.uses_keyframes:
+            return None
+        return DetectionStore.concatenate(self.detection_chunks)
+
+    def track_frames_with_keyframes(self, frames):
+        """
+        Same output as track_frames, but the detector and ByteTrack only run on the keyframes.
+        """
+        frames = list(frames)
+
+        # the regular keyframes do not depend on the results, detect them all in batches
+        keyframe_indices = [i for i in range(len(frames))
+                            if (self.frame_count + i) % self.keyframe_interval == 0
+                            and self.frame_count + i >= self.next_keyframe]
+        keyframe_detections = dict(zip(keyframe_indices,
+                                       self.detect_frames([frames[i] for i in keyframe_indices])))
+
+        def get_detection(i):
+            if i in keyframe_detections:
+                return [keyframe_detections[i]]
+            # extra keyframe of the adaptive mode, after a low confidence keyframe
+            return self.detect_frames([frames[i]])
+
+        return self.track_keyframes(len(frames), get_detection)
+
+    def track_keyframes(self, num_frames, get_detection):
+        """
+        Keyframe loop shared by the inference and the replay.
+
+        Args:
+            num_frames (int): number of frames of the chunk
+            get_detection (callable): get_detection(i) returns the detections of the i-th frame
+                of the chunk (a list of one Results or a DetectionStore of one frame), only
+                called on the keyframes
+        """
         tracks = []
+        for i in range(num_frames):
+            if self.frame_count < self.next_keyframe:
+                tracks.append(self.propagator.predict(self.frame_count))
+                self.frame_count += 1
+                continue
 
-        for frame_num, detection in enumerate(detections):
-            cls_name = detection.names
-            cls_name_inv = {v: k for k, v in cls_name.items()}
+            frame_tracks = self.get_tracks_from_detections(get_detection(i))[0]
+            self.propagator.update(self.frame_count, frame_tracks)
+            tracks.append(frame_tracks)
+            self.detected_frames += 1
 
-            # convert from YOLO format to supervision format so we can use self.tracker
-            detection_supervision = sv.Detections.from_ultralytics(detection)
+            low_confidence = (self.min_track_confidence is not None and
+                              self.last_track_confidence is not None and
+                              self.last_track_confidence < self.min_track_confidence)
+            if low_confidence:
+                self.next_keyframe = self.frame_count + 1
+            else:
+                self.next_keyframe = (self.frame_count // self.keyframe_interval + 1) * self.keyframe_interval
+            self.frame_count += 1
+
+        return tracks
+
+    def get_tracks_from_detections(self, detections):
+        """
+        Args:
+            detections (DetectionStore or list): raw detections, or the ultralytics Results of
+                the frames
+        """
+        if not isinstance(detections, DetectionStore):
+            detections = DetectionStore.from_results(detections)
+
+        tracks = []
+        player_class_id = detections.get_class_id("Player") if len(detections.names) > 0 else None
+
+        for frame_num in range(len(detections)):
+            # convert to supervision format so we can use self.tracker
+            detection_supervision = detections.to_supervision(frame_num, min_confidence=self.conf)
             detection_with_track = self.tracker.update_with_detections(
                 detection_supervision)
 
             # tao mot dict rong de chua cac bbox trong frame_num do
             tracks.append({})
 
+            player_confidences = []
             for frames_detection in detection_with_track:
                 bbox = frames_detection[0].tolist()
+                confidence = frames_detection[2]
                 cls_id = frames_detection[3]
                 track_id = int(frames_detection[4])
 
-                if cls_id == cls_name_inv["Player"]:
+                if cls_id == player_class_id:
                     tracks[frame_num][track_id] = {"bbox": bbox}
+                    if confidence is not None:
+                        player_confidences.append(float(confidence))
+
+            # used by the adaptive keyframe mode
+            self.last_track_confidence = float(np.mean(player_confidences)) if player_confidences else 0.0
+
+        return tracks
+
+    def evaluate_keyframe_intervals(self, frames, keyframe_intervals=(1, 2, 3, 5, 8)):
+        """
+        Measure the speed / accuracy trade-off of the keyframe mode on a clip.
+
+        The tracks with a detection on every frame are the reference, the accuracy of an
+        interval is the mean IoU between every reference bbox and its best match (the track ids
+        can differ between the runs).
+
+        Returns:
+            list: one dict per interval with keyframe_interval, fps, speedup and mean_iou
+        """
+        frames = list(frames)
+        keyframe_interval, min_track_confidence = self.keyframe_interval, self.min_track_confidence
+        self.min_track_confidence = None
+
+        results = []
+        reference_tracks = None
+        reference_fps = None
+        for interval in sorted(set([1] + list(keyframe_intervals))):
+            self.keyframe_interval = interval
+            self.reset_tracking()
+            start_time = time.perf_counter()
+            tracks = self.track_frames(frames)
+            fps = len(frames) / max(time.perf_counter() - start_time, 1e-9)
+
+            if reference_tracks is None:
+                reference_tracks, reference_fps = tracks, fps
+
+            ious = []
+            for reference_frame, frame_tracks in zip(reference_tracks, tracks):
+                if len(reference_frame) == 0:
+                    continue
+                reference_bboxes = [track["bbox"] for track in reference_frame.values()]
+                bboxes = [track["bbox"] for track in frame_tracks.values()]
+                if len(bboxes) == 0:
+                    ious.extend([0.0] * len(reference_bboxes))
+                    continue
+                ious.extend(measure_iou(reference_bboxes, bboxes).max(axis=1))
+
+            results.append({"keyframe_interval": interval,
+                            "fps": fps,
+                            "speedup": fps / reference_fps,
+                            "mean_iou": float(np.mean(ious)) if ious else 1.0})
+
+        self.keyframe_interval, self.min_track_confidence = keyframe_interval, min_track_confidence
+        self.reset_tracking()
+        return results
+
+    def get_detections_cache_key(self, cache, video_path):
+        params = {"detection_conf": self.detection_conf, "batch_size": self.batch_size}
+        return cache.make_key("player_detections", video_path, self.model_path, params)
+
+    def get_cache_key(self, cache, video_path):
+        params = {"conf": self.conf, "batch_size": self.batch_size}
+        if self.uses_keyframes:
+            params.update({"keyframe_interval": self.keyframe_interval,
+                           "min_track_confidence": self.min_track_confidence})
+            if self.min_track_confidence is not None:
+                # the regular keyframes stay on the interval grid after an extra keyframe
+                params["keyframe_grid"] = True
+        return cache.make_key("player_tracks", video_path, self.model_path, params)
+
+    def objects_track(self, frames, read_from_stub=False, stub_path=None, cache=None, video_path=None):
+        # doc tu checkpoint gan nhat => tiet kiem thoi gian thuc thi code
+        tracks = read_stub(read_from_stub, stub_path)
+        if tracks is not None:
+            if len(tracks) == len(frames):
+                return tracks
+
+        # the cache is keyed by the content of the video, so it is safe to reuse
+        if cache is not None and video_path is not None:
+            cache_key = self.get_cache_key(cache, video_path)
+            tracks = cache.get(cache_key)
+            if tracks is not None:
+                return tracks
+
+        # columnar storage, indexing it still gives {track_id: {"bbox": bbox}} for each frame
+        self.reset_tracking()
+        detections = None
+        if cache is not None and video_path is not None:
+            detections_key = self.get_detections_cache_key(cache, video_path)
+            detections = cache.get(detections_key)
+
+        if detections is not None:
+            # only the tracking is run again
+            tracks = TrackStore.from_tracks(self.track_detections(detections))
+        else:
+            tracks = TrackStore.from_tracks(self.track_frames(frames))
+            detections = self.get_recorded_detections()
+            if detections is not None and cache is not None and video_path is not None:
+                cache.put(detections_key, detections)
         """
             the result would be like this:
             tracks = [
@@ -65,4 +301,6 @@ class PlayerTracker():
             ]
         """
         save_stub(stub_path, tracks)
+        if cache is not None and video_path is not None:
+            cache.put(cache_key, tracks)
         return tracks
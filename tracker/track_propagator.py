@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class TrackPropagator():
+    """
+    Predict the bboxes of the tracks between two keyframes with a constant velocity model.
+
+    The velocity of every track is estimated from its bboxes on the last keyframes (smoothed
+    over keyframes), the same motion model as the Kalman filter of ByteTrack, whose state is
+    not exposed by supervision.
+    """
+
+    def __init__(self, velocity_smoothing=0.5):
+        # weight of the previous velocity when a new keyframe is seen
+        self.velocity_smoothing = velocity_smoothing
+        self.last_frame = None
+        self.last_bboxes = {}   # {track_id: numpy.ndarray([x1, y1, x2, y2])}
+        self.velocities = {}    # {track_id: numpy.ndarray, bbox change per frame}
+
+    def update(self, frame_num, frame_tracks):
+        """
+        Record the tracks of a keyframe, the tracks that are not in it are dropped.
+        """
+        steps = frame_num - self.last_frame if self.last_frame is not None else 0
+        last_bboxes = {}
+        velocities = {}
+        for track_id, track in frame_tracks.items():
+            bbox = np.asarray(track["bbox"], dtype=np.float64)
+            velocity = np.zeros(4)
+            if track_id in self.last_bboxes and steps > 0:
+                velocity = (bbox - self.last_bboxes[track_id]) / steps
+                if track_id in self.velocities:
+                    velocity = (self.velocity_smoothing * self.velocities[track_id] +
+                                (1 - self.velocity_smoothing) * velocity)
+            last_bboxes[track_id] = bbox
+            velocities[track_id] = velocity
+
+        self.last_frame = frame_num
+        self.last_bboxes = last_bboxes
+        self.velocities = velocities
+
+    def predict(self, frame_num):
+        """
+        Returns:
+            dict: {track_id: {"bbox": [x1, y1, x2, y2]}} predicted for frame_num
+        """
+        if self.last_frame is None:
+            return {}
+        steps = frame_num - self.last_frame
+        return {track_id: {"bbox": (bbox + self.velocities[track_id] * steps).tolist()}
+                for track_id, bbox in self.last_bboxes.items()}
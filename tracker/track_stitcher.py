@@ -0,0 +1,106 @@
+from utils import measure_iou
+import numpy as np
+import sys
+sys.path.append("../")
+
+
+class TrackStitcher():
+    """
+    Join the tracks of consecutive segments of a video that were tracked separately (each
+    segment has its own ByteTrack, so its own track ids).
+
+    Every segment after the first one starts with overlap frames that are also the last frames
+    of the previous segment. The tracks of both segments on these frames are matched greedily
+    by their summed IoU, a matched track keeps the id of the previous segment and the other
+    tracks get new ids.
+    """
+
+    def __init__(self, iou_threshold=0.5, min_matched_frames=3):
+        # a pair of tracks only counts on the frames where their bboxes overlap this much
+        self.iou_threshold = iou_threshold
+        # number of overlap frames a pair of tracks has to match on to be the same track
+        self.min_matched_frames = min_matched_frames
+
+    def match_track_ids(self, previous_tracks, next_tracks):
+        """
+        Args:
+            previous_tracks (list): {track_id: {"bbox": bbox}} of the overlap frames, from the
+                previous segment
+            next_tracks (list): the same frames from the next segment
+
+        Returns:
+            dict: {track id of the next segment: track id of the previous segment}
+        """
+        scores = {}
+        matched_frames = {}
+        for previous_frame, next_frame in zip(previous_tracks, next_tracks):
+            if len(previous_frame) == 0 or len(next_frame) == 0:
+                continue
+            previous_ids = list(previous_frame.keys())
+            next_ids = list(next_frame.keys())
+            ious = measure_iou([previous_frame[track_id]["bbox"] for track_id in previous_ids],
+                               [next_frame[track_id]["bbox"] for track_id in next_ids])
+
+            for i, j in zip(*np.nonzero(ious >= self.iou_threshold)):
+                pair = (next_ids[j], previous_ids[i])
+                scores[pair] = scores.get(pair, 0.0) + float(ious[i, j])
+                matched_frames[pair] = matched_frames.get(pair, 0) + 1
+
+        # greedy: the pairs with the most overlap first, every track is used once
+        matches = {}
+        used_previous_ids = set()
+        for (next_id, previous_id), _ in sorted(scores.items(), key=lambda item: -item[1]):
+            if next_id in matches or previous_id in used_previous_ids:
+                continue
+            if matched_frames[(next_id, previous_id)] < self.min_matched_frames:
+                continue
+            matches[next_id] = previous_id
+            used_previous_ids.add(previous_id)
+
+        return matches
+
+    def remap_track_ids(self, tracks, id_mapping):
+        """
+        Returns:
+            list: the frames with their keys replaced by id_mapping (works for the tracks and
+                for the team assignment, both are keyed by track id)
+        """
+        return [{id_mapping[track_id]: value for track_id, value in frame.items()} for frame in tracks]
+
+    def stitch(self, segment_tracks, overlaps):
+        """
+        Args:
+            segment_tracks (list): tracks of every segment (list of {track_id: {"bbox": bbox}})
+            overlaps (list): number of frames each segment shares with the previous one (0 for
+                the first segment)
+
+        Returns:
+            tuple: (tracks of the whole video, one {segment track id: video track id} mapping
+                per segment)
+        """
+        tracks = []
+        id_mappings = []
+        next_track_id = 1
+        previous_tracks = None
+        for frames, overlap in zip(segment_tracks, overlaps):
+            frames = [dict(frame.items()) for frame in frames]
+            matches = {}
+            if previous_tracks is not None and overlap > 0:
+                matches = self.match_track_ids(previous_tracks[len(previous_tracks) - overlap:], frames[:overlap])
+
+            id_mapping = {}
+            for frame in frames:
+                for track_id in frame:
+                    if track_id in id_mapping:
+                        continue
+                    if track_id in matches:
+                        id_mapping[track_id] = id_mappings[-1][matches[track_id]]
+                    else:
+                        id_mapping[track_id] = next_track_id
+                        next_track_id += 1
+
+            tracks.extend(self.remap_track_ids(frames[overlap:], id_mapping))
+            id_mappings.append(id_mapping)
+            previous_tracks = frames
+
+        return tracks, id_mappings
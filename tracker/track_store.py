@@ -0,0 +1,118 @@
+from collections.abc import Mapping
+import numpy as np
+
+
+class FrameTracks(Mapping):
+    """
+    Read-only view of the tracks of one frame that behaves like the old
+    {track_id: {"bbox": [x1, y1, x2, y2]}} dictionary, so existing consumers keep working.
+
+    track_ids and bboxes are views on the arrays of the TrackStore, nothing is copied
+    until a bbox is asked for.
+    """
+
+    def __init__(self, track_ids, bboxes):
+        self.track_ids = track_ids
+        self.bboxes = bboxes
+
+    def __getitem__(self, track_id):
+        index = np.flatnonzero(self.track_ids == track_id)
+        if len(index) == 0:
+            raise KeyError(track_id)
+        return {"bbox": self.bboxes[index[0]].tolist()}
+
+    def __iter__(self):
+        return iter(self.track_ids.tolist())
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def items(self):
+        return [(track_id, {"bbox": bbox})
+                for track_id, bbox in zip(self.track_ids.tolist(), self.bboxes.tolist())]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class TrackStore():
+    """
+    Columnar container for the tracks of a whole video.
+
+    Every detection is one row of contiguous arrays (frame_indices, track_ids, bboxes) and the
+    rows of frame i are frame_offsets[i]:frame_offsets[i + 1]. Indexing the store returns a
+    FrameTracks adapter, so the store can be used where the old list of dicts was used:
+
+        tracks = [
+            {101: {"bbox": [10, 20, 50, 80]}, 102: {"bbox": [60, 30, 100, 90]}},
+            {101: {"bbox": [12, 22, 52, 82]}}
+        ]
+        store = TrackStore.from_tracks(tracks)
+        store[0][101]["bbox"]       # [10.0, 20.0, 50.0, 80.0]
+        store.get_frame(1)          # (array([101]), array([[12., 22., 52., 82.]], dtype=float32))
+    """
+
+    def __init__(self, frame_offsets, track_ids, bboxes):
+        self.frame_offsets = np.asarray(frame_offsets, dtype=np.int64)
+        self.track_ids = np.asarray(track_ids, dtype=np.int32)
+        # the detectors output float32 boxes, so float32 keeps them exact
+        self.bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+        self.frame_indices = np.repeat(np.arange(len(self.frame_offsets) - 1, dtype=np.int32),
+                                       np.diff(self.frame_offsets))
+
+    @classmethod
+    def from_tracks(cls, tracks):
+        """
+        Build a store from the list of dicts returned by the trackers.
+        """
+        counts = [len(frame_tracks) for frame_tracks in tracks]
+        frame_offsets = np.zeros(len(tracks) + 1, dtype=np.int64)
+        frame_offsets[1:] = np.cumsum(counts)
+
+        track_ids = np.empty(frame_offsets[-1], dtype=np.int32)
+        bboxes = np.empty((frame_offsets[-1], 4), dtype=np.float32)
+        row = 0
+        for frame_tracks in tracks:
+            for track_id, track in frame_tracks.items():
+                track_ids[row] = track_id
+                bboxes[row] = track["bbox"]
+                row += 1
+
+        return cls(frame_offsets, track_ids, bboxes)
+
+    def to_tracks(self):
+        return [dict(self[frame_num].items()) for frame_num in range(len(self))]
+
+    def get_frame(self, frame_num):
+        """
+        Return the track ids and bboxes of one frame as zero-copy views.
+        """
+        start, end = self.frame_offsets[frame_num], self.frame_offsets[frame_num + 1]
+        return self.track_ids[start:end], self.bboxes[start:end]
+
+    def __len__(self):
+        return len(self.frame_offsets) - 1
+
+    def __getitem__(self, frame_num):
+        if frame_num < 0:
+            frame_num += len(self)
+        if frame_num < 0 or frame_num >= len(self):
+            raise IndexError("frame index out of range")
+        return FrameTracks(*self.get_frame(frame_num))
+
+    def __iter__(self):
+        for frame_num in range(len(self)):
+            yield self[frame_num]
+
+    @property
+    def nbytes(self):
+        return (self.frame_offsets.nbytes + self.track_ids.nbytes +
+                self.bboxes.nbytes + self.frame_indices.nbytes)
+
+    def save(self, path):
+        np.savez(path, frame_offsets=self.frame_offsets, track_ids=self.track_ids, bboxes=self.bboxes)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["frame_offsets"], data["track_ids"], data["bboxes"])
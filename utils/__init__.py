@@ -1,3 +1,7 @@
-from .video_utils import read_video, save_video
+from .video_utils import (read_video, read_video_stream, read_video_fps, read_video_frame_count,
+                          iterate_batches, save_video,
+                          ThreadedVideoReader, ThreadedVideoWriter)
 from .stub_utils import save_stub, read_stub
-from .bbox_utils import get_center_of_bbox, get_bbox_width, measure_distance, get_center_of_bbox
+from .stage_cache import StageCache, hash_file, hash_object
+from .bbox_utils import get_center_of_bbox, get_bbox_width, measure_distance, get_center_of_bbox, measure_iou
+from .cumulative_stats import CumulativeStats
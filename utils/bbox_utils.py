@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def get_center_of_bbox(bbox):
     x1, y1, x2, y2 = bbox
     return int((x1+x2)/2), int((y1+y2)/2)
@@ -12,3 +15,27 @@ def measure_distance(p1, p2):
 
 
 
+
+
+def measure_iou(bboxes_1, bboxes_2):
+    """
+    IoU of every pair of bboxes.
+
+    Args:
+        bboxes_1 (array-like): (n, 4) bboxes [x1, y1, x2, y2]
+        bboxes_2 (array-like): (m, 4) bboxes [x1, y1, x2, y2]
+
+    Returns:
+        numpy.ndarray: (n, m) IoU matrix
+    """
+    bboxes_1 = np.asarray(bboxes_1, dtype=np.float64).reshape(-1, 4)
+    bboxes_2 = np.asarray(bboxes_2, dtype=np.float64).reshape(-1, 4)
+    intersection_w = (np.minimum(bboxes_1[:, None, 2], bboxes_2[None, :, 2]) -
+                      np.maximum(bboxes_1[:, None, 0], bboxes_2[None, :, 0]))
+    intersection_h = (np.minimum(bboxes_1[:, None, 3], bboxes_2[None, :, 3]) -
+                      np.maximum(bboxes_1[:, None, 1], bboxes_2[None, :, 1]))
+    intersection = np.clip(intersection_w, 0, None) * np.clip(intersection_h, 0, None)
+    area_1 = (bboxes_1[:, 2] - bboxes_1[:, 0]) * (bboxes_1[:, 3] - bboxes_1[:, 1])
+    area_2 = (bboxes_2[:, 2] - bboxes_2[:, 0]) * (bboxes_2[:, 3] - bboxes_2[:, 1])
+    union = area_1[:, None] + area_2[None, :] - intersection
+    return intersection / np.maximum(union, 1e-6)
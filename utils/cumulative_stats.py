@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class CumulativeStats():
+    """
+    Prefix counts of per-frame labels (team with ball control, team that passed...).
+
+    The counts are accumulated once for the whole video, after that the number of frames with
+    a given label up to any frame is a single array lookup instead of a new pass over the video:
+
+        stats = CumulativeStats([-1, 1, 1, 2, 1], labels=(1, 2))
+        stats.count(1, 3)       # 2, frames 0..3 that have the label 1
+        stats.total(3)          # 4
+    """
+
+    def __init__(self, values, labels=(1, 2)):
+        values = np.asarray(values).reshape(-1)
+        self.labels = tuple(labels)
+        self.num_frames = len(values)
+
+        # prefix_counts[k, i] = number of frames < i with the label labels[k]
+        self.prefix_counts = np.zeros((len(self.labels), self.num_frames + 1), dtype=np.int64)
+        for k, label in enumerate(self.labels):
+            np.cumsum(values == label, out=self.prefix_counts[k, 1:])
+
+    def get_end(self, frame_num):
+        # same bounds as values[:frame_num + 1]
+        return min(max(frame_num + 1, 0), self.num_frames)
+
+    def count(self, label, frame_num):
+        """
+        Number of frames from the first frame to frame_num (included) that have the label.
+        """
+        return int(self.prefix_counts[self.labels.index(label), self.get_end(frame_num)])
+
+    def counts(self, frame_num):
+        """
+        Returns:
+            tuple: the count of every label up to frame_num, in the order of labels
+        """
+        end = self.get_end(frame_num)
+        return tuple(int(count) for count in self.prefix_counts[:, end])
+
+    def total(self, frame_num):
+        return self.get_end(frame_num)
+
+    def __len__(self):
+        return self.num_frames
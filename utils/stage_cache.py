@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import pickle
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def hash_object(object):
+    return hashlib.sha256(pickle.dumps(object)).hexdigest()
+
+
+class StageCache():
+    """
+    Content-addressed cache for the results of the pipeline stages.
+
+    Unlike read_stub/save_stub, an entry is keyed by the hash of the input video, the hash of
+    the model weights and the stage parameters, so a result is never reused for another video
+    or another configuration. Entries are pickles stored under cache_dir, the least recently
+    used ones are removed when the cache grows bigger than max_size_bytes.
+    """
+
+    def __init__(self, cache_dir="cache", max_size_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.file_hashes_path = os.path.join(self.cache_dir, "file_hashes.json")
+        self.file_hashes = {}
+        if os.path.exists(self.file_hashes_path):
+            with open(self.file_hashes_path, "r") as f:
+                self.file_hashes = json.load(f)
+
+    def get_file_hash(self, file_path):
+        # hashing a full game takes a while, so the digest is remembered
+        # as long as the size and modification time of the file do not change
+        stat = os.stat(file_path)
+        file_id = f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        if file_id not in self.file_hashes:
+            self.file_hashes[file_id] = hash_file(file_path)
+            with open(self.file_hashes_path, "w") as f:
+                json.dump(self.file_hashes, f)
+        return self.file_hashes[file_id]
+
+    def make_key(self, stage_name, video_path, model_path=None, params=None):
+        """
+        Build the key of a stage result.
+
+        Args:
+            stage_name (str): name of the stage, e.g. "player_tracks"
+            video_path (str): path of the input video
+            model_path (str): path of the model weights used by the stage, if any
+            params (dict): every parameter that changes the result of the stage
+
+        Returns:
+            str: a hex digest used as the name of the cache entry
+        """
+        sha = hashlib.sha256()
+        sha.update(stage_name.encode())
+        sha.update(self.get_file_hash(video_path).encode())
+        if model_path is not None:
+            if os.path.exists(model_path):
+                sha.update(self.get_file_hash(model_path).encode())
+            else:
+                # hub model names (e.g. "patrickjohncyh/fashion-clip") are not local files
+                sha.update(str(model_path).encode())
+        sha.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        return f"{stage_name}-{sha.hexdigest()[:32]}"
+
+    def get_entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def get(self, key):
+        entry_path = self.get_entry_path(key)
+        if not os.path.exists(entry_path):
+            self.misses += 1
+            return None
+
+        with open(entry_path, "rb") as f:
+            object = pickle.load(f)
+
+        # the modification time is used as the "last used" time for the LRU eviction
+        os.utime(entry_path)
+        self.hits += 1
+        return object
+
+    def put(self, key, object):
+        entry_path = self.get_entry_path(key)
+        tmp_path = entry_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(object, f)
+        os.replace(tmp_path, entry_path)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".pkl"):
+                continue
+            entry_path = os.path.join(self.cache_dir, file_name)
+            stat = os.stat(entry_path)
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total_size = sum(size for _, size, _ in entries)
+        # remove the least recently used entries first, but always keep the newest one
+        for _, size, entry_path in sorted(entries)[:-1]:
+            if total_size <= self.max_size_bytes:
+                break
+            os.remove(entry_path)
+            total_size -= size
+
+    def __repr__(self):
+        return f"StageCache({self.cache_dir}): {self.hits} hits, {self.misses} misses"
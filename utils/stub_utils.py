@@ -4,6 +4,9 @@ import pickle
 
 
 def save_stub(stub_path, object):
+    if stub_path is None:
+        return
+
     if not os.path.exists(os.path.dirname(stub_path)):
         os.mkdir(os.path.dirname(stub_path))
 
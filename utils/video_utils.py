@@ -1,5 +1,8 @@
 import cv2
 import os
+import queue
+import threading
+import time
 
 
 def read_video(video_path):
@@ -13,13 +16,228 @@ def read_video(video_path):
     return frames
 
 
+def read_video_frame_count(video_path):
+    cap = cv2.VideoCapture(video_path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return frame_count
+
+
+def read_video_fps(video_path):
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return fps if fps > 0 else None
+
+
+def read_video_stream(video_path):
+    """
+    Yield the frames of a video one by one instead of loading all of them in memory.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+
+def iterate_batches(frames, batch_size):
+    """
+    Group any iterable of frames (list or generator) into lists of at most batch_size frames.
+    """
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def save_video(output_video_frames, output_video_path):
+    # output_video_frames can be a list or a generator, so the frames are written as they come
+    output_video_frames = iter(output_video_frames)
+    first_frame = next(output_video_frames, None)
+    if first_frame is None:
+        return
+
     if not os.path.exists(os.path.dirname(output_video_path)):
         os.mkdir(os.path.dirname(output_video_path))
 
     fourcc = cv2.VideoWriter.fourcc(*"XVID")
     out = cv2.VideoWriter(output_video_path, fourcc, 24.0,
-                          (output_video_frames[0].shape[1], output_video_frames[0].shape[0]))
+                          (first_frame.shape[1], first_frame.shape[0]))
+    out.write(first_frame)
     for frame in output_video_frames:
         out.write(frame)
     out.release()
+
+
+class ThroughputCounter():
+    """
+    Count the frames going through one side of the pipeline (decode or encode).
+
+    busy_time is the time spent inside OpenCV, wait_time is the time the thread spent blocked
+    on its queue. A side that mostly waits is not the bottleneck.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy_time = 0.0
+        self.wait_time = 0.0
+
+    @property
+    def fps(self):
+        if self.busy_time == 0:
+            return 0.0
+        return self.frames / self.busy_time
+
+    def __repr__(self):
+        return (f"{self.name}: {self.frames} frames, {self.fps:.1f} fps, "
+                f"busy {self.busy_time:.2f}s, waiting {self.wait_time:.2f}s")
+
+
+class ThreadedVideoReader():
+    """
+    Decode a video in a background thread and prefetch the frames into a bounded queue.
+
+    OpenCV releases the GIL while decoding, so decoding overlaps with the model inference
+    running on the main thread. Iterate over the reader to get the frames.
+
+    start_frame / end_frame (excluded) read only a part of the video, the reader seeks to
+    start_frame with CAP_PROP_POS_FRAMES.
+    """
+
+    def __init__(self, video_path, queue_size=64, start_frame=0, end_frame=None):
+        self.video_path = video_path
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = ThroughputCounter("decode")
+        self.stop_event = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._read_frames, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        # keep checking the stop event so the thread can exit if the consumer stops early
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_frames(self):
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            if self.start_frame > 0:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            frame_num = self.start_frame
+            while not self.stop_event.is_set():
+                if self.end_frame is not None and frame_num >= self.end_frame:
+                    break
+                frame_num += 1
+                start = time.perf_counter()
+                ret, frame = cap.read()
+                self.stats.busy_time += time.perf_counter() - start
+                if not ret:
+                    break
+                self.stats.frames += 1
+
+                start = time.perf_counter()
+                if not self._put(frame):
+                    break
+                self.stats.wait_time += time.perf_counter() - start
+        except Exception as e:
+            self.error = e
+        finally:
+            cap.release()
+            self._put(None)
+
+    def __iter__(self):
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            self.close()
+
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+
+
+class ThreadedVideoWriter():
+    """
+    Encode frames in a background thread. write() only pushes the frame into a bounded queue,
+    the video file is opened on the first frame and released by close().
+    """
+
+    def __init__(self, output_video_path, fps=24.0, queue_size=64):
+        self.output_video_path = output_video_path
+        self.fps = fps
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = ThroughputCounter("encode")
+        self.error = None
+        self.thread = threading.Thread(target=self._write_frames, daemon=True)
+        self.thread.start()
+
+    def _write_frames(self):
+        out = None
+        try:
+            while True:
+                start = time.perf_counter()
+                frame = self.queue.get()
+                self.stats.wait_time += time.perf_counter() - start
+                if frame is None:
+                    break
+
+                if out is None:
+                    if not os.path.exists(os.path.dirname(self.output_video_path)):
+                        os.mkdir(os.path.dirname(self.output_video_path))
+                    fourcc = cv2.VideoWriter.fourcc(*"XVID")
+                    out = cv2.VideoWriter(self.output_video_path, fourcc, self.fps,
+                                          (frame.shape[1], frame.shape[0]))
+
+                start = time.perf_counter()
+                out.write(frame)
+                self.stats.busy_time += time.perf_counter() - start
+                self.stats.frames += 1
+        except Exception as e:
+            self.error = e
+            # drain the queue so write() never blocks after a failure
+            while self.queue.get() is not None:
+                pass
+        finally:
+            if out is not None:
+                out.release()
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(frame)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()